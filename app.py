@@ -2,10 +2,9 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import requests
 import json
-import sqlite3
 import hashlib
 import numpy as np
 import warnings
@@ -22,6 +21,17 @@ import seaborn as sns
 from bs4 import BeautifulSoup
 import uuid
 
+from compressed_storage import open_dataset, stored_path
+from data_catalog import CSV_CATALOG, count_csv_rows, dataset_version, unique_catalog_files
+from figure_cache import FigureCache, get_figure_cache
+from export_cache import get_export_cache
+from dataset_cache import dataset_states, get_dataset_cache, load_csv_cached, load_csv_filtered
+from date_utils import format_date_range
+from sql_engine import get_sql_engine
+from write_behind import get_write_queue
+from connection_pool import get_connection_pool
+from schema_migrations import apply_migrations
+
 # Importar sistema de segurança e IA
 try:
     from security_ai import (
@@ -76,68 +86,79 @@ class Config:
     def validate_config():
         return True
 
+def utc_timestamp():
+    """Horário UTC no mesmo formato do DEFAULT CURRENT_TIMESTAMP do SQLite"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+# Esquema do saudeja_interactions.db: acrescentar novas versões no fim, nunca editar as já aplicadas
+INTERACTIONS_MIGRATIONS = [
+    (1, "tabelas iniciais", [
+        # Tabela principal de interações (anonimizada conforme LGPD)
+        '''
+        CREATE TABLE IF NOT EXISTS user_interactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            user_query TEXT NOT NULL,
+            interaction_type TEXT NOT NULL,
+            response_data TEXT,
+            user_choices TEXT,
+            journey_step TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            anonymized_hash TEXT
+        )
+        ''',
+        # Tabela para análises de IA
+        '''
+        CREATE TABLE IF NOT EXISTS ai_insights (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            insight_type TEXT NOT NULL,
+            data_cluster INTEGER,
+            insight_data TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # Tabela para dados de webcrawling
+        '''
+        CREATE TABLE IF NOT EXISTS crawled_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source_url TEXT NOT NULL,
+            content_type TEXT NOT NULL,
+            extracted_data TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        '''
+    ]),
+    (2, "índices de histórico por sessão e por tipo", [
+        # get_user_history: WHERE session_id = ? ORDER BY timestamp DESC vira busca por faixa, sem ordenação
+        'CREATE INDEX IF NOT EXISTS idx_interactions_session_time ON user_interactions (session_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_interactions_type_time ON user_interactions (interaction_type, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_insights_session_time ON ai_insights (session_id, timestamp)',
+        'ANALYZE'
+    ])
+]
+
 # Gerenciador de banco de dados robusto conforme requisitos
 class DatabaseManager:
     def __init__(self):
         # Usar SQLite local com fallback robusto
         self.db_path = os.path.join(os.getcwd(), 'saudeja_interactions.db')
+        self.pool = get_connection_pool(self.db_path)
         self.setup_tables()
+        # Gravações de interação saem do caminho do clique (commit em lote numa thread própria)
+        self.write_queue = get_write_queue(self.db_path)
     
     def get_connection(self):
-        """Cria conexão thread-safe"""
-        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10)
-        conn.execute('PRAGMA journal_mode=WAL')  # Better concurrency
-        return conn
+        """Empresta uma conexão do pool: usar em bloco with (ela volta ao pool ao sair)"""
+        return self.pool.connection()
     
     def setup_tables(self):
-        """Configura tabelas conforme LGPD e requisitos"""
-        conn = self.get_connection()
+        """Configura tabelas conforme LGPD e requisitos (migrações versionadas por PRAGMA user_version)"""
         try:
-            cursor = conn.cursor()
-
-            # Tabela principal de interações (anonimizada conforme LGPD)
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_interactions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id TEXT NOT NULL,
-                    user_query TEXT NOT NULL,
-                    interaction_type TEXT NOT NULL,
-                    response_data TEXT,
-                    user_choices TEXT,
-                    journey_step TEXT,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    anonymized_hash TEXT
-                )
-            ''')
-
-            # Tabela para análises de IA
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS ai_insights (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id TEXT NOT NULL,
-                    insight_type TEXT NOT NULL,
-                    data_cluster INTEGER,
-                    insight_data TEXT,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-
-            # Tabela para dados de webcrawling
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS crawled_data (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    source_url TEXT NOT NULL,
-                    content_type TEXT NOT NULL,
-                    extracted_data TEXT,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-
-            conn.commit()
+            with self.get_connection() as conn:
+                apply_migrations(conn, INTERACTIONS_MIGRATIONS, name='saudeja_interactions.db')
         except Exception as e:
             st.error(f"Erro ao configurar banco de dados: {e}")
-        finally:
-            conn.close()
 
     def get_session_id(self):
         """Gera ID de sessão único"""
@@ -150,29 +171,27 @@ class DatabaseManager:
         return hashlib.sha256(str(data).encode()).hexdigest()[:16]
 
     def log_interaction(self, user_query, interaction_type, response_data, user_choices=None, journey_step=None):
-        """Registra interação com anonimização LGPD"""
+        """Registra interação com anonimização LGPD (enfileirada; o commit é feito em lote)"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-
-            anonymized_hash = self.anonymize_data(f"{user_query}{self.get_session_id()}")
+            # Sessão e horário capturados aqui: a thread escritora não tem contexto do Streamlit
+            session_id = self.get_session_id()
+            anonymized_hash = self.anonymize_data(f"{user_query}{session_id}")
 
-            cursor.execute('''
+            self.write_queue.enqueue('''
                 INSERT INTO user_interactions 
-                (session_id, user_query, interaction_type, response_data, user_choices, journey_step, anonymized_hash)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
+                (session_id, user_query, interaction_type, response_data, user_choices, journey_step,
+                 anonymized_hash, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
-                self.get_session_id(),
+                session_id,
                 str(user_query)[:500],  # Limitar tamanho
                 str(interaction_type),
                 json.dumps(response_data) if response_data else None,
                 json.dumps(user_choices) if user_choices else None,
                 journey_step,
-                anonymized_hash
+                anonymized_hash,
+                utc_timestamp()
             ))
-
-            conn.commit()
-            conn.close()
             return True
         except Exception as e:
             # Não mostrar warnings que podem causar re-render
@@ -181,15 +200,16 @@ class DatabaseManager:
     def get_user_history(self, limit=50):
         """Recupera histórico da sessão atual"""
         try:
-            conn = self.get_connection()
-            df = pd.read_sql_query('''
-                SELECT user_query, interaction_type, user_choices, journey_step, timestamp
-                FROM user_interactions 
-                WHERE session_id = ?
-                ORDER BY timestamp DESC 
-                LIMIT ?
-            ''', conn, params=(self.get_session_id(), limit))
-            conn.close()
+            # Interações ainda na fila precisam aparecer no histórico
+            self.write_queue.flush()
+            with self.get_connection() as conn:
+                df = pd.read_sql_query('''
+                    SELECT user_query, interaction_type, user_choices, journey_step, timestamp
+                    FROM user_interactions 
+                    WHERE session_id = ?
+                    ORDER BY timestamp DESC 
+                    LIMIT ?
+                ''', conn, params=(self.get_session_id(), limit))
             return df
         except Exception as e:
             return pd.DataFrame()
@@ -197,14 +217,10 @@ class DatabaseManager:
     def save_ai_insight(self, insight_type, data_cluster, insight_data):
         """Salva insights de IA"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO ai_insights (session_id, insight_type, data_cluster, insight_data)
-                VALUES (?, ?, ?, ?)
-            ''', (self.get_session_id(), insight_type, data_cluster, json.dumps(insight_data)))
-            conn.commit()
-            conn.close()
+            self.write_queue.enqueue('''
+                INSERT INTO ai_insights (session_id, insight_type, data_cluster, insight_data, timestamp)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (self.get_session_id(), insight_type, data_cluster, json.dumps(insight_data), utc_timestamp()))
         except Exception as e:
             pass  # Silenciar erros para evitar re-render
 
@@ -346,96 +362,72 @@ class CompleteDataManager:
         self.available_datasets = self.discover_all_csvs()
 
     def discover_all_csvs(self):
-        """Descobre todos os arquivos CSV disponíveis no projeto"""
+        """Descobre os arquivos CSV do projeto (um item por conteúdo distinto, com aliases)"""
         csv_files = {}
-        base_path = os.getcwd()
-
-        # Mapeamento de arquivos CSV e suas descrições
-        csv_mapping = {
-            # COVID Principal
-            'us-states.csv': {'name': 'COVID-19 por Estados', 'category': 'covid_main'},
-            'us-counties.csv': {'name': 'COVID-19 por Condados', 'category': 'covid_main'},
-            'us.csv': {'name': 'COVID-19 Nacional (EUA)', 'category': 'covid_main'},
-
-            # COVID por Anos
-            'us-counties-2020.csv': {'name': 'COVID Condados 2020', 'category': 'covid_yearly'},
-            'us-counties-2021.csv': {'name': 'COVID Condados 2021', 'category': 'covid_yearly'},
-            'us-counties-2022.csv': {'name': 'COVID Condados 2022', 'category': 'covid_yearly'},
-            'us-counties-2023.csv': {'name': 'COVID Condados 2023', 'category': 'covid_yearly'},
-            'us-counties-recent.csv': {'name': 'COVID Condados Recente', 'category': 'covid_yearly'},
-
-            # Dados especializados
-            'colleges/colleges.csv': {'name': 'Dados de Faculdades', 'category': 'specialized'},
-            'excess-deaths/deaths.csv': {'name': 'Mortes Excessivas', 'category': 'specialized'},
-            'mask-use/mask-use-by-county.csv': {'name': 'Uso de Máscaras por Condado', 'category': 'specialized'},
-            'prisons/facilities.csv': {'name': 'Facilidades Prisionais', 'category': 'specialized'},
-            'prisons/systems.csv': {'name': 'Sistemas Prisionais', 'category': 'specialized'},
-
-            # Dados em subpastas
-            'data/us-states.csv': {'name': 'COVID Estados (Data)', 'category': 'data_folder'},
-            'data/us-counties.csv': {'name': 'COVID Condados (Data)', 'category': 'data_folder'},
-            'data/us.csv': {'name': 'COVID Nacional (Data)', 'category': 'data_folder'},
-
-            # Live data
-            'live/us-states.csv': {'name': 'COVID Estados (Live)', 'category': 'live_data'},
-            'live/us-counties.csv': {'name': 'COVID Condados (Live)', 'category': 'live_data'},
-            'live/us.csv': {'name': 'COVID Nacional (Live)', 'category': 'live_data'},
-
-            # Rolling averages
-            'rolling-averages/us-states.csv': {'name': 'Médias Móveis Estados', 'category': 'rolling'},
-            'rolling-averages/us-counties.csv': {'name': 'Médias Móveis Condados', 'category': 'rolling'},
-            'rolling-averages/anomalies.csv': {'name': 'Anomalias Detectadas', 'category': 'rolling'}
-        }
 
-        # Verificar quais arquivos existem
-        for file_path, info in csv_mapping.items():
-            full_path = os.path.join(base_path, file_path)
-            if os.path.exists(full_path):
-                try:
-                    # Tentar carregar uma amostra para verificar se é válido
-                    sample = pd.read_csv(full_path, nrows=1)
-                    csv_files[file_path] = {
-                        'name': info['name'],
-                        'category': info['category'],
-                        'path': full_path,
-                        'columns': list(sample.columns),
-                        'exists': True
-                    }
-                except Exception as e:
-                    csv_files[file_path] = {
-                        'name': info['name'],
-                        'category': info['category'],
-                        'path': full_path,
-                        'exists': False,
-                        'error': str(e)
-                    }
+        # Arquivos idênticos em caminhos diferentes viram um único dataset
+        for file_path, entry in unique_catalog_files(os.getcwd()).items():
+            info = CSV_CATALOG[file_path]
+            full_path = entry['full_path']
+            try:
+                # Tentar carregar uma amostra para verificar se é válido
+                with open_dataset(full_path) as stream:
+                    sample = pd.read_csv(stream, nrows=1)
+                csv_files[file_path] = {
+                    'name': info['name'],
+                    'category': info['category'],
+                    'path': full_path,
+                    'columns': list(sample.columns),
+                    'size_bytes': os.path.getsize(stored_path(full_path)),
+                    'version': dataset_version(full_path),
+                    'aliases': entry['aliases'],
+                    'exists': True
+                }
+            except Exception as e:
+                csv_files[file_path] = {
+                    'name': info['name'],
+                    'category': info['category'],
+                    'path': full_path,
+                    'aliases': entry['aliases'],
+                    'exists': False,
+                    'error': str(e)
+                }
 
         return csv_files
 
-    @st.cache_data
-    def load_csv_data(_self, file_path):
-        """Carrega dados de um CSV específico com cache"""
-        if file_path not in _self.available_datasets:
+    def load_csv_data(self, file_path):
+        """Carrega dados de um CSV específico pelo cache global de datasets"""
+        if file_path not in self.available_datasets:
             return pd.DataFrame()
 
-        if not _self.available_datasets[file_path]['exists']:
+        if not self.available_datasets[file_path]['exists']:
             return pd.DataFrame()
 
         try:
-            full_path = _self.available_datasets[file_path]['path']
-            data = pd.read_csv(full_path)
-
-            # Padronizar nomes de colunas se necessário
-            if 'date' in data.columns:
-                data['date'] = pd.to_datetime(data['date'], errors='coerce')
-
-            return data
+            # Datas já chegam como datetime64 + deslocamento inteiro em dias
+            return load_csv_cached(self.available_datasets[file_path]['path'])
         except Exception as e:
             st.warning(f"Erro ao carregar {file_path}: {e}")
             return pd.DataFrame()
 
+    @st.cache_data(max_entries=64)
+    def load_preview(_self, file_path, version, nrows=5):
+        """Lê apenas as primeiras linhas de um CSV (a versão invalida o cache)"""
+        try:
+            full_path = _self.available_datasets[file_path]['path']
+            with open_dataset(full_path) as stream:
+                return pd.read_csv(stream, nrows=nrows)
+        except Exception as e:
+            st.warning(f"Erro ao carregar preview de {file_path}: {e}")
+            return pd.DataFrame()
+
+    @st.cache_data(max_entries=256)
+    def count_rows(_self, file_path, version):
+        """Número de registros de um CSV, calculado uma vez por versão"""
+        return count_csv_rows(_self.available_datasets[file_path]['path'])
+
     def get_datasets_by_category(self):
-        """Organiza datasets por categoria"""
+        """Organiza datasets por categoria (apenas metadados do catálogo)"""
         categories = {}
         for file_path, info in self.available_datasets.items():
             if info['exists']:
@@ -445,12 +437,15 @@ class CompleteDataManager:
                 categories[category].append({
                     'file': file_path,
                     'name': info['name'],
-                    'data': self.load_csv_data(file_path)
+                    'columns': info['columns'],
+                    'size_bytes': info['size_bytes'],
+                    'version': info['version'],
+                    'aliases': info['aliases']
                 })
         return categories
 
     def get_summary_stats(self):
-        """Gera estatísticas resumidas de todos os datasets"""
+        """Gera estatísticas resumidas de todos os datasets a partir dos metadados"""
         total_files = 0
         total_rows = 0
         total_columns = 0
@@ -458,11 +453,11 @@ class CompleteDataManager:
 
         for file_path, info in self.available_datasets.items():
             if info['exists']:
-                data = self.load_csv_data(file_path)
-                if not data.empty:
+                rows = self.count_rows(file_path, info['version'])
+                if rows > 0:
                     total_files += 1
-                    total_rows += len(data)
-                    total_columns += len(data.columns)
+                    total_rows += rows
+                    total_columns += len(info['columns'])
 
                     category = info['category']
                     categories_count[category] = categories_count.get(category, 0) + 1
@@ -502,6 +497,7 @@ class InteractiveJourney:
             ("🏠 Página Inicial", "home"),
             ("📊 Todos os Dados CSV", "all_data"),
             ("📈 Análise COVID Estados", "covid_analysis"),
+            ("🧮 Consultas SQL", "sql_query"),
             ("🔬 Pesquisa Científica", "research"),
             ("📰 Notícias de Saúde", "news"),
             ("🤖 Insights de IA", "ai_insights"),
@@ -581,7 +577,8 @@ class InteractiveJourney:
 
         # Carregar dados COVID existentes
         try:
-            covid_data = pd.read_csv('us-states.csv')
+            # Só a lista de estados (índice dos blocos); as linhas são lidas ao analisar
+            states = dataset_states('us-states.csv')
 
             col1, col2 = st.columns(2)
 
@@ -589,8 +586,8 @@ class InteractiveJourney:
                 # Filtros interativos
                 selected_states = st.multiselect(
                     "Selecione estados para análise:",
-                    covid_data['state'].unique()[:10],
-                    default=covid_data['state'].unique()[:3]
+                    states[:10],
+                    default=states[:3]
                 )
 
                 analysis_type = st.radio(
@@ -607,8 +604,7 @@ class InteractiveJourney:
                 )
 
             if selected_states and st.button("🔍 Analisar Dados"):
-                # Filtrar dados
-                filtered_data = covid_data[covid_data['state'].isin(selected_states)]
+                start, end = date_range if len(date_range) == 2 else (None, None)
 
                 # Log da análise
                 self.db.log_interaction(
@@ -622,37 +618,50 @@ class InteractiveJourney:
                     journey_step="data_analysis"
                 )
 
-                # Visualizações baseadas na escolha
-                if analysis_type == "Casos":
-                    fig = px.bar(
-                        filtered_data.tail(50),
-                        x='state',
-                        y='cases',
-                        title=f"Casos COVID-19 - {', '.join(selected_states)}"
-                    )
-                elif analysis_type == "Óbitos":
-                    fig = px.bar(
-                        filtered_data.tail(50),
-                        x='state',
-                        y='deaths',
-                        title=f"Óbitos COVID-19 - {', '.join(selected_states)}"
-                    )
-                else:  # Tendência Temporal
-                    filtered_data['date'] = pd.to_datetime(filtered_data['date'])
-                    fig = px.line(
-                        filtered_data,
-                        x='date',
-                        y='cases',
-                        color='state',
-                        title="Tendência Temporal de Casos"
-                    )
+                # Visualizações baseadas na escolha; o filtro só roda quando a figura não está em cache
+                def build_figure():
+                    # Com o CSV em blocos, só os blocos do período são lidos
+                    filtered_data = load_csv_filtered('us-states.csv', start, end, selected_states)
+                    if analysis_type == "Casos":
+                        fig = px.bar(
+                            filtered_data.tail(50),
+                            x='state',
+                            y='cases',
+                            title=f"Casos COVID-19 - {', '.join(selected_states)}"
+                        )
+                    elif analysis_type == "Óbitos":
+                        fig = px.bar(
+                            filtered_data.tail(50),
+                            x='state',
+                            y='deaths',
+                            title=f"Óbitos COVID-19 - {', '.join(selected_states)}"
+                        )
+                    else:  # Tendência Temporal
+                        fig = px.line(
+                            filtered_data,
+                            x='date',
+                            y='cases',
+                            color='state',
+                            title="Tendência Temporal de Casos"
+                        )
+                    # Totais dos insights guardados junto com a figura em cache
+                    fig.update_layout(meta={
+                        'total_cases': int(filtered_data['cases'].sum()),
+                        'avg_cases': float(filtered_data['cases'].mean()) if len(filtered_data) else 0.0
+                    })
+                    return fig
 
+                # Figuras iguais são reaproveitadas entre sessões
+                cache_key = FigureCache.make_key(
+                    dataset_version('us-states.csv'), selected_states, date_range, analysis_type
+                )
+                fig = get_figure_cache().get_or_build(cache_key, build_figure)
                 st.plotly_chart(fig, use_container_width=True)
 
                 # Insights automáticos
                 st.subheader("🤖 Insights Automáticos")
-                total_cases = filtered_data['cases'].sum()
-                avg_cases = filtered_data['cases'].mean()
+                total_cases = fig['layout']['meta']['total_cases']
+                avg_cases = fig['layout']['meta']['avg_cases']
 
                 col1, col2, col3 = st.columns(3)
                 with col1:
@@ -1293,6 +1302,18 @@ class InteractiveJourney:
                     except:
                         pass
 
+        with st.expander("⚙️ Conexões do Banco"):
+            pool_stats = self.db.pool.get_stats()
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Conexões abertas", pool_stats['open'])
+            with col2:
+                st.metric("Conexões criadas", pool_stats['opened'])
+            with col3:
+                st.metric("Usos", pool_stats['checkouts'])
+            with col4:
+                st.metric("Reuso", f"{pool_stats['reuse_ratio']:.0%}")
+
         # Export do histórico
         if st.button("💾 Exportar Histórico"):
             csv_data = filtered_df.to_csv(index=False)
@@ -1334,6 +1355,18 @@ class InteractiveJourney:
         with col4:
             st.metric("Categorias", len(stats['categories']))
 
+        with st.expander("⚙️ Uso do Cache de Datasets"):
+            cache_stats = get_dataset_cache().get_stats()
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Memória (MB)", f"{cache_stats['bytes'] / 1024 / 1024:,.1f} / {cache_stats['max_bytes'] / 1024 / 1024:,.0f}")
+            with col2:
+                st.metric("Hits", cache_stats['hits'])
+            with col3:
+                st.metric("Misses", cache_stats['misses'])
+            with col4:
+                st.metric("Evictions", cache_stats['evictions'])
+
         # Datasets por categoria
         st.subheader("📁 Datasets Organizados por Categoria")
 
@@ -1357,92 +1390,121 @@ class InteractiveJourney:
                     st.write(f"**Categoria:** {category_names.get(category, category)}")
 
                     for dataset in datasets:
-                        data = dataset['data']
-                        if not data.empty:
-                            with st.expander(f"📄 {dataset['name']} ({len(data):,} registros)"):
-                                col1, col2 = st.columns([2, 1])
-
-                                with col1:
+                        columns = dataset['columns']
+                        size_mb = dataset['size_bytes'] / 1024 / 1024
+                        with st.expander(f"📄 {dataset['name']} ({size_mb:,.1f} MB)"):
+                            col1, col2 = st.columns([2, 1])
+
+                            with col1:
+                                # Preview só é lido quando solicitado, e apenas as primeiras linhas
+                                if st.checkbox("👀 Carregar preview", key=f"preview_{dataset['file']}"):
                                     st.write("**Preview dos dados:**")
-                                    st.dataframe(data.head(5), use_container_width=True)
-
-                                with col2:
-                                    st.write("**Informações:**")
-                                    st.write(f"• Linhas: {len(data):,}")
-                                    st.write(f"• Colunas: {len(data.columns)}")
-                                    st.write(f"• Arquivo: `{dataset['file']}`")
-
-                                    st.write("**Colunas disponíveis:**")
-                                    for col in data.columns[:10]:  # Mostrar até 10 colunas
-                                        st.write(f"  - {col}")
-                                    if len(data.columns) > 10:
-                                        st.write(f"  ... e mais {len(data.columns) - 10}")
-
-                                # Análise rápida se for possível
-                                if len(data) > 0:
-                                    st.write("**Análise Rápida:**")
-
-                                    # Para dados COVID, mostrar gráfico
-                                    if 'cases' in data.columns and 'state' in data.columns:
-                                        if st.button(f"📊 Visualizar {dataset['name']}", key=f"viz_{dataset['file']}"):
-                                            # Agrupar por estado e somar casos
-                                            state_data = data.groupby('state')['cases'].sum().nlargest(10)
-
-                                            fig = px.bar(
-                                                x=state_data.values,
-                                                y=state_data.index,
-                                                orientation='h',
-                                                title=f"Top 10 Estados - {dataset['name']}"
-                                            )
-                                            fig.update_layout(height=400)
-                                            st.plotly_chart(fig, use_container_width=True)
-
-                                            # Log da visualização
-                                            self.db.log_interaction(
-                                                user_query=f"Visualizar dataset: {dataset['name']}",
-                                                interaction_type="dataset_visualization",
-                                                response_data={
-                                                    "dataset": dataset['file'],
-                                                    "chart_type": "bar_chart"
-                                                },
-                                                journey_step="data_visualization"
-                                            )
-
-                                    # Para outros tipos de dados
-                                    elif 'date' in data.columns:
-                                        if st.button(f"📈 Análise Temporal {dataset['name']}", key=f"temp_{dataset['file']}"):
-                                            # Análise temporal simples
-                                            data_temp = data.copy()
-                                            data_temp['date'] = pd.to_datetime(data_temp['date'], errors='coerce')
-
-                                            if not data_temp['date'].isna().all():
-                                                # Contar registros por mês
-                                                monthly_data = data_temp.groupby(data_temp['date'].dt.to_period('M')).size()
-
-                                                fig = px.line(
-                                                    x=monthly_data.index.astype(str),
-                                                    y=monthly_data.values,
-                                                    title=f"Registros por Mês - {dataset['name']}"
-                                                )
-                                                st.plotly_chart(fig, use_container_width=True)
-
-                                # Botão para download dos dados
-                                csv_data = data.to_csv(index=False)
-                                st.download_button(
-                                    label=f"⬇️ Download {dataset['name']}",
-                                    data=csv_data,
-                                    file_name=f"{dataset['file'].replace('/', '_')}",
-                                    mime="text/csv",
-                                    key=f"download_{dataset['file']}"
-                                )
+                                    preview = data_manager.load_preview(dataset['file'], dataset['version'])
+                                    st.dataframe(preview, use_container_width=True)
+
+                            with col2:
+                                st.write("**Informações:**")
+                                st.write(f"• Tamanho: {size_mb:,.2f} MB")
+                                st.write(f"• Colunas: {len(columns)}")
+                                st.write(f"• Arquivo: `{dataset['file']}`")
+                                if dataset['aliases']:
+                                    aliases = ', '.join(f"`{alias}`" for alias in dataset['aliases'])
+                                    st.write(f"• Conteúdo idêntico em: {aliases}")
+
+                                st.write("**Colunas disponíveis:**")
+                                for col in columns[:10]:  # Mostrar até 10 colunas
+                                    st.write(f"  - {col}")
+                                if len(columns) > 10:
+                                    st.write(f"  ... e mais {len(columns) - 10}")
+
+                            # Análise rápida se for possível
+                            st.write("**Análise Rápida:**")
+
+                            # Para dados COVID, mostrar gráfico
+                            if 'cases' in columns and 'state' in columns:
+                                if st.button(f"📊 Visualizar {dataset['name']}", key=f"viz_{dataset['file']}"):
+                                    def build_top_states(file_path=dataset['file'], name=dataset['name']):
+                                        # Agrupar por estado e somar casos
+                                        data = data_manager.load_csv_data(file_path)
+                                        state_data = data.groupby('state')['cases'].sum().nlargest(10)
+
+                                        fig = px.bar(
+                                            x=state_data.values,
+                                            y=state_data.index,
+                                            orientation='h',
+                                            title=f"Top 10 Estados - {name}"
+                                        )
+                                        fig.update_layout(height=400)
+                                        return fig
+
+                                    cache_key = FigureCache.make_key(
+                                        dataset['version'], dataset['file'], chart_type='top10_states'
+                                    )
+                                    fig = get_figure_cache().get_or_build(cache_key, build_top_states)
+                                    st.plotly_chart(fig, use_container_width=True)
+
+                                    # Log da visualização
+                                    self.db.log_interaction(
+                                        user_query=f"Visualizar dataset: {dataset['name']}",
+                                        interaction_type="dataset_visualization",
+                                        response_data={
+                                            "dataset": dataset['file'],
+                                            "chart_type": "bar_chart"
+                                        },
+                                        journey_step="data_visualization"
+                                    )
+
+                            # Para outros tipos de dados
+                            elif 'date' in columns:
+                                if st.button(f"📈 Análise Temporal {dataset['name']}", key=f"temp_{dataset['file']}"):
+                                    def build_monthly(file_path=dataset['file'], name=dataset['name']):
+                                        # Análise temporal simples
+                                        data = data_manager.load_csv_data(file_path)
+                                        if data['date'].isna().all():
+                                            return None
+
+                                        # Contar registros por mês
+                                        monthly_data = data.groupby(data['date'].dt.to_period('M')).size()
+
+                                        return px.line(
+                                            x=monthly_data.index.astype(str),
+                                            y=monthly_data.values,
+                                            title=f"Registros por Mês - {name}"
+                                        )
+
+                                    cache_key = FigureCache.make_key(
+                                        dataset['version'], dataset['file'], chart_type='monthly_records'
+                                    )
+                                    fig = get_figure_cache().get_or_build(cache_key, build_monthly)
+                                    if fig is not None:
+                                        st.plotly_chart(fig, use_container_width=True)
+
+                            # Download gerado sob demanda, comprimido e reaproveitado por versão
+                            export_flag = f"export_ready_{dataset['file']}"
+                            if st.button(f"📦 Preparar download {dataset['name']}", key=f"prepare_{dataset['file']}"):
+                                st.session_state[export_flag] = True
+
+                            if st.session_state.get(export_flag):
+                                full_path = data_manager.available_datasets[dataset['file']]['path']
+                                with open(get_export_cache().get_export(full_path), 'rb') as export_file:
+                                    st.download_button(
+                                        label=f"⬇️ Download {dataset['name']} (.csv.gz)",
+                                        data=export_file,
+                                        file_name=f"{dataset['file'].replace('/', '_')}.gz",
+                                        mime="application/gzip",
+                                        key=f"download_{dataset['file']}"
+                                    )
 
         # Comparação entre datasets
         st.subheader("🔄 Comparação entre Datasets")
 
+        # A comparação carrega todos os datasets, então só roda quando solicitada
+        load_comparison = st.checkbox("Carregar comparação de todos os datasets", key="load_comparison")
+
         # Criar um DataFrame resumo
         summary_data = []
         for file_path, info in data_manager.available_datasets.items():
-            if info['exists']:
+            if load_comparison and info['exists']:
                 data = data_manager.load_csv_data(file_path)
                 if not data.empty:
                     summary_data.append({
@@ -1562,15 +1624,76 @@ class InteractiveJourney:
             else:
                 st.warning(f"❌ Nenhum resultado encontrado para '{search_term}'")
 
+    def sql_query_page(self):
+        """Consultas SQL somente leitura sobre os CSVs carregados no SQLite"""
+        st.title("🧮 Consultas SQL sobre os Dados CSV")
+
+        engine = get_sql_engine()
+
+        col1, col2 = st.columns([3, 1])
+
+        with col2:
+            st.info("""
+            **Modo somente leitura:**
+            - Apenas uma consulta SELECT por vez
+            - Tempo e número de linhas limitados
+            - Índices em (state, date), (fips, date) e geoid
+            """)
+
+            if st.button("🔄 Atualizar Base SQL"):
+                with st.spinner("Carregando CSVs no banco SQL..."):
+                    results = engine.ingest_catalog()
+                updated = [f for f, r in results.items() if r != 'atual']
+                st.success(f"✅ {len(updated)} arquivos recarregados, {len(results) - len(updated)} já atualizados")
+
+        tables = engine.list_tables()
+
+        with col1:
+            if not tables:
+                st.warning("⚠️ Nenhuma tabela carregada. Clique em **Atualizar Base SQL**.")
+                return
+
+            with st.expander("📁 Tabelas disponíveis"):
+                for table in tables:
+                    # Views de alias registradas antes da contagem da tabela canônica ficam sem row_count
+                    rows = f"{table['rows']:,}" if table['rows'] is not None else '?'
+                    st.write(f"**{table['table']}** ({rows} registros) - `{table['source_file']}`")
+                    st.caption(', '.join(table['columns']))
+
+            query = st.text_area(
+                "Consulta SQL:",
+                value="SELECT state, MAX(cases) AS cases\nFROM us_states\nWHERE date BETWEEN '2021-01-01' AND '2021-12-31'\nGROUP BY state\nORDER BY cases DESC",
+                height=150
+            )
+
+        if query and st.button("▶️ Executar Consulta"):
+            result = engine.run_readonly_query(query)
+
+            self.db.log_interaction(
+                user_query=f"Consulta SQL: {query}",
+                interaction_type="sql_query",
+                response_data={
+                    "rows": len(result['data']),
+                    "elapsed_ms": round(result['elapsed_ms'], 1),
+                    "error": result['error']
+                },
+                journey_step="sql_exploration"
+            )
+
+            if result['error']:
+                st.error(f"❌ {result['error']}")
+                return
+
+            st.success(f"✅ {len(result['data']):,} linhas em {result['elapsed_ms']:.1f} ms")
+            if result['truncated']:
+                st.warning(f"⚠️ Resultado limitado às primeiras {len(result['data']):,} linhas")
+            st.dataframe(result['data'], use_container_width=True)
+
     def _get_date_range(self, data):
         """Helper para obter range de datas de um dataset"""
         try:
-            if 'date' in data.columns:
-                dates = pd.to_datetime(data['date'], errors='coerce').dropna()
-                if not dates.empty:
-                    return f"{dates.min().strftime('%Y-%m-%d')} a {dates.max().strftime('%Y-%m-%d')}"
-            return "N/A"
-        except:
+            return format_date_range(data)
+        except Exception:
             return "N/A"
 
 # Inicialização global
@@ -1609,6 +1732,8 @@ def main():
             journey.history_page()
         elif current_page == "all_data":
             journey.all_data_page()
+        elif current_page == "sql_query":
+            journey.sql_query_page()
 
         # Footer com informações da sessão
         st.sidebar.markdown("---")
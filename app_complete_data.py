@@ -2,10 +2,10 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
 import requests
 import json
-import sqlite3
 import hashlib
 import numpy as np
 import warnings
@@ -18,6 +18,24 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from bs4 import BeautifulSoup
 import uuid
+
+from connection_pool import get_connection_pool
+from data_catalog import canonical_path, dataset_version
+from figure_cache import FigureCache, get_figure_cache
+from dataset_cache import load_csv_cached
+from dataset_diff import get_change_tracker
+from dataset_history import get_dataset_history
+from date_utils import day_range_mask
+from forecasting import get_forecast_engine
+from hotspots import detect_hotspots
+from snapshot import get_latest_snapshot
+from rollups import get_rollup_store
+from similarity import get_similarity_engine
+from clustering import STATE_ABBREVIATIONS, get_cluster_store
+from epi_metrics import get_derived_store
+from waves import get_wave_store
+from pyramid import LEVEL_NAMES, get_pyramid_store
+
 warnings.filterwarnings('ignore')
 
 # Configuração da página
@@ -39,69 +57,44 @@ class DataManager:
     def __init__(self):
         self.data_cache = {}
 
-    @st.cache_data
-    def load_covid_states(_self):
-        """Carrega dados COVID por estados"""
+    def _load_csv(self, file_path):
+        """Lê um CSV pelo cache global de datasets (limitado em memória)"""
         try:
-            return pd.read_csv('us-states.csv')
+            return load_csv_cached(file_path)
         except FileNotFoundError:
             return pd.DataFrame()
 
-    @st.cache_data
-    def load_covid_counties(_self):
+    def load_covid_states(self):
+        """Carrega dados COVID por estados"""
+        return self._load_csv('us-states.csv')
+
+    def load_covid_counties(self):
         """Carrega dados COVID por condados"""
-        try:
-            return pd.read_csv('us-counties.csv')
-        except FileNotFoundError:
-            return pd.DataFrame()
+        return self._load_csv('us-counties.csv')
 
-    @st.cache_data
-    def load_covid_national(_self):
+    def load_covid_national(self):
         """Carrega dados COVID nacionais"""
-        try:
-            return pd.read_csv('us.csv')
-        except FileNotFoundError:
-            return pd.DataFrame()
+        return self._load_csv('us.csv')
 
-    @st.cache_data
-    def load_covid_yearly(_self, year):
+    def load_covid_yearly(self, year):
         """Carrega dados COVID por ano específico"""
-        try:
-            return pd.read_csv(f'us-counties-{year}.csv')
-        except FileNotFoundError:
-            return pd.DataFrame()
+        return self._load_csv(f'us-counties-{year}.csv')
 
-    @st.cache_data
-    def load_colleges(_self):
+    def load_colleges(self):
         """Carrega dados de faculdades"""
-        try:
-            return pd.read_csv('colleges/colleges.csv')
-        except FileNotFoundError:
-            return pd.DataFrame()
+        return self._load_csv('colleges/colleges.csv')
 
-    @st.cache_data
-    def load_excess_deaths(_self):
+    def load_excess_deaths(self):
         """Carrega dados de mortes excessivas"""
-        try:
-            return pd.read_csv('excess-deaths/deaths.csv')
-        except FileNotFoundError:
-            return pd.DataFrame()
+        return self._load_csv('excess-deaths/deaths.csv')
 
-    @st.cache_data
-    def load_mask_use(_self):
+    def load_mask_use(self):
         """Carrega dados de uso de máscaras"""
-        try:
-            return pd.read_csv('mask-use/mask-use-by-county.csv')
-        except FileNotFoundError:
-            return pd.DataFrame()
+        return self._load_csv('mask-use/mask-use-by-county.csv')
 
-    @st.cache_data
-    def load_prisons(_self):
+    def load_prisons(self):
         """Carrega dados de prisões"""
-        try:
-            return pd.read_csv('prisons/facilities.csv')
-        except FileNotFoundError:
-            return pd.DataFrame()
+        return self._load_csv('prisons/facilities.csv')
 
     def get_available_datasets(self):
         """Retorna informações sobre datasets disponíveis"""
@@ -132,42 +125,40 @@ class DataManager:
 class SaudeJaExpandedApp:
     def __init__(self):
         self.db_path = os.path.join(os.getcwd(), 'saudeja_expanded.db')
+        self.pool = get_connection_pool(self.db_path)
         self.data_manager = DataManager()
         self.setup_database()
 
     def setup_database(self):
         """Configura banco de dados"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS interactions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id TEXT,
-                    action TEXT,
-                    dataset TEXT,
-                    data TEXT,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS interactions (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        session_id TEXT,
+                        action TEXT,
+                        dataset TEXT,
+                        data TEXT,
+                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
 
-            conn.commit()
-            conn.close()
+                conn.commit()
         except Exception:
             pass
 
     def log_action(self, action, dataset=None, data=None):
         """Log de ação com dataset"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO interactions (session_id, action, dataset, data) 
-                VALUES (?, ?, ?, ?)
-            ''', (st.session_state.session_id, action, dataset, json.dumps(data) if data else None))
-            conn.commit()
-            conn.close()
+            # Commit (ou rollback se o INSERT falhar) antes de a conexão voltar ao pool
+            with self.pool.connection() as conn, conn:
+                conn.execute('''
+                    INSERT INTO interactions (session_id, action, dataset, data) 
+                    VALUES (?, ?, ?, ?)
+                ''', (st.session_state.session_id, action, dataset, json.dumps(data) if data else None))
         except Exception:
             pass
 
@@ -316,13 +307,13 @@ class SaudeJaExpandedApp:
 
             analysis_type = st.radio(
                 "Tipo de análise:",
-                ["Casos", "Óbitos", "Tendência Temporal", "Comparação Estados"],
+                ["Casos", "Óbitos", "Tendência Temporal", "Comparação Estados", "Previsão 14 dias",
+                 "Rt e Duplicação", "Mapa de Clusters"],
                 key="analysis_type"
             )
 
         with col2:
             if 'date' in covid_data.columns:
-                covid_data['date'] = pd.to_datetime(covid_data['date'])
                 min_date = covid_data['date'].min()
                 max_date = covid_data['date'].max()
 
@@ -337,6 +328,22 @@ class SaudeJaExpandedApp:
             show_per_capita = st.checkbox("Mostrar per capita", key="per_capita")
             show_stats = st.checkbox("Mostrar estatísticas", key="show_stats")
 
+            # Versões registradas na ingestão: reproduzir os gráficos com os dados de uma data anterior
+            versions = get_dataset_history().versions(canonical_path('us-states.csv'))
+            # A última versão registrada só é a "atual" se o arquivo não mudou desde o registro
+            if versions and versions[-1]['source_version'] == dataset_version(canonical_path('us-states.csv')):
+                versions = versions[:-1]
+            as_of = None
+            if versions:
+                as_of = st.selectbox(
+                    "🕰️ Dados como publicados em:",
+                    [None] + [entry['recorded_at'] for entry in reversed(versions)],
+                    format_func=lambda value: "Versão atual" if value is None else value.replace('T', ' '),
+                    key="as_of"
+                )
+            if as_of is not None:
+                covid_data = load_csv_cached('us-states.csv', as_of=as_of)
+
         if selected_states and st.button("🔍 Analisar Estados", key="analyze_states_btn"):
             self.log_action("covid_states_analysis", "us-states", {
                 "states": selected_states,
@@ -347,50 +354,90 @@ class SaudeJaExpandedApp:
             filtered_data = covid_data[covid_data['state'].isin(selected_states)]
 
             if 'date' in filtered_data.columns and len(date_range) == 2:
-                filtered_data = filtered_data[
-                    (filtered_data['date'] >= pd.to_datetime(date_range[0])) &
-                    (filtered_data['date'] <= pd.to_datetime(date_range[1]))
-                ]
+                filtered_data = filtered_data[day_range_mask(filtered_data, date_range[0], date_range[1])]
 
             # Criar visualização
-            if analysis_type == "Casos":
-                fig = px.bar(
-                    filtered_data.groupby('state')['cases'].sum().reset_index(),
-                    x='state',
-                    y='cases',
-                    title=f"Total de Casos COVID-19 - {', '.join(selected_states)}"
-                )
-            elif analysis_type == "Óbitos":
-                fig = px.bar(
-                    filtered_data.groupby('state')['deaths'].sum().reset_index(),
-                    x='state',
-                    y='deaths',
-                    title=f"Total de Óbitos COVID-19 - {', '.join(selected_states)}"
-                )
-            elif analysis_type == "Tendência Temporal":
-                fig = px.line(
-                    filtered_data,
-                    x='date',
-                    y='cases',
-                    color='state',
-                    title="Tendência Temporal de Casos"
-                )
-            else:  # Comparação Estados
-                comparison_data = filtered_data.groupby('state').agg({
-                    'cases': 'sum',
-                    'deaths': 'sum'
-                }).reset_index()
-
-                fig = px.scatter(
-                    comparison_data,
-                    x='cases',
-                    y='deaths',
-                    text='state',
-                    title="Comparação: Casos vs Óbitos por Estado"
-                )
-                fig.update_traces(textposition="top center")
-
-            st.plotly_chart(fig, use_container_width=True)
+            def build_figure():
+                if analysis_type == "Casos":
+                    return px.bar(
+                        filtered_data.groupby('state')['cases'].sum().reset_index(),
+                        x='state',
+                        y='cases',
+                        title=f"Total de Casos COVID-19 - {', '.join(selected_states)}"
+                    )
+                elif analysis_type == "Óbitos":
+                    return px.bar(
+                        filtered_data.groupby('state')['deaths'].sum().reset_index(),
+                        x='state',
+                        y='deaths',
+                        title=f"Total de Óbitos COVID-19 - {', '.join(selected_states)}"
+                    )
+                elif analysis_type == "Tendência Temporal" and as_of is not None:
+                    # A pirâmide só existe para a versão atual; versões anteriores usam as linhas filtradas
+                    return px.line(
+                        filtered_data,
+                        x='date',
+                        y='cases',
+                        color='state',
+                        title=f"Tendência Temporal de Casos (dados de {as_of.replace('T', ' ')})"
+                    )
+                elif analysis_type == "Tendência Temporal":
+                    # Nível da pirâmide (diário/semanal/mensal) escolhido pelo intervalo
+                    start, end = (date_range if len(date_range) == 2 else (min_date, max_date))
+                    trend, level = get_pyramid_store().series(selected_states, start, end)
+                    return px.line(
+                        trend,
+                        x='date',
+                        y='value',
+                        color='key',
+                        title=f"Tendência Temporal de Casos (nível {LEVEL_NAMES.get(level, 'diário')})",
+                        labels={'value': 'cases', 'key': 'state'}
+                    )
+                elif analysis_type == "Previsão 14 dias":
+                    return self._forecast_figure(selected_states)
+                elif analysis_type == "Rt e Duplicação":
+                    return self._rt_figure(selected_states)
+                elif analysis_type == "Mapa de Clusters":
+                    return self._cluster_map_figure()
+                else:  # Comparação Estados
+                    comparison_data = filtered_data.groupby('state').agg({
+                        'cases': 'sum',
+                        'deaths': 'sum'
+                    }).reset_index()
+
+                    fig = px.scatter(
+                        comparison_data,
+                        x='cases',
+                        y='deaths',
+                        text='state',
+                        title="Comparação: Casos vs Óbitos por Estado"
+                    )
+                    fig.update_traces(textposition="top center")
+                    return fig
+
+            # O modelo de clusters é ajustado na ingestão; a página nunca ajusta
+            clusters_pending = analysis_type == "Mapa de Clusters" and get_cluster_store().get('state') is None
+            if clusters_pending:
+                get_cluster_store().fit_in_background('state')
+                st.info("⏳ Agrupamento das curvas em cálculo para a versão atual dos dados. "
+                        "Tente novamente em instantes.")
+            else:
+                # Figuras iguais são reaproveitadas entre sessões
+                if as_of is not None:
+                    figure_version = f"as_of:{as_of}"
+                elif analysis_type == "Mapa de Clusters":
+                    # O mapa usa todos os estados
+                    figure_version = dataset_version('us-states.csv')
+                else:
+                    # Os demais gráficos só dependem das linhas dos estados escolhidos
+                    figure_version = get_change_tracker().selection_version('us-states.csv', selected_states)
+                cache_key = FigureCache.make_key(figure_version, selected_states, date_range, analysis_type)
+                fig = get_figure_cache().get_or_build(cache_key, build_figure)
+
+                if as_of is not None and analysis_type in ("Previsão 14 dias", "Rt e Duplicação", "Mapa de Clusters"):
+                    st.caption("ℹ️ Este gráfico usa sempre a versão atual dos dados")
+
+                st.plotly_chart(fig, use_container_width=True)
 
             # Estatísticas
             if show_stats:
@@ -421,6 +468,141 @@ class SaudeJaExpandedApp:
                     mime="application/json"
                 )
 
+        # Hotspots: detector incremental, só processa os dias novos do dataset
+        if st.checkbox("🔥 Mostrar hotspots e pontos de mudança", key="show_hotspots"):
+            hotspots, change_points = detect_hotspots('state')
+
+            if hotspots.empty:
+                st.info("Nenhum estado acima do limiar no último dia disponível")
+            else:
+                st.subheader(f"🔥 Hotspots em {hotspots['date'].max().strftime('%Y-%m-%d')}")
+                st.dataframe(hotspots[['rank', 'label', 'zscore', 'avg_7d']], use_container_width=True)
+
+            if not change_points.empty and selected_states:
+                st.subheader("📍 Pontos de mudança recentes (estados selecionados)")
+                recent = change_points[change_points['key'].isin(selected_states)]
+                st.dataframe(
+                    recent.sort_values('date', ascending=False).head(20)[['date', 'label', 'zscore', 'avg_7d']],
+                    use_container_width=True
+                )
+
+        # Estados com curva parecida (índice calculado uma vez por versão do dataset)
+        if st.checkbox("🔎 Buscar estados com curva semelhante", key="show_similar"):
+            reference_state = st.selectbox(
+                "Estado de referência:",
+                sorted(covid_data['state'].unique()),
+                key="similar_reference"
+            )
+            similar = get_similarity_engine().similar(reference_state, 'state', k=5)
+
+            if similar.empty:
+                st.info("Sem dados suficientes para comparar curvas")
+            else:
+                st.dataframe(
+                    similar[['label', 'correlation', 'distance']].rename(columns={
+                        'label': 'Estado', 'correlation': 'Correlação', 'distance': 'Distância'
+                    }),
+                    use_container_width=True
+                )
+
+        # Ondas epidêmicas: respostas a partir da tabela de ondas (sem reprocessar as séries)
+        if st.checkbox("🌊 Comparar ondas entre estados", key="show_waves"):
+            wave_number = st.number_input("Onda número:", min_value=1, max_value=10, value=1, key="wave_number")
+            waves = get_wave_store().compare_wave(int(wave_number), selected_states)
+
+            if waves.empty:
+                st.info("Nenhum dos estados selecionados tem essa onda")
+            else:
+                fig = px.bar(
+                    waves.sort_values('peak_height', ascending=False),
+                    x='label',
+                    y='peak_height',
+                    hover_data=['start_date', 'peak_date', 'end_date', 'duration_days'],
+                    title=f"Onda {int(wave_number)} - Pico de Novos Casos (média 7 dias)",
+                    labels={'label': 'Estado', 'peak_height': 'Casos/dia no pico'}
+                )
+                st.plotly_chart(fig, use_container_width=True)
+                st.dataframe(
+                    waves[['label', 'start_date', 'peak_date', 'end_date', 'duration_days', 'peak_height', 'area']],
+                    use_container_width=True
+                )
+
+    def _forecast_figure(self, selected_states, horizon=14):
+        """Média móvel observada (90 dias) + previsão com intervalo de 80%"""
+        engine = get_forecast_engine()
+        history = engine.history('state', keys=selected_states, last_days=90)
+        forecast = engine.forecast('state', horizon=horizon)
+        forecast = forecast[forecast['key'].isin(selected_states)]
+
+        fig = go.Figure()
+        colors = px.colors.qualitative.Plotly
+        for i, state in enumerate(selected_states):
+            color = colors[i % len(colors)]
+            observed = history[history['key'] == state]
+            predicted = forecast[forecast['key'] == state]
+
+            fig.add_trace(go.Scatter(
+                x=observed['date'], y=observed['avg_7d'], name=state,
+                line=dict(color=color)
+            ))
+            fig.add_trace(go.Scatter(
+                x=pd.concat([predicted['date'], predicted['date'][::-1]]),
+                y=pd.concat([predicted['upper'], predicted['lower'][::-1]]),
+                fill='toself', fillcolor=color, opacity=0.2, line=dict(width=0),
+                name=f"{state} (intervalo 80%)", showlegend=False, hoverinfo='skip'
+            ))
+            fig.add_trace(go.Scatter(
+                x=predicted['date'], y=predicted['forecast'], name=f"{state} (previsão)",
+                line=dict(color=color, dash='dash')
+            ))
+
+        fig.update_layout(
+            title=f"Previsão de Novos Casos (média 7 dias) - próximos {horizon} dias",
+            xaxis_title="Data", yaxis_title="Novos casos/dia"
+        )
+        return fig
+
+    def _rt_figure(self, selected_states, last_days=180):
+        """Rt e tempo de duplicação lidos das séries derivadas gravadas na ingestão"""
+        series = get_derived_store().series('state', keys=selected_states, last_days=last_days)
+
+        fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.08,
+                            subplot_titles=("Rt (número de reprodução efetivo)", "Tempo de duplicação (dias)"))
+        colors = px.colors.qualitative.Plotly
+        for i, state in enumerate(selected_states):
+            color = colors[i % len(colors)]
+            state_series = series[series['key'] == state]
+            fig.add_trace(go.Scatter(x=state_series['date'], y=state_series['rt'], name=state,
+                                     line=dict(color=color)), row=1, col=1)
+            fig.add_trace(go.Scatter(x=state_series['date'], y=state_series['doubling_time'], name=state,
+                                     line=dict(color=color), showlegend=False), row=2, col=1)
+
+        fig.add_hline(y=1.0, line_dash='dot', line_color='gray', row=1, col=1)
+        fig.update_layout(title=f"Rt e Tempo de Duplicação - últimos {last_days} dias", height=600)
+        return fig
+
+    def _cluster_map_figure(self):
+        """Estados coloridos pelo grupo de formato de curva (modelo salvo na ingestão)"""
+        model = get_cluster_store().get('state')
+        if model is None:
+            return go.Figure()
+
+        clusters = model.to_frame()
+        clusters['code'] = clusters['key'].map(STATE_ABBREVIATIONS)
+        clusters['grupo'] = 'Grupo ' + (clusters['cluster'] + 1).astype(str)
+        clusters = clusters.dropna(subset=['code']).sort_values('cluster')
+
+        fig = px.choropleth(
+            clusters,
+            locations='code',
+            locationmode='USA-states',
+            color='grupo',
+            hover_name='label',
+            scope='usa',
+            title="Estados Agrupados pelo Formato da Curva de Casos"
+        )
+        return fig
+
     def covid_counties_page(self):
         """Análise COVID por Condados"""
         st.title("🏙️ COVID-19 - Análise por Condados")
@@ -459,22 +641,39 @@ class SaudeJaExpandedApp:
                 ["Top 10 Condados", "Por Estado", "Comparação Temporal"]
             )
 
+            ranking_labels = {
+                'cases': "Casos acumulados",
+                'deaths': "Óbitos acumulados",
+                'new_cases_7d': "Novos casos (7 dias)",
+                'new_deaths_7d': "Novos óbitos (7 dias)",
+                'cases_per_100k': "Casos por 100 mil hab.",
+                'new_cases_7d_per_100k': "Novos casos (7 dias) por 100 mil hab."
+            }
+            ranking_metric = st.selectbox(
+                "Métrica do ranking:",
+                list(ranking_labels),
+                format_func=ranking_labels.get,
+                key="ranking_metric"
+            )
+
         if st.button("🔍 Analisar Condados", key="analyze_counties_btn"):
             self.log_action("covid_counties_analysis", "us-counties")
 
+            snapshot = get_latest_snapshot('county')
+
             # Análise baseada no nível selecionado
             if analysis_level == "Top 10 Condados":
-                top_counties = counties_data.groupby(['state', 'county'])['cases'].sum().reset_index()
-                top_counties = top_counties.nlargest(10, 'cases')
-                top_counties['location'] = top_counties['county'] + ', ' + top_counties['state']
+                # Último valor de cada fips (tabela mantida por versão do dataset)
+                top_counties = snapshot.top_k(ranking_metric, 10)
 
                 fig = px.bar(
                     top_counties,
-                    x='location',
-                    y='cases',
-                    title="Top 10 Condados com Mais Casos"
+                    x='label',
+                    y=ranking_metric,
+                    title=f"Top 10 Condados - {ranking_labels[ranking_metric]}",
+                    labels={'label': 'Condado', ranking_metric: ranking_labels[ranking_metric]}
                 )
-                fig.update_xaxis(tickangle=45)
+                fig.update_xaxes(tickangle=45)
 
             elif analysis_level == "Por Estado" and selected_states:
                 state_data = counties_data[counties_data['state'].isin(selected_states)]
@@ -489,29 +688,39 @@ class SaudeJaExpandedApp:
 
             else:  # Comparação Temporal
                 if 'date' in counties_data.columns:
-                    counties_data['date'] = pd.to_datetime(counties_data['date'])
-                    temporal_data = counties_data.groupby(['date', 'state'])['cases'].sum().reset_index()
+                    # Agregação condado → estado feita uma vez por versão do dataset
+                    rollups = get_rollup_store().refresh()
+                    temporal_data = rollups.state_series(selected_states[:5])
 
                     fig = px.line(
-                        temporal_data[temporal_data['state'].isin(selected_states[:5])],
+                        temporal_data,
                         x='date',
                         y='cases',
                         color='state',
                         title="Evolução Temporal por Estado"
                     )
 
+                    check = rollups.checks.get('state', {})
+                    if check.get('consistent') is False:
+                        st.warning(f"⚠️ Soma dos condados difere de {check['reference']} em "
+                                   f"{check['rows_mismatched']} linhas estado/dia")
+                    elif check.get('consistent'):
+                        st.caption(f"✅ Soma dos condados confere com {check['reference']} "
+                                   f"({check['days_compared']} dias comparados)")
+
             st.plotly_chart(fig, use_container_width=True)
 
             # Métricas
+            totals = snapshot.totals()
             col1, col2, col3, col4 = st.columns(4)
             with col1:
                 st.metric("Total Condados", counties_data['county'].nunique())
             with col2:
                 st.metric("Total Estados", counties_data['state'].nunique())
             with col3:
-                st.metric("Total Casos", f"{counties_data['cases'].sum():,}")
+                st.metric("Total Casos", f"{totals['cases']:,.0f}")
             with col4:
-                st.metric("Total Óbitos", f"{counties_data['deaths'].sum():,}")
+                st.metric("Total Óbitos", f"{totals['deaths']:,.0f}")
 
     def run(self):
         """Executa a aplicação expandida"""
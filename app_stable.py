@@ -5,7 +5,6 @@ import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import requests
 import json
-import sqlite3
 import hashlib
 import numpy as np
 import warnings
@@ -18,6 +17,9 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from bs4 import BeautifulSoup
 import uuid
+
+from connection_pool import get_connection_pool
+
 warnings.filterwarnings('ignore')
 
 # Configuração da página
@@ -38,55 +40,52 @@ if 'session_id' not in st.session_state:
 class SaudeJaApp:
     def __init__(self):
         self.db_path = os.path.join(os.getcwd(), 'saudeja_stable.db')
+        self.pool = get_connection_pool(self.db_path)
         self.setup_database()
 
     def setup_database(self):
         """Configura banco de dados de forma estável"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS interactions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id TEXT,
-                    action TEXT,
-                    data TEXT,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS interactions (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        session_id TEXT,
+                        action TEXT,
+                        data TEXT,
+                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
 
-            conn.commit()
-            conn.close()
+                conn.commit()
         except Exception:
             pass  # Silenciar erros para evitar warnings
 
     def log_action(self, action, data=None):
         """Log de ação simplificado"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO interactions (session_id, action, data) 
-                VALUES (?, ?, ?)
-            ''', (st.session_state.session_id, action, json.dumps(data) if data else None))
-            conn.commit()
-            conn.close()
+            # Commit (ou rollback se o INSERT falhar) antes de a conexão voltar ao pool
+            with self.pool.connection() as conn, conn:
+                conn.execute('''
+                    INSERT INTO interactions (session_id, action, data) 
+                    VALUES (?, ?, ?)
+                ''', (st.session_state.session_id, action, json.dumps(data) if data else None))
         except Exception:
             pass
 
     def get_history(self):
         """Recupera histórico de forma segura"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            df = pd.read_sql_query('''
-                SELECT action, data, timestamp 
-                FROM interactions 
-                WHERE session_id = ? 
-                ORDER BY timestamp DESC 
-                LIMIT 50
-            ''', conn, params=(st.session_state.session_id,))
-            conn.close()
+            with self.pool.connection() as conn:
+                df = pd.read_sql_query('''
+                    SELECT action, data, timestamp 
+                    FROM interactions 
+                    WHERE session_id = ? 
+                    ORDER BY timestamp DESC 
+                    LIMIT 50
+                ''', conn, params=(st.session_state.session_id,))
             return df
         except Exception:
             return pd.DataFrame()
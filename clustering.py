@@ -0,0 +1,212 @@
+"""
+Agrupamento de geografias pelo formato da curva (PCA + MiniBatchKMeans), um ajuste por versão
+"""
+
+import glob
+import os
+import pickle
+import threading
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import PCA
+
+from data_catalog import dataset_version, source_for_geography
+from forecasting import get_forecast_engine
+from similarity import z_normalize
+
+# Importações condicionais para evitar erros quando executado diretamente
+try:
+    import streamlit as st
+    STREAMLIT_AVAILABLE = True
+except ImportError:
+    STREAMLIT_AVAILABLE = False
+
+try:
+    from config import Config
+except ImportError:
+    class FallbackConfig:
+        CURVE_MODELS_DIR = 'curve_models'
+    Config = FallbackConfig()
+
+# Siglas usadas pelo mapa de estados do Plotly (locationmode='USA-states')
+STATE_ABBREVIATIONS = {
+    'Alabama': 'AL', 'Alaska': 'AK', 'Arizona': 'AZ', 'Arkansas': 'AR', 'California': 'CA',
+    'Colorado': 'CO', 'Connecticut': 'CT', 'Delaware': 'DE', 'District of Columbia': 'DC',
+    'Florida': 'FL', 'Georgia': 'GA', 'Hawaii': 'HI', 'Idaho': 'ID', 'Illinois': 'IL',
+    'Indiana': 'IN', 'Iowa': 'IA', 'Kansas': 'KS', 'Kentucky': 'KY', 'Louisiana': 'LA',
+    'Maine': 'ME', 'Maryland': 'MD', 'Massachusetts': 'MA', 'Michigan': 'MI', 'Minnesota': 'MN',
+    'Mississippi': 'MS', 'Missouri': 'MO', 'Montana': 'MT', 'Nebraska': 'NE', 'Nevada': 'NV',
+    'New Hampshire': 'NH', 'New Jersey': 'NJ', 'New Mexico': 'NM', 'New York': 'NY',
+    'North Carolina': 'NC', 'North Dakota': 'ND', 'Ohio': 'OH', 'Oklahoma': 'OK', 'Oregon': 'OR',
+    'Pennsylvania': 'PA', 'Rhode Island': 'RI', 'South Carolina': 'SC', 'South Dakota': 'SD',
+    'Tennessee': 'TN', 'Texas': 'TX', 'Utah': 'UT', 'Vermont': 'VT', 'Virginia': 'VA',
+    'Washington': 'WA', 'West Virginia': 'WV', 'Wisconsin': 'WI', 'Wyoming': 'WY',
+}
+
+
+class CurveClusters:
+    """Modelo ajustado (PCA + KMeans) e o cluster de cada geografia"""
+
+    def __init__(self, keys, labels, assignments, centroids, pca, kmeans, version, start_offset):
+        self.keys = keys
+        self.labels = labels
+        self.assignments = assignments
+        self.centroids = centroids  # curva média (z-normalizada) de cada cluster
+        self.pca = pca
+        self.kmeans = kmeans
+        self.version = version
+        self.start_offset = start_offset
+
+    def to_frame(self):
+        """Uma linha por geografia: key, label, cluster"""
+        return pd.DataFrame({
+            'key': self.keys,
+            'label': [self.labels.get(key, key) for key in self.keys],
+            'cluster': self.assignments
+        })
+
+    def sizes(self):
+        return np.bincount(self.assignments, minlength=len(self.centroids))
+
+    def to_state(self):
+        """Dicionário persistido em disco (sem depender do caminho de import da classe)"""
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(**state)
+
+
+def fit_curve_clusters(avg_matrix, n_clusters=6, n_components=10, version=None):
+    """Ajusta PCA + MiniBatchKMeans sobre as curvas log(1 + média 7 dias) normalizadas"""
+    curves = z_normalize(np.log1p(np.maximum(avg_matrix.values, 0.0)))
+    n_clusters = min(n_clusters, len(curves))
+    n_components = min(n_components, *curves.shape)
+
+    pca = PCA(n_components=n_components, svd_solver='randomized', random_state=42)
+    embeddings = pca.fit_transform(curves)
+
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, n_init=3,
+                             batch_size=max(256, n_clusters * 32))
+    assignments = kmeans.fit_predict(embeddings)
+
+    # Curva média de cada cluster, para o gráfico dos perfis
+    counts = np.bincount(assignments, minlength=n_clusters)[:, None]
+    centroids = np.zeros((n_clusters, curves.shape[1]))
+    np.add.at(centroids, assignments, curves)
+    centroids /= np.maximum(counts, 1)
+
+    return CurveClusters(avg_matrix.keys, avg_matrix.labels, assignments, centroids,
+                         pca, kmeans, version, avg_matrix.start_offset)
+
+
+class ClusterStore:
+    """Modelos de agrupamento persistidos em disco, um por geografia/métrica/versão
+
+    O ajuste roda na ingestão (CsvSqlEngine.ingest_catalog) ou em segundo
+    plano, nunca durante a renderização: as páginas só carregam o modelo
+    salvo e recebem None enquanto ele não existir para a versão atual.
+    """
+
+    def __init__(self, models_dir=None):
+        self.models_dir = models_dir or getattr(Config, 'CURVE_MODELS_DIR', 'curve_models')
+        self._models = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def _model_path(self, geography, metric, n_clusters, version):
+        return os.path.join(self.models_dir, f"{geography}_{metric}_k{n_clusters}_{version}.pkl")
+
+    def get(self, geography='state', metric='cases', n_clusters=6):
+        """Modelo da versão atual (memória → disco), ou None se ainda não foi ajustado"""
+        file_path, _ = source_for_geography(geography)
+        if file_path is None:
+            return None
+
+        cache_key = (geography, metric, n_clusters, dataset_version(file_path))
+        with self._lock:
+            if cache_key in self._models:
+                return self._models[cache_key]
+
+        path = self._model_path(*cache_key)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as handle:
+            model = CurveClusters.from_state(pickle.load(handle))
+
+        with self._lock:
+            self._models = {key: value for key, value in self._models.items() if key[:3] != cache_key[:3]}
+            self._models[cache_key] = model
+        return model
+
+    def fit(self, geography='state', metric='cases', n_clusters=6):
+        """Ajusta e salva o modelo da versão atual se ele ainda não existir (ingestão/segundo plano)"""
+        model = self.get(geography, metric, n_clusters)
+        if model is not None:
+            return model
+
+        avg_matrix, version = get_forecast_engine().daily_average(geography, metric)
+        if avg_matrix is None:
+            return None
+
+        model = fit_curve_clusters(avg_matrix, n_clusters, version=version)
+        self._save(model, self._model_path(geography, metric, n_clusters, version), geography, metric, n_clusters)
+        print(f"[OK] Clusters {geography}/{metric}: {len(model.keys)} curvas em {n_clusters} grupos")
+        return self.get(geography, metric, n_clusters)
+
+    def fit_in_background(self, geography='state', metric='cases', n_clusters=6):
+        """Agenda fit() numa thread própria (uma por modelo); retorna sem esperar"""
+        job = (geography, metric, n_clusters)
+        with self._lock:
+            if job in self._pending:
+                return
+            self._pending.add(job)
+
+        def run():
+            try:
+                self.fit(geography, metric, n_clusters)
+            except Exception as e:
+                print(f"[ERRO] Erro ao ajustar clusters {geography}/{metric}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(job)
+
+        threading.Thread(target=run, name=f"clusters:{geography}/{metric}", daemon=True).start()
+
+    def _save(self, model, path, geography, metric, n_clusters):
+        os.makedirs(self.models_dir, exist_ok=True)
+        # Versões anteriores do mesmo modelo não são mais usadas
+        pattern = os.path.join(self.models_dir, f"{geography}_{metric}_k{n_clusters}_*.pkl")
+        for old_path in glob.glob(pattern):
+            os.remove(old_path)
+
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as handle:
+            pickle.dump(model.to_state(), handle, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+
+# Funções de cache para Streamlit (se disponível)
+if STREAMLIT_AVAILABLE:
+    @st.cache_resource
+    def get_cluster_store():
+        return ClusterStore()
+else:
+    _cluster_store = None
+
+    def get_cluster_store():
+        global _cluster_store
+        if _cluster_store is None:
+            _cluster_store = ClusterStore()
+        return _cluster_store
+
+
+if __name__ == "__main__":
+    # Pré-calcula os modelos após a ingestão, fora do ciclo das páginas
+    store = get_cluster_store()
+    for geography in ['state', 'county']:
+        model = store.fit(geography)
+        if model is not None:
+            print(f"{geography}: tamanhos dos clusters {model.sizes().tolist()}")
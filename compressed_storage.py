@@ -0,0 +1,377 @@
+"""
+Armazenamento comprimido dos CSVs em blocos (gzip ou zstd) com índice para leitura parcial
+"""
+
+import gzip
+import io
+import json
+import os
+import struct
+
+import pandas as pd
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+try:
+    from config import Config
+except ImportError:
+    class FallbackConfig:
+        COMPRESSED_CODEC = 'auto'
+        COMPRESSED_BLOCK_KB = 1024
+    Config = FallbackConfig()
+
+# Formato: MAGIC | bloco 0 | bloco 1 | ... | índice JSON | tamanho do índice (<Q) | MAGIC
+BLOCK_MAGIC = b'SJBLK001'
+BLOCK_SUFFIX = '.blk'
+_TRAILER = struct.Struct('<Q')
+
+# Colunas resumidas no índice para pular blocos em leituras filtradas
+INDEX_RANGE_COLUMN = 'date'
+INDEX_SET_COLUMN = 'state'
+
+
+def default_codec():
+    """zstd quando o pacote opcional está instalado, senão gzip (biblioteca padrão)"""
+    codec = getattr(Config, 'COMPRESSED_CODEC', 'auto')
+    if codec == 'auto':
+        return 'zstd' if ZSTD_AVAILABLE else 'gzip'
+    if codec == 'zstd' and not ZSTD_AVAILABLE:
+        raise ValueError("Codec zstd requer o pacote 'zstandard'")
+    return codec
+
+
+def compress_block(data, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=9).compress(data)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def decompress_block(data, codec):
+    if codec == 'zstd':
+        if not ZSTD_AVAILABLE:
+            raise ValueError("Arquivo comprimido com zstd; instale o pacote 'zstandard'")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def block_path(full_path):
+    """Caminho da versão em blocos de um CSV"""
+    return full_path + BLOCK_SUFFIX
+
+
+def stored_path(full_path):
+    """Arquivo físico de um CSV do catálogo: o CSV original ou, na falta dele, os blocos"""
+    if not os.path.exists(full_path) and os.path.exists(block_path(full_path)):
+        return block_path(full_path)
+    return full_path
+
+
+def dataset_exists(full_path):
+    """O CSV existe em disco em algum dos formatos"""
+    return os.path.exists(full_path) or os.path.exists(block_path(full_path))
+
+
+def is_block_file(path):
+    return path.endswith(BLOCK_SUFFIX)
+
+
+def _csv_boundary(buffer):
+    """Posição logo após a última quebra de linha fora de aspas (0 se não houver)"""
+    end = len(buffer)
+    while True:
+        cut = buffer.rfind(b'\n', 0, end)
+        if cut < 0:
+            return 0
+        # Número par de aspas antes da quebra: ela encerra um registro
+        if buffer.count(b'"', 0, cut) % 2 == 0:
+            return cut + 1
+        end = cut
+
+
+def _block_summary(header, block):
+    """Intervalo de datas e conjunto de estados do bloco (para o índice)"""
+    columns = header.decode('utf-8').strip().split(',')
+    usecols = [col for col in (INDEX_RANGE_COLUMN, INDEX_SET_COLUMN) if col in columns]
+    summary = {}
+    if not usecols:
+        return summary
+
+    frame = pd.read_csv(io.BytesIO(header + block), usecols=usecols, dtype=str, keep_default_na=False)
+    if INDEX_RANGE_COLUMN in frame.columns and len(frame):
+        summary['min'] = frame[INDEX_RANGE_COLUMN].min()
+        summary['max'] = frame[INDEX_RANGE_COLUMN].max()
+    if INDEX_SET_COLUMN in frame.columns:
+        # Ordem da primeira aparição: permite listar os valores do arquivo só pelo índice
+        summary['values'] = frame[INDEX_SET_COLUMN].unique().tolist()
+    return summary
+
+
+def compress_to_blocks(full_path, codec=None, block_bytes=None, target=None):
+    """Grava o CSV em blocos comprimidos de ~block_bytes e um índice no final
+
+    Cada bloco contém registros inteiros, então pode ser lido sozinho com o
+    cabeçalho. A escrita é atômica (arquivo temporário + rename).
+    """
+    codec = codec or default_codec()
+    block_bytes = block_bytes or int(Config.COMPRESSED_BLOCK_KB * 1024)
+    target = target or block_path(full_path)
+    temp_path = target + '.tmp'
+
+    blocks = []
+    raw_size = 0
+    with open(full_path, 'rb') as source, open(temp_path, 'wb') as output:
+        header = source.readline()
+        raw_size += len(header)
+        output.write(BLOCK_MAGIC)
+        pending = b''
+
+        def write_block(data):
+            payload = compress_block(data, codec)
+            entry = {
+                'offset': output.tell(),
+                'length': len(payload),
+                'raw_length': len(data),
+                'rows': data.count(b'\n') + (0 if data.endswith(b'\n') else 1)
+            }
+            entry.update(_block_summary(header, data))
+            output.write(payload)
+            blocks.append(entry)
+
+        while True:
+            chunk = source.read(block_bytes)
+            if not chunk:
+                break
+            raw_size += len(chunk)
+            pending += chunk
+            if len(pending) < block_bytes:
+                continue
+            cut = _csv_boundary(pending)
+            if cut:
+                write_block(pending[:cut])
+                pending = pending[cut:]
+
+        if pending:
+            write_block(pending)
+
+        index = {
+            'codec': codec,
+            'header': header.decode('utf-8'),
+            'raw_size': raw_size,
+            'rows': sum(block['rows'] for block in blocks),
+            'range_column': INDEX_RANGE_COLUMN,
+            'set_column': INDEX_SET_COLUMN,
+            'blocks': blocks
+        }
+        index_bytes = json.dumps(index, ensure_ascii=False).encode('utf-8')
+        output.write(index_bytes)
+        output.write(_TRAILER.pack(len(index_bytes)))
+        output.write(BLOCK_MAGIC)
+
+    os.replace(temp_path, target)
+    return {
+        'path': target,
+        'codec': codec,
+        'blocks': len(blocks),
+        'raw_bytes': raw_size,
+        'stored_bytes': os.path.getsize(target)
+    }
+
+
+class BlockFile:
+    """Leitura de um arquivo em blocos: índice em memória e blocos sob demanda"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as source:
+            if source.read(len(BLOCK_MAGIC)) != BLOCK_MAGIC:
+                raise ValueError(f"{path} não é um arquivo de blocos")
+            source.seek(-(len(BLOCK_MAGIC) + _TRAILER.size), os.SEEK_END)
+            (index_length,) = _TRAILER.unpack(source.read(_TRAILER.size))
+            source.seek(-(len(BLOCK_MAGIC) + _TRAILER.size + index_length), os.SEEK_END)
+            self.index = json.loads(source.read(index_length).decode('utf-8'))
+
+        self.codec = self.index['codec']
+        self.header = self.index['header'].encode('utf-8')
+        self.blocks = self.index['blocks']
+
+    @property
+    def rows(self):
+        return self.index['rows']
+
+    @property
+    def raw_size(self):
+        return self.index['raw_size']
+
+    def indexed_values(self):
+        """Valores distintos da coluna do índice, na ordem do arquivo (None se algum bloco não tiver)"""
+        if any('values' not in block for block in self.blocks):
+            return None
+        return list(dict.fromkeys(value for block in self.blocks for value in block['values']))
+
+    def select_blocks(self, start=None, end=None, values=None):
+        """Blocos que podem conter linhas no intervalo de datas (ISO) e nos valores pedidos"""
+        selected = []
+        wanted = set(values) if values is not None else None
+        for number, block in enumerate(self.blocks):
+            if start is not None and block.get('max') is not None and block['max'] < start:
+                continue
+            if end is not None and block.get('min') is not None and block['min'] > end:
+                continue
+            if wanted is not None and 'values' in block and not wanted.intersection(block['values']):
+                continue
+            selected.append(number)
+        return selected
+
+    def read_block(self, number, source=None):
+        """Bytes descomprimidos de um bloco (busca direta pelo deslocamento do índice)"""
+        block = self.blocks[number]
+        if source is None:
+            with open(self.path, 'rb') as handle:
+                handle.seek(block['offset'])
+                payload = handle.read(block['length'])
+        else:
+            source.seek(block['offset'])
+            payload = source.read(block['length'])
+        return decompress_block(payload, self.codec)
+
+    def iter_raw(self, numbers=None):
+        """Cabeçalho e depois cada bloco descomprimido, um de cada vez"""
+        numbers = range(len(self.blocks)) if numbers is None else numbers
+        yield self.header
+        with open(self.path, 'rb') as source:
+            for number in numbers:
+                yield self.read_block(number, source)
+
+    def matches(self, original_path):
+        """Compara com o CSV original bloco a bloco (memória de um bloco, não do arquivo)"""
+        with open(original_path, 'rb') as original:
+            for chunk in self.iter_raw():
+                if original.read(len(chunk)) != chunk:
+                    return False
+            # O original não pode ter bytes além do último bloco
+            return original.read(1) == b''
+
+    def open_stream(self):
+        """Arquivo somente leitura com o CSV original, descomprimido sob demanda"""
+        return io.BufferedReader(_BlockStream(self.iter_raw()), buffer_size=1024 * 1024)
+
+    def read_frame(self, start=None, end=None, values=None, **read_csv_kwargs):
+        """DataFrame só com os blocos necessários e as linhas que atendem ao filtro"""
+        range_column = self.index.get('range_column')
+        set_column = self.index.get('set_column')
+        numbers = self.select_blocks(start, end, values)
+        if not numbers:
+            return pd.read_csv(io.BytesIO(self.header), **read_csv_kwargs)
+
+        frame = pd.read_csv(_BlockStream(self.iter_raw(numbers)), **read_csv_kwargs)
+        mask = pd.Series(True, index=frame.index)
+        if range_column in frame.columns:
+            dates = frame[range_column].astype(str)
+            if start is not None:
+                mask &= dates >= start
+            if end is not None:
+                mask &= dates <= end
+        if values is not None and set_column in frame.columns:
+            mask &= frame[set_column].isin(list(values))
+        return frame[mask].reset_index(drop=True)
+
+
+class _BlockStream(io.RawIOBase):
+    """Adapta um iterador de blocos de bytes para a interface de arquivo (readinto)"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._current = b''
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self._position >= len(self._current):
+            try:
+                self._current = next(self._chunks)
+            except StopIteration:
+                return 0
+            self._position = 0
+
+        size = min(len(buffer), len(self._current) - self._position)
+        buffer[:size] = self._current[self._position:self._position + size]
+        self._position += size
+        return size
+
+
+def open_dataset(full_path):
+    """Abre o CSV em modo binário, descomprimindo os blocos se só eles existirem"""
+    path = stored_path(full_path)
+    if is_block_file(path):
+        return BlockFile(path).open_stream()
+    return open(path, 'rb')
+
+
+def dataset_size(full_path):
+    """Tamanho do CSV sem compressão (o mesmo nos dois formatos)"""
+    path = stored_path(full_path)
+    if is_block_file(path):
+        return BlockFile(path).raw_size
+    return os.path.getsize(path)
+
+
+def read_csv_filtered(full_path, start=None, end=None, values=None, **read_csv_kwargs):
+    """Lê só as linhas no intervalo de datas e valores pedidos
+
+    Nos arquivos em blocos apenas os blocos indicados pelo índice são
+    descomprimidos; no CSV original a leitura é completa seguida do filtro.
+    """
+    path = stored_path(full_path)
+    if is_block_file(path):
+        return BlockFile(path).read_frame(start, end, values, **read_csv_kwargs)
+
+    frame = pd.read_csv(path, **read_csv_kwargs)
+    mask = pd.Series(True, index=frame.index)
+    if INDEX_RANGE_COLUMN in frame.columns:
+        dates = frame[INDEX_RANGE_COLUMN].astype(str)
+        if start is not None:
+            mask &= dates >= start
+        if end is not None:
+            mask &= dates <= end
+    if values is not None and INDEX_SET_COLUMN in frame.columns:
+        mask &= frame[INDEX_SET_COLUMN].isin(list(values))
+    return frame[mask].reset_index(drop=True)
+
+
+# Conversão do catálogo quando chamado diretamente:
+#   python compressed_storage.py [--codec gzip|zstd] [--remove-raw]
+if __name__ == "__main__":
+    import argparse
+
+    from data_catalog import unique_catalog_files
+
+    parser = argparse.ArgumentParser(description="Comprime os CSVs do catálogo em blocos")
+    parser.add_argument('--codec', choices=['gzip', 'zstd'], default=None)
+    parser.add_argument('--remove-raw', action='store_true',
+                        help="remove o CSV original depois de validar a versão em blocos")
+    args = parser.parse_args()
+
+    print("COMPRIMINDO CATÁLOGO EM BLOCOS...")
+    print("=" * 50)
+    for file_path, entry in unique_catalog_files().items():
+        full_path = entry['full_path']
+        if not os.path.exists(full_path):
+            print(f"  - {file_path}: já comprimido")
+            continue
+
+        stats = compress_to_blocks(full_path, codec=args.codec)
+        ratio = stats['stored_bytes'] / max(stats['raw_bytes'], 1)
+        print(f"[OK] {file_path}: {stats['blocks']} blocos {stats['codec']}, "
+              f"{stats['raw_bytes'] / 1024 / 1024:,.1f} MB -> {stats['stored_bytes'] / 1024 / 1024:,.1f} MB ({ratio:.0%})")
+
+        if args.remove_raw:
+            if BlockFile(stats['path']).matches(full_path):
+                os.remove(full_path)
+            else:
+                print(f"[ERRO] {file_path}: conteúdo dos blocos difere do original; CSV mantido")
@@ -41,6 +41,50 @@ class Config:
     API_RATE_LIMIT = int(os.getenv('API_RATE_LIMIT', '100'))  # req/hour
     CRAWL_DELAY = float(os.getenv('CRAWL_DELAY', '1.0'))  # segundos
 
+    # Modo SQL embarcado sobre os CSVs
+    ANALYTICS_DB_PATH = os.getenv('ANALYTICS_DB_PATH', 'saudeja_analytics.db')
+    SQL_QUERY_TIMEOUT = float(os.getenv('SQL_QUERY_TIMEOUT', '2.0'))  # segundos
+    SQL_MAX_ROWS = int(os.getenv('SQL_MAX_ROWS', '5000'))
+
+    # Cache de figuras Plotly compartilhado entre sessões
+    FIGURE_CACHE_MB = float(os.getenv('FIGURE_CACHE_MB', '64'))
+
+    # Exportações comprimidas (gzip) mantidas em disco: diretório e orçamento em MB
+    EXPORT_DIR = os.getenv('EXPORT_DIR', 'dataset_exports')
+    EXPORT_CACHE_MB = float(os.getenv('EXPORT_CACHE_MB', '128'))
+
+    # Orçamento de memória do cache global de datasets
+    DATASET_CACHE_MB = float(os.getenv('DATASET_CACHE_MB', '512'))
+
+    # Processos usados nas previsões em lote (1 = sem pool)
+    FORECAST_WORKERS = int(os.getenv('FORECAST_WORKERS', '1'))
+
+    # Modelos de agrupamento de curvas persistidos entre execuções
+    CURVE_MODELS_DIR = os.getenv('CURVE_MODELS_DIR', 'curve_models')
+
+    # Manifestos (hash por linha) usados para comparar versões dos datasets
+    DIFF_MANIFEST_DIR = os.getenv('DIFF_MANIFEST_DIR', 'dataset_manifests')
+
+    # Fila de escrita das interações: comandos por commit e espera máxima para fechar o lote
+    WRITE_BEHIND_BATCH = int(os.getenv('WRITE_BEHIND_BATCH', '200'))
+    WRITE_BEHIND_DELAY_MS = float(os.getenv('WRITE_BEHIND_DELAY_MS', '5'))
+
+    # Pool de conexões SQLite: mmap e cache de páginas (MB), statements preparados e conexões por banco
+    SQLITE_MMAP_MB = int(os.getenv('SQLITE_MMAP_MB', '64'))
+    SQLITE_CACHE_MB = int(os.getenv('SQLITE_CACHE_MB', '16'))
+    SQLITE_CACHED_STATEMENTS = int(os.getenv('SQLITE_CACHED_STATEMENTS', '256'))
+    SQLITE_POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', '4'))
+
+    # Histórico de versões dos datasets (base + deltas) para consultas as_of
+    HISTORY_DIR = os.getenv('HISTORY_DIR', 'dataset_history')
+
+    # Armazenamento comprimido em blocos ('auto' = zstd se instalado, senão gzip)
+    COMPRESSED_CODEC = os.getenv('COMPRESSED_CODEC', 'auto')
+    COMPRESSED_BLOCK_KB = int(os.getenv('COMPRESSED_BLOCK_KB', '1024'))
+
+    # Largura de referência dos gráficos (escolha do nível da pirâmide de resoluções)
+    CHART_WIDTH_PX = int(os.getenv('CHART_WIDTH_PX', '1200'))
+
     @staticmethod
     def validate_config():
         """Valida configurações essenciais conforme requisitos"""
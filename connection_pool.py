@@ -0,0 +1,147 @@
+"""
+Pool de conexões SQLite de longa duração, com pragmas aplicados uma única vez por conexão
+"""
+
+import atexit
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Importações condicionais para evitar erros quando executado diretamente
+try:
+    import streamlit as st
+    STREAMLIT_AVAILABLE = True
+except ImportError:
+    STREAMLIT_AVAILABLE = False
+
+try:
+    from config import Config
+except ImportError:
+    class FallbackConfig:
+        SQLITE_MMAP_MB = 64
+        SQLITE_CACHE_MB = 16
+        SQLITE_CACHED_STATEMENTS = 256
+        SQLITE_POOL_SIZE = 4
+    Config = FallbackConfig()
+
+
+def open_connection(db_path, timeout=10):
+    """Abre a conexão e aplica os pragmas de desempenho (WAL, fsync só no checkpoint, mmap, cache)"""
+    conn = sqlite3.connect(
+        db_path,
+        timeout=timeout,
+        check_same_thread=False,
+        cached_statements=Config.SQLITE_CACHED_STATEMENTS
+    )
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA mmap_size={int(Config.SQLITE_MMAP_MB * 1024 * 1024)}')
+    # Valor negativo = tamanho em KiB
+    conn.execute(f'PRAGMA cache_size={-int(Config.SQLITE_CACHE_MB * 1024)}')
+    return conn
+
+
+class SQLitePool:
+    """Pool pequeno de conexões configuradas uma vez e reaproveitadas por qualquer thread
+
+    O Streamlit roda cada rerun numa thread nova, então as conexões não são
+    presas à thread: cada uso pega uma conexão livre (a usada mais
+    recentemente, com cache quente) e a devolve ao sair do bloco with. Uma
+    conexão nunca é usada por duas threads ao mesmo tempo. Os comandos SQL
+    preparados ficam no cache de statements de cada conexão (cached_statements).
+    """
+
+    def __init__(self, db_path, size=None, timeout=10):
+        self.db_path = db_path
+        self.size = size or Config.SQLITE_POOL_SIZE
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.closed = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.in_use = 0
+        atexit.register(self.close_all)
+
+    @contextmanager
+    def connection(self):
+        """Empresta uma conexão durante o bloco with (não fechar: ela volta ao pool)"""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def _acquire(self):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                open_new = self.opened - self.closed < self.size
+                if open_new:
+                    self.opened += 1
+
+        try:
+            if open_new:
+                return open_connection(self.db_path, self.timeout)
+            # Pool cheio: espera uma conexão ser devolvida
+            with self._lock:
+                self.waits += 1
+            return self._idle.get(timeout=self.timeout)
+        except Exception:
+            with self._lock:
+                self.in_use -= 1
+                if open_new:
+                    self.opened -= 1
+            raise
+
+    def _release(self, conn):
+        # Transação esquecida aberta prenderia o lock de escrita para o próximo usuário
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self.in_use -= 1
+        self._idle.put(conn)
+
+    def close_all(self):
+        """Fecha as conexões livres (registrado no atexit)"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self.closed += 1
+
+    def get_stats(self):
+        """Aberturas x usos: reused mostra quantos usos evitaram um sqlite3.connect"""
+        with self._lock:
+            return {
+                'open': self.opened - self.closed,
+                'opened': self.opened,
+                'closed': self.closed,
+                'in_use': self.in_use,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'reused': self.checkouts - self.opened,
+                'reuse_ratio': (self.checkouts - self.opened) / self.checkouts if self.checkouts else 0.0
+            }
+
+
+# Funções de cache para Streamlit (se disponível)
+if STREAMLIT_AVAILABLE:
+    @st.cache_resource
+    def get_connection_pool(db_path):
+        return SQLitePool(db_path)
+else:
+    _connection_pools = {}
+
+    def get_connection_pool(db_path):
+        if db_path not in _connection_pools:
+            _connection_pools[db_path] = SQLitePool(db_path)
+        return _connection_pools[db_path]
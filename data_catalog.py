@@ -0,0 +1,218 @@
+"""
+Catálogo central dos arquivos CSV do projeto
+"""
+
+import hashlib
+import os
+import threading
+
+from compressed_storage import BlockFile, dataset_exists, dataset_size, is_block_file, open_dataset, stored_path
+
+# Mapeamento de arquivos CSV e suas descrições
+CSV_CATALOG = {
+    # COVID Principal
+    'us-states.csv': {'name': 'COVID-19 por Estados', 'category': 'covid_main'},
+    'us-counties.csv': {'name': 'COVID-19 por Condados', 'category': 'covid_main'},
+    'us.csv': {'name': 'COVID-19 Nacional (EUA)', 'category': 'covid_main'},
+
+    # COVID por Anos
+    'us-counties-2020.csv': {'name': 'COVID Condados 2020', 'category': 'covid_yearly'},
+    'us-counties-2021.csv': {'name': 'COVID Condados 2021', 'category': 'covid_yearly'},
+    'us-counties-2022.csv': {'name': 'COVID Condados 2022', 'category': 'covid_yearly'},
+    'us-counties-2023.csv': {'name': 'COVID Condados 2023', 'category': 'covid_yearly'},
+    'us-counties-recent.csv': {'name': 'COVID Condados Recente', 'category': 'covid_yearly'},
+
+    # Dados especializados
+    'colleges/colleges.csv': {'name': 'Dados de Faculdades', 'category': 'specialized'},
+    'excess-deaths/deaths.csv': {'name': 'Mortes Excessivas', 'category': 'specialized'},
+    'mask-use/mask-use-by-county.csv': {'name': 'Uso de Máscaras por Condado', 'category': 'specialized'},
+    'prisons/facilities.csv': {'name': 'Facilidades Prisionais', 'category': 'specialized'},
+    'prisons/systems.csv': {'name': 'Sistemas Prisionais', 'category': 'specialized'},
+
+    # Dados em subpastas
+    'data/us-states.csv': {'name': 'COVID Estados (Data)', 'category': 'data_folder'},
+    'data/us-counties.csv': {'name': 'COVID Condados (Data)', 'category': 'data_folder'},
+    'data/us.csv': {'name': 'COVID Nacional (Data)', 'category': 'data_folder'},
+
+    # Live data
+    'live/us-states.csv': {'name': 'COVID Estados (Live)', 'category': 'live_data'},
+    'live/us-counties.csv': {'name': 'COVID Condados (Live)', 'category': 'live_data'},
+    'live/us.csv': {'name': 'COVID Nacional (Live)', 'category': 'live_data'},
+
+    # Rolling averages
+    'rolling-averages/us-states.csv': {'name': 'Médias Móveis Estados', 'category': 'rolling'},
+    'rolling-averages/us-counties.csv': {'name': 'Médias Móveis Condados', 'category': 'rolling'},
+    'rolling-averages/anomalies.csv': {'name': 'Anomalias Detectadas', 'category': 'rolling'}
+}
+
+
+# Arquivos usados por nível geográfico, em ordem de preferência
+GEOGRAPHY_SOURCES = {
+    'state': (['us-states.csv', 'data/us-states.csv'], 'state'),
+    'county': (['us-counties.csv', 'data/us-counties.csv', 'us-counties-recent.csv'], 'fips'),
+}
+
+
+def source_for_geography(geography, extra_files=()):
+    """Primeiro arquivo existente para o nível geográfico: (caminho ou None, coluna-chave)"""
+    files, key_column = GEOGRAPHY_SOURCES[geography]
+    for file_path in list(files) + list(extra_files):
+        if dataset_exists(file_path):
+            return file_path, key_column
+    return None, key_column
+
+
+def dataset_version(full_path):
+    """Versão barata de um arquivo (mtime + tamanho) usada como chave de cache"""
+    try:
+        stat = os.stat(stored_path(full_path))
+        return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    except OSError:
+        return None
+
+
+# Leitura em blocos para o hash de conteúdo (arquivos grandes não entram inteiros em memória)
+HASH_CHUNK_BYTES = 1024 * 1024
+
+_fingerprints = {}
+_canonical_paths = {}
+_registry_lock = threading.Lock()
+
+
+def content_fingerprint(full_path, chunk_size=HASH_CHUNK_BYTES):
+    """Hash (blake2b) do conteúdo do arquivo, calculado em blocos e uma vez por versão
+
+    O hash é do CSV descomprimido: o mesmo conteúdo tem o mesmo hash em qualquer formato.
+    """
+    full_path = os.path.abspath(full_path)
+    version = dataset_version(full_path)
+    if version is None:
+        return None
+
+    with _registry_lock:
+        cached = _fingerprints.get(full_path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open_dataset(full_path) as source:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    fingerprint = digest.hexdigest()
+
+    with _registry_lock:
+        _fingerprints[full_path] = (version, fingerprint)
+    return fingerprint
+
+
+def resolve_duplicates(files):
+    """{arquivo: caminho} -> {arquivo: arquivo canônico com o mesmo conteúdo}
+
+    Só arquivos com o mesmo tamanho de outro são lidos para o hash; o canônico
+    é o primeiro na ordem recebida (a ordem do catálogo).
+    """
+    by_size = {}
+    for file_path, full_path in files.items():
+        by_size.setdefault(dataset_size(full_path), []).append(file_path)
+
+    canonical = {file_path: file_path for file_path in files}
+    for same_size in by_size.values():
+        if len(same_size) < 2:
+            continue
+        first_by_hash = {}
+        for file_path in same_size:
+            fingerprint = content_fingerprint(files[file_path])
+            canonical[file_path] = first_by_hash.setdefault(fingerprint, file_path)
+    return canonical
+
+
+def unique_catalog_files(base_path=None):
+    """Um item por arquivo físico distinto: {arquivo canônico: {'full_path', 'aliases'}}
+
+    Caminhos com conteúdo idêntico (ex.: us-states.csv e data/us-states.csv)
+    viram aliases do primeiro, e passam a compartilhar carga e cache.
+    """
+    files = existing_catalog_files(base_path)
+    canonical = resolve_duplicates(files)
+
+    unique = {}
+    for file_path, target in canonical.items():
+        entry = unique.setdefault(target, {'full_path': files[target], 'aliases': []})
+        if target != file_path:
+            entry['aliases'].append(file_path)
+
+    with _registry_lock:
+        for file_path, target in canonical.items():
+            alias_path = os.path.abspath(files[file_path])
+            target_path = os.path.abspath(files[target])
+            _canonical_paths[alias_path] = (
+                dataset_version(alias_path), target_path, dataset_version(target_path)
+            )
+    return unique
+
+
+def _registered_canonical(full_path):
+    with _registry_lock:
+        entry = _canonical_paths.get(full_path)
+    if entry is None:
+        return None
+    version, target_path, target_version = entry
+    # Qualquer um dos dois arquivos mudou: a equivalência precisa ser refeita
+    if dataset_version(full_path) != version or dataset_version(target_path) != target_version:
+        return None
+    return target_path
+
+
+def canonical_path(full_path):
+    """Caminho absoluto do arquivo físico que representa full_path (ele mesmo se não houver duplicata)"""
+    full_path = os.path.abspath(full_path)
+    target = _registered_canonical(full_path)
+    if target is not None:
+        return target
+
+    # Primeira consulta (ou arquivo alterado): reagrupa o catálogo do diretório atual
+    unique_catalog_files()
+    target = _registered_canonical(full_path)
+    if target is None:
+        # Fora do catálogo: registra como canônico de si mesmo para não reagrupar a cada chamada
+        version = dataset_version(full_path)
+        with _registry_lock:
+            _canonical_paths[full_path] = (version, full_path, version)
+        target = full_path
+    return target
+
+
+def existing_catalog_files(base_path=None):
+    """Retorna {arquivo: caminho_completo} para os itens do catálogo presentes em disco"""
+    base_path = base_path or os.getcwd()
+    files = {}
+    for file_path in CSV_CATALOG:
+        full_path = os.path.join(base_path, file_path)
+        if dataset_exists(full_path):
+            files[file_path] = full_path
+    return files
+
+
+def count_csv_rows(full_path, chunk_size=1024 * 1024):
+    """Conta registros por quebras de linha, sem interpretar o CSV"""
+    path = stored_path(full_path)
+    if is_block_file(path):
+        # Contagem gravada no índice dos blocos
+        return BlockFile(path).rows
+
+    newlines = 0
+    last_byte = b'\n'
+    with open(path, 'rb') as source:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            newlines += chunk.count(b'\n')
+            last_byte = chunk[-1:]
+
+    # Última linha sem '\n' também é um registro; o cabeçalho não é
+    lines = newlines + (0 if last_byte == b'\n' else 1)
+    return max(lines - 1, 0)
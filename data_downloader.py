@@ -8,6 +8,9 @@ import pandas as pd
 from datetime import datetime
 import sys
 
+from dataset_diff import get_change_tracker
+from dataset_history import get_dataset_history
+
 def download_all_covid_data():
     """Baixa todos os datasets COVID-19 do NY Times"""
     
@@ -49,6 +52,16 @@ def download_all_covid_data():
             # Verificar dados
             df = pd.read_csv(filepath)
             print(f"OK {name}: {len(df)} registros baixados")
+
+            # Comparar com a versão anterior (linhas inseridas, alteradas e removidas)
+            diff = get_change_tracker().refresh(filepath)
+            if diff is not None:
+                summary = diff.summary()
+                print(f"   Mudanças: {summary['inserted']} inseridas, {summary['updated']} alteradas, "
+                      f"{summary['deleted']} removidas em {summary['geographies']} geografias")
+
+            # Guardar a versão no histórico (consultas "como estava em" uma data)
+            get_dataset_history().record(filepath)
             
         except Exception as e:
             print(f"ERRO ao baixar {name}: {e}")
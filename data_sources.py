@@ -4,6 +4,8 @@ from datetime import datetime, timedelta
 import json
 import numpy as np
 
+from series_matrix import build_matrix
+
 # Importações condicionais para evitar erros quando executado diretamente
 try:
     import streamlit as st
@@ -123,26 +125,30 @@ class CovidDataManager:
         cutoff_date = df['date'].max() - timedelta(days=days)
         recent_data = df[df['date'] >= cutoff_date]
         
-        # Calcular tendências por estado
-        trends = []
-        for state in recent_data['state'].unique():
-            state_recent = recent_data[recent_data['state'] == state].sort_values('date')
-            
-            if len(state_recent) >= 7:  # Mínimo de dados
-                # Taxa de crescimento de casos
-                recent_cases = state_recent['cases'].iloc[-7:].diff().mean()
-                prev_cases = state_recent['cases'].iloc[-14:-7].diff().mean()
-                
-                growth_rate = ((recent_cases - prev_cases) / prev_cases * 100) if prev_cases > 0 else 0
-                
-                trends.append({
-                    'state': state,
-                    'growth_rate': growth_rate,
-                    'total_cases': state_recent['cases'].iloc[-1],
-                    'total_deaths': state_recent['deaths'].iloc[-1]
-                })
+        # Matriz estado × dia: todas as tendências calculadas de uma vez
+        cases = build_matrix(recent_data, 'state', 'cases')
+        deaths = build_matrix(recent_data, 'state', 'deaths')
+        counts = recent_data.groupby('state').size().reindex(cases.keys).to_numpy()
+        
+        values = cases.values
+        if values.shape[1] < 14:
+            return []
+        # Média das diferenças diárias na última semana e na anterior
+        recent_cases = (values[:, -1] - values[:, -7]) / 6
+        prev_cases = (values[:, -8] - values[:, -14]) / 6
+        with np.errstate(divide='ignore', invalid='ignore'):
+            growth_rate = np.where(prev_cases > 0, (recent_cases - prev_cases) / prev_cases * 100, 0.0)
+        
+        valid = counts >= 7  # Mínimo de dados
+        order = np.argsort(-np.abs(growth_rate[valid]), kind='stable')[:10]
+        rows = np.flatnonzero(valid)[order]
         
-        return sorted(trends, key=lambda x: abs(x['growth_rate']), reverse=True)[:10]
+        return [{
+            'state': cases.keys[row],
+            'growth_rate': float(growth_rate[row]),
+            'total_cases': values[row, -1],
+            'total_deaths': deaths.values[row, -1]
+        } for row in rows]
 
 class PubMedManager:
     """Gerenciador de dados do PubMed"""
@@ -1,9 +1,10 @@
 import streamlit as st
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Float
+from sqlalchemy import create_engine, func, text, Column, Integer, String, DateTime, Text, Float
 from sqlalchemy.orm import declarative_base, sessionmaker
 from datetime import datetime
 import json
 import hashlib
+import re
 
 # Importação condicional para evitar erros quando executado diretamente
 try:
@@ -39,10 +40,70 @@ class ResearchData(Base):
     relevance_score = Column(Float)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class InteractionRollup(Base):
+    """Contagem de interações por tipo e hora, atualizada a cada log_interaction"""
+    __tablename__ = 'interaction_rollups'
+
+    interaction_type = Column(String(100), primary_key=True)
+    hour = Column(DateTime, primary_key=True)
+    interaction_count = Column(Integer, nullable=False, default=0)
+    # Sessões cuja primeira interação caiu nesta hora/tipo (a soma dá o total de sessões)
+    new_sessions = Column(Integer, nullable=False, default=0)
+
+class InteractionSession(Base):
+    """Primeira aparição de cada sessão (decide se a interação inaugura uma sessão)"""
+    __tablename__ = 'interaction_sessions'
+
+    session_id = Column(String(255), primary_key=True)
+    first_seen = Column(DateTime)
+
+def rollup_hour(timestamp):
+    """Hora cheia usada como chave do rollup"""
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+def _upsert_statement(session, model):
+    """INSERT com ON CONFLICT do dialeto (SQLite/PostgreSQL) ou None se não houver"""
+    dialect = session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    return insert(model)
+
+# Índices FTS5 (conteúdo externo) e gatilhos que os mantêm em sincronia com as tabelas
+FULL_TEXT_INDEXES = {
+    'research_fts': ('research_data', ['topic', 'content']),
+    'interactions_fts': ('user_interactions', ['user_query'])
+}
+
+def full_text_statements(index_name, table, columns):
+    """CREATE VIRTUAL TABLE e gatilhos de INSERT/DELETE/UPDATE de um índice FTS5"""
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'new.{column}' for column in columns)
+    old_values = ', '.join(f'old.{column}' for column in columns)
+    delete_old = (f"INSERT INTO {index_name}({index_name}, rowid, {column_list}) "
+                  f"VALUES ('delete', old.id, {old_values});")
+    insert_new = f"INSERT INTO {index_name}(rowid, {column_list}) VALUES (new.id, {new_values});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {index_name} USING fts5("
+        f"{column_list}, content='{table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {index_name}_ai AFTER INSERT ON {table} BEGIN {insert_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS {index_name}_ad AFTER DELETE ON {table} BEGIN {delete_old} END",
+        f"CREATE TRIGGER IF NOT EXISTS {index_name}_au AFTER UPDATE ON {table} BEGIN {delete_old} {insert_new} END"
+    ]
+
+def full_text_query(terms):
+    """Converte texto livre em consulta FTS5: cada palavra entre aspas, com prefixo (AND implícito)"""
+    words = re.findall(r'\w+', str(terms))
+    return ' '.join(f'"{word}"*' for word in words)
+
 class DatabaseManager:
     def __init__(self):
         self.engine = None
         self.Session = None
+        self.full_text_enabled = False
         self.initialize_database()
     
     def initialize_database(self):
@@ -61,6 +122,8 @@ class DatabaseManager:
             
             Base.metadata.create_all(self.engine)
             self.Session = sessionmaker(bind=self.engine)
+            self.backfill_rollups()
+            self.full_text_enabled = self.setup_full_text_search()
             
             return True
         except Exception as e:
@@ -69,9 +132,30 @@ class DatabaseManager:
             self.engine = create_engine('sqlite:///:memory:')
             Base.metadata.create_all(self.engine)
             self.Session = sessionmaker(bind=self.engine)
+            self.full_text_enabled = self.setup_full_text_search()
             print("[FALLBACK] Usando banco em memoria")
             return False
     
+    def setup_full_text_search(self):
+        """Cria os índices FTS5 e gatilhos (só SQLite com FTS5; senão as buscas usam LIKE)"""
+        if self.engine.dialect.name != 'sqlite':
+            return False
+        try:
+            with self.engine.begin() as conn:
+                existing = {row[0] for row in conn.exec_driver_sql(
+                    "SELECT name FROM sqlite_master WHERE type = 'table'"
+                )}
+                for index_name, (table, columns) in FULL_TEXT_INDEXES.items():
+                    for statement in full_text_statements(index_name, table, columns):
+                        conn.exec_driver_sql(statement)
+                    # Índice novo em banco com dados: indexa as linhas que já existiam
+                    if index_name not in existing:
+                        conn.exec_driver_sql(f"INSERT INTO {index_name}({index_name}) VALUES ('rebuild')")
+            return True
+        except Exception as e:
+            print(f"[AVISO] Busca full-text indisponível, usando LIKE: {e}")
+            return False
+
     def get_session_id(self):
         """Gera um ID único para a sessão do usuário"""
         # Se estiver no contexto do Streamlit
@@ -96,9 +180,12 @@ class DatabaseManager:
                 user_query=user_query,
                 interaction_type=interaction_type,
                 response_data=json.dumps(response_data) if isinstance(response_data, dict) else str(response_data),
+                timestamp=datetime.utcnow(),
                 user_feedback=user_feedback
             )
             session.add(interaction)
+            # Rollup na mesma transação: a interação e a contagem entram juntas ou nenhuma entra
+            self._update_rollups(session, interaction.session_id, interaction_type, interaction.timestamp)
             session.commit()
             session.close()
             print(f"[OK] Interação registrada: {interaction_type}")
@@ -107,6 +194,88 @@ class DatabaseManager:
             print(f"[ERRO] Erro ao salvar interação: {e}")
             return False
     
+    def _update_rollups(self, session, session_id, interaction_type, timestamp):
+        """Soma a interação ao rollup (tipo, hora) e registra a sessão se for nova"""
+        interaction_type = interaction_type or ''
+        hour = rollup_hour(timestamp)
+
+        insert_session = _upsert_statement(session, InteractionSession)
+        if insert_session is not None:
+            result = session.execute(
+                insert_session.values(session_id=session_id, first_seen=timestamp)
+                .on_conflict_do_nothing(index_elements=['session_id'])
+            )
+            new_session = int(result.rowcount == 1)
+
+            insert_rollup = _upsert_statement(session, InteractionRollup)
+            table = InteractionRollup.__table__
+            session.execute(
+                insert_rollup.values(interaction_type=interaction_type, hour=hour,
+                                     interaction_count=1, new_sessions=new_session)
+                .on_conflict_do_update(
+                    index_elements=['interaction_type', 'hour'],
+                    set_={
+                        'interaction_count': table.c.interaction_count + 1,
+                        'new_sessions': table.c.new_sessions + new_session
+                    }
+                )
+            )
+            return
+
+        # Outros bancos: leitura e escrita pelo ORM
+        new_session = session.get(InteractionSession, session_id) is None
+        if new_session:
+            session.add(InteractionSession(session_id=session_id, first_seen=timestamp))
+        rollup = session.get(InteractionRollup, (interaction_type, hour))
+        if rollup is None:
+            rollup = InteractionRollup(interaction_type=interaction_type, hour=hour,
+                                       interaction_count=0, new_sessions=0)
+            session.add(rollup)
+        rollup.interaction_count += 1
+        rollup.new_sessions += int(new_session)
+
+    def backfill_rollups(self):
+        """Monta o rollup a partir das interações já gravadas (bancos anteriores ao rollup)"""
+        session = self.Session()
+        try:
+            if session.query(InteractionRollup).first() is not None:
+                return False
+            if session.query(UserInteraction.id).first() is None:
+                return False
+
+            rollups = {}
+            first_seen = {}
+            rows = session.query(
+                UserInteraction.session_id, UserInteraction.interaction_type, UserInteraction.timestamp
+            ).order_by(UserInteraction.id).yield_per(10000)
+            for session_id, interaction_type, timestamp in rows:
+                timestamp = timestamp or datetime.utcnow()
+                key = (interaction_type or '', rollup_hour(timestamp))
+                counts = rollups.setdefault(key, [0, 0])
+                counts[0] += 1
+                if session_id not in first_seen:
+                    first_seen[session_id] = timestamp
+                    counts[1] += 1
+
+            session.bulk_insert_mappings(InteractionSession, [
+                {'session_id': session_id, 'first_seen': timestamp}
+                for session_id, timestamp in first_seen.items()
+            ])
+            session.bulk_insert_mappings(InteractionRollup, [
+                {'interaction_type': interaction_type, 'hour': hour,
+                 'interaction_count': counts[0], 'new_sessions': counts[1]}
+                for (interaction_type, hour), counts in rollups.items()
+            ])
+            session.commit()
+            print(f"[OK] Rollup de interações reconstruído: {len(rollups)} linhas (tipo, hora)")
+            return True
+        except Exception as e:
+            session.rollback()
+            print(f"[ERRO] Erro ao reconstruir rollup de interações: {e}")
+            return False
+        finally:
+            session.close()
+    
     def save_research_data(self, topic, data_source, content, relevance_score=0.0):
         """Salva dados de pesquisa no banco"""
         try:
@@ -145,14 +314,26 @@ class DatabaseManager:
             print(f"[ERRO] Erro ao recuperar histórico: {e}")
             return []
     
-    def get_research_by_topic(self, topic):
-        """Recupera dados de pesquisa por tópico"""
+    def get_research_by_topic(self, topic, limit=20):
+        """Recupera dados de pesquisa por tópico (FTS5 com ranking BM25; LIKE sem FTS5)"""
         try:
             session = self.Session()
-            research_data = session.query(ResearchData)\
-                .filter(ResearchData.topic.like(f'%{topic}%'))\
-                .order_by(ResearchData.relevance_score.desc())\
-                .limit(20).all()
+            query = full_text_query(topic)
+            if self.full_text_enabled and query:
+                # bm25 é menor para documentos mais relevantes; acerto no tópico pesa mais que no conteúdo
+                research_data = session.query(ResearchData).from_statement(text('''
+                    SELECT research_data.*
+                    FROM research_fts
+                    JOIN research_data ON research_data.id = research_fts.rowid
+                    WHERE research_fts MATCH :query
+                    ORDER BY bm25(research_fts, 10.0, 1.0), research_data.relevance_score DESC
+                    LIMIT :limit
+                ''')).params(query=query, limit=limit).all()
+            else:
+                research_data = session.query(ResearchData)\
+                    .filter(ResearchData.topic.like(f'%{topic}%'))\
+                    .order_by(ResearchData.relevance_score.desc())\
+                    .limit(limit).all()
             
             session.close()
             print(f"[OK] Dados de pesquisa recuperados: {len(research_data)} registros")
@@ -161,31 +342,57 @@ class DatabaseManager:
             print(f"[ERRO] Erro ao recuperar dados de pesquisa: {e}")
             return []
     
-    def get_analytics(self):
-        """Recupera dados para analytics"""
+    def search_interactions(self, terms, session_id=None, limit=50):
+        """Busca interações pelo texto da consulta (BM25 com FTS5; LIKE sem FTS5)"""
         try:
             session = self.Session()
+            query = full_text_query(terms)
+            if self.full_text_enabled and query:
+                sql = '''
+                    SELECT user_interactions.*
+                    FROM interactions_fts
+                    JOIN user_interactions ON user_interactions.id = interactions_fts.rowid
+                    WHERE interactions_fts MATCH :query
+                '''
+                params = {'query': query, 'limit': limit}
+                if session_id is not None:
+                    sql += " AND user_interactions.session_id = :session_id"
+                    params['session_id'] = session_id
+                sql += " ORDER BY bm25(interactions_fts) LIMIT :limit"
+                interactions = session.query(UserInteraction).from_statement(text(sql)).params(**params).all()
+            else:
+                filtered = session.query(UserInteraction)\
+                    .filter(UserInteraction.user_query.like(f'%{terms}%'))
+                if session_id is not None:
+                    filtered = filtered.filter(UserInteraction.session_id == session_id)
+                interactions = filtered.order_by(UserInteraction.timestamp.desc()).limit(limit).all()
             
-            # Contagem de interações por tipo
-            interaction_counts = session.query(
-                UserInteraction.interaction_type,
-                session.query(UserInteraction).filter(
-                    UserInteraction.interaction_type == UserInteraction.interaction_type
-                ).count()
-            ).distinct().all()
-            
-            # Total de usuários únicos (sessões)
-            unique_sessions = session.query(UserInteraction.session_id).distinct().count()
+            session.close()
+            print(f"[OK] Interações encontradas: {len(interactions)}")
+            return interactions
+        except Exception as e:
+            print(f"[ERRO] Erro ao buscar interações: {e}")
+            return []
+    
+    def get_analytics(self):
+        """Recupera dados para analytics (uma agregação sobre o rollup por tipo e hora)"""
+        try:
+            session = self.Session()
             
-            # Total de interações
-            total_interactions = session.query(UserInteraction).count()
+            # Contagens e sessões por tipo em um único GROUP BY; os totais saem da soma dos grupos
+            rows = session.query(
+                InteractionRollup.interaction_type,
+                func.sum(InteractionRollup.interaction_count),
+                func.sum(InteractionRollup.new_sessions)
+            ).group_by(InteractionRollup.interaction_type).all()
             
             session.close()
             
+            interaction_counts = {interaction_type: int(count) for interaction_type, count, _ in rows}
             return {
-                'interaction_counts': dict(interaction_counts) if interaction_counts else {},
-                'unique_sessions': unique_sessions,
-                'total_interactions': total_interactions
+                'interaction_counts': interaction_counts,
+                'unique_sessions': sum(int(new_sessions) for _, _, new_sessions in rows),
+                'total_interactions': sum(interaction_counts.values())
             }
         except Exception as e:
             print(f"[ERRO] Erro ao recuperar analytics: {e}")
@@ -237,6 +444,11 @@ def test_database():
     research = db.get_research_by_topic("diabetes")
     print(f"Dados encontrados: {len(research)} registros")
     
+    # Testar busca full-text nas interações
+    print("\n[TESTE] Testando busca nas interacoes:")
+    interactions = db.search_interactions("diabetes")
+    print(f"Interacoes encontradas: {len(interactions)} (full-text: {'sim' if db.full_text_enabled else 'nao'})")
+    
     print("\n[CONCLUIDO] TODOS OS TESTES DE DATABASE CONCLUIDOS!")
 
 # Instância global do gerenciador de banco (para Streamlit)
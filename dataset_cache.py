@@ -0,0 +1,217 @@
+"""
+Cache global de DataFrames com orçamento de memória e contadores de uso
+"""
+
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from compressed_storage import BlockFile, is_block_file, open_dataset, read_csv_filtered, stored_path
+from data_catalog import canonical_path, dataset_version
+from dataset_history import get_dataset_history
+from date_utils import DATE_FORMAT, EPOCH, add_date_columns, day_range_mask
+
+# Importações condicionais para evitar erros quando executado diretamente
+try:
+    import streamlit as st
+    STREAMLIT_AVAILABLE = True
+except ImportError:
+    STREAMLIT_AVAILABLE = False
+
+try:
+    from config import Config
+except ImportError:
+    class FallbackConfig:
+        DATASET_CACHE_MB = 512
+    Config = FallbackConfig()
+
+
+def frame_nbytes(frame):
+    """Memória real ocupada pelo DataFrame (inclui strings dos objetos)"""
+    if isinstance(frame, pd.DataFrame):
+        return int(frame.memory_usage(deep=True, index=True).sum())
+    return 0
+
+
+class DatasetCache:
+    """Cache LRU de DataFrames limitado por bytes, compartilhado pelo processo
+
+    Os frames retornados são compartilhados entre sessões e não devem ser
+    modificados no lugar; use .assign() ou .copy() antes de alterar colunas.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes or int(Config.DATASET_CACHE_MB * 1024 * 1024)
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_load(self, key, loader):
+        """Retorna o frame em cache para key ou carrega com loader() e armazena"""
+        with self._lock:
+            frame = self._entries.get(key)
+            if frame is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return frame
+            self.misses += 1
+
+        frame = loader()
+        self.put(key, frame)
+        return frame
+
+    def get(self, key):
+        """Frame em cache para key ou None (não carrega nada)"""
+        with self._lock:
+            frame = self._entries.get(key)
+            if frame is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return frame
+
+    def put(self, key, frame):
+        """Armazena o frame e remove os menos usados até caber no orçamento"""
+        size = frame_nbytes(frame)
+        if frame is None or size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._sizes.pop(key)
+                del self._entries[key]
+
+            self._entries[key] = frame
+            self._sizes[key] = size
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes and self._entries:
+                evicted_key, _ = self._entries.popitem(last=False)
+                self.current_bytes -= self._sizes.pop(evicted_key)
+                self.evictions += 1
+
+    def invalidate(self, match):
+        """Remove as entradas cuja chave satisfaz match(key); retorna quantas saíram"""
+        with self._lock:
+            keys = [key for key in self._entries if match(key)]
+            for key in keys:
+                del self._entries[key]
+                self.current_bytes -= self._sizes.pop(key)
+            return len(keys)
+
+    def get_stats(self):
+        """Métricas para dimensionar os workers"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'frames': {str(key): size for key, size in self._sizes.items()}
+            }
+
+
+def load_csv_cached(file_path, as_of=None):
+    """Lê um CSV pelo cache global, interpretando as datas uma única vez na carga
+
+    Com as_of (data/hora), retorna o conteúdo como estava naquele instante,
+    reconstruído do histórico de versões. Levanta FileNotFoundError se o
+    arquivo não existir, como pd.read_csv, e ValueError se não houver versão
+    registrada até as_of.
+    """
+    if dataset_version(file_path) is None:
+        raise FileNotFoundError(file_path)
+
+    # Caminhos com conteúdo idêntico compartilham a mesma entrada (carga única)
+    source = canonical_path(file_path)
+    version = dataset_version(source)
+
+    if as_of is not None:
+        history = get_dataset_history()
+        entry = history.version_at(source, as_of)
+        if entry is None:
+            raise ValueError(f"Nenhuma versão de {file_path} registrada até {as_of}")
+        # A versão pedida é a atual: não há o que reconstruir
+        if entry['source_version'] != version:
+            return get_dataset_cache().get_or_load(
+                (source, 'as_of', entry['source_version']),
+                lambda: add_date_columns(history.reconstruct(source, entry['version_id']))
+            )
+
+    def loader():
+        # Versão nova do arquivo: as anteriores não serão mais pedidas (as_of usa outra chave)
+        get_dataset_cache().invalidate(lambda key: len(key) == 2 and key[0] == source and key[1] != version)
+        # CSV original ou blocos comprimidos, descomprimidos em fluxo
+        with open_dataset(source) as stream:
+            frame = pd.read_csv(stream)
+        return add_date_columns(frame)
+
+    return get_dataset_cache().get_or_load((source, version), loader)
+
+
+def load_csv_filtered(file_path, start=None, end=None, states=None):
+    """Linhas de um CSV no período (datas ISO) e estados pedidos
+
+    Usa o frame completo se já estiver em cache; se o CSV estiver guardado em
+    blocos comprimidos, descomprime apenas os blocos indicados pelo índice
+    (sem colocar o arquivo inteiro em cache); caso contrário carrega pelo cache.
+    """
+    if dataset_version(file_path) is None:
+        raise FileNotFoundError(file_path)
+
+    source = canonical_path(file_path)
+    frame = get_dataset_cache().get((source, dataset_version(source)))
+    if frame is None and is_block_file(stored_path(source)):
+        start_iso = None if start is None else pd.Timestamp(start).strftime(DATE_FORMAT)
+        end_iso = None if end is None else pd.Timestamp(end).strftime(DATE_FORMAT)
+        return add_date_columns(read_csv_filtered(source, start_iso, end_iso, states))
+    if frame is None:
+        frame = load_csv_cached(file_path)
+
+    mask = pd.Series(True, index=frame.index)
+    if start is not None or end is not None:
+        mask &= day_range_mask(frame, start or EPOCH, end or frame['date'].max())
+    if states is not None and 'state' in frame.columns:
+        mask &= frame['state'].isin(list(states))
+    return frame[mask]
+
+
+def dataset_states(file_path):
+    """Estados do CSV na ordem em que aparecem, para montar filtros
+
+    Usa o frame em cache se houver; com o CSV em blocos lê só o índice
+    (nenhum bloco é descomprimido); caso contrário carrega pelo cache.
+    """
+    if dataset_version(file_path) is None:
+        raise FileNotFoundError(file_path)
+
+    source = canonical_path(file_path)
+    frame = get_dataset_cache().get((source, dataset_version(source)))
+    if frame is None and is_block_file(stored_path(source)):
+        states = BlockFile(stored_path(source)).indexed_values()
+        if states is not None:
+            return states
+    if frame is None:
+        frame = load_csv_cached(file_path)
+    return frame['state'].unique().tolist()
+
+
+# Funções de cache para Streamlit (se disponível)
+if STREAMLIT_AVAILABLE:
+    @st.cache_resource
+    def get_dataset_cache():
+        return DatasetCache()
+else:
+    _dataset_cache = None
+
+    def get_dataset_cache():
+        global _dataset_cache
+        if _dataset_cache is None:
+            _dataset_cache = DatasetCache()
+        return _dataset_cache
@@ -0,0 +1,361 @@
+"""
+Diferença entre versões de um dataset: hash por linha agrupado pela chave (data, geografia)
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+
+import numpy as np
+import pandas as pd
+
+from compressed_storage import open_dataset
+from data_catalog import dataset_version
+from date_utils import to_day_offset
+
+# Importações condicionais para evitar erros quando executado diretamente
+try:
+    import streamlit as st
+    STREAMLIT_AVAILABLE = True
+except ImportError:
+    STREAMLIT_AVAILABLE = False
+
+try:
+    from config import Config
+except ImportError:
+    class FallbackConfig:
+        DIFF_MANIFEST_DIR = 'dataset_manifests'
+    Config = FallbackConfig()
+
+# Chave de cada linha: a primeira combinação cujas colunas existem no arquivo
+KEY_CANDIDATES = [
+    ('date', 'geoid'),
+    ('date', 'state', 'county'),
+    ('date', 'state'),
+    ('date',),
+]
+
+DIFF_CHUNK_ROWS = 250_000
+
+
+def key_columns_for(columns):
+    """Colunas que identificam uma linha (data + geografia) no arquivo"""
+    for candidate in KEY_CANDIDATES:
+        if all(col in columns for col in candidate):
+            return list(candidate)
+    raise ValueError("Arquivo sem colunas de chave (date/geografia)")
+
+
+def join_columns(frame, columns):
+    """Rótulo 'col1|col2' de cada linha (funciona também para frames vazios)"""
+    values = frame[columns].astype(str)
+    first = values[columns[0]]
+    if len(columns) == 1:
+        return first
+    return first.str.cat([values[col] for col in columns[1:]], sep='|')
+
+
+def hash_rows(chunk, key_columns):
+    """(hash da chave, hash da linha inteira) de cada linha, vetorizado pelo pandas"""
+    key_hash = pd.util.hash_pandas_object(chunk[key_columns], index=False).to_numpy()
+    row_hash = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+    return key_hash, row_hash
+
+
+class RowManifest:
+    """Chaves e hashes de todas as linhas de uma versão do arquivo
+
+    Os valores são lidos como texto, então a comparação é a do conteúdo
+    publicado (sem diferenças de arredondamento de float).
+    """
+
+    def __init__(self, frame, key_columns, version=None):
+        self.frame = frame
+        self.key_columns = key_columns
+        self.version = version
+        self._digests = None
+
+    @classmethod
+    def from_csv(cls, full_path, key_columns=None, chunk_rows=DIFF_CHUNK_ROWS):
+        """Lê o CSV em blocos, guardando só a chave (categórica) e os dois hashes"""
+        parts = []
+        with open_dataset(full_path) as stream:
+            reader = pd.read_csv(stream, dtype=str, keep_default_na=False, chunksize=chunk_rows)
+            for chunk in reader:
+                if key_columns is None:
+                    key_columns = key_columns_for(chunk.columns)
+                parts.append(cls._hash_part(chunk, key_columns))
+        return cls._build(parts, key_columns, dataset_version(full_path))
+
+    @classmethod
+    def from_frame(cls, frame, key_columns=None, version=None):
+        """Manifesto de um frame já lido como texto (dtype=str, sem NaN)"""
+        key_columns = key_columns or key_columns_for(frame.columns)
+        return cls._build([cls._hash_part(frame, key_columns)], key_columns, version)
+
+    @staticmethod
+    def _hash_part(chunk, key_columns):
+        key_hash, row_hash = hash_rows(chunk, key_columns)
+        part = chunk[key_columns].copy()
+        part['key_hash'] = key_hash
+        part['row_hash'] = row_hash
+        return part
+
+    @classmethod
+    def _build(cls, parts, key_columns, version):
+        frame = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(
+            columns=(key_columns or []) + ['key_hash', 'row_hash'])
+        for col in key_columns or []:
+            frame[col] = frame[col].astype('category')
+
+        # Chaves repetidas no arquivo: a ordem de ocorrência entra no hash
+        occurrence = frame.groupby('key_hash', sort=False).cumcount().to_numpy(dtype=np.uint64)
+        if occurrence.any():
+            frame['key_hash'] = frame['key_hash'].to_numpy() + occurrence * np.uint64(0x9E3779B97F4A7C15)
+        return cls(frame, key_columns or [], version)
+
+    @property
+    def geography_columns(self):
+        return [col for col in self.key_columns if col != 'date']
+
+    def geography_digests(self):
+        """Resumo do conteúdo de cada geografia (soma dos hashes, independente da ordem)"""
+        if self._digests is None:
+            if self.frame.empty:
+                self._digests = pd.Series(dtype=object)
+                return self._digests
+            if self.geography_columns:
+                codes = self.frame.groupby(self.geography_columns, observed=True, sort=False).ngroup().to_numpy()
+            else:
+                codes = np.zeros(len(self.frame), dtype=np.int64)
+
+            order = np.argsort(codes, kind='stable')
+            sorted_codes = codes[order]
+            starts = np.flatnonzero(np.diff(sorted_codes, prepend=-1))
+            # Soma em uint64 com estouro intencional (módulo 2^64)
+            sums = np.add.reduceat(self.frame['row_hash'].to_numpy()[order], starts)
+            counts = np.diff(np.append(starts, len(order)))
+
+            labels = self._geography_labels(order[starts])
+            self._digests = pd.Series([f"{s:016x}-{c}" for s, c in zip(sums, counts)], index=labels)
+        return self._digests
+
+    def _geography_labels(self, rows):
+        if not self.geography_columns:
+            return ['']
+        return join_columns(self.frame.iloc[rows], self.geography_columns).tolist()
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'wb') as target:
+            pickle.dump({'frame': self.frame, 'key_columns': self.key_columns, 'version': self.version}, target)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as source:
+            state = pickle.load(source)
+        return cls(state['frame'], state['key_columns'], state['version'])
+
+
+class DatasetDiff:
+    """Chaves inseridas, alteradas e removidas entre duas versões"""
+
+    def __init__(self, inserted, updated, deleted, key_columns, old_version=None, new_version=None):
+        self.inserted = inserted
+        self.updated = updated
+        self.deleted = deleted
+        self.key_columns = key_columns
+        self.old_version = old_version
+        self.new_version = new_version
+
+    @property
+    def is_empty(self):
+        return self.inserted.empty and self.updated.empty and self.deleted.empty
+
+    def changed_keys(self):
+        """Todas as chaves afetadas, com o tipo de mudança"""
+        return pd.concat([
+            self.inserted.assign(change='inserted'),
+            self.updated.assign(change='updated'),
+            self.deleted.assign(change='deleted')
+        ], ignore_index=True)
+
+    def changed_geographies(self):
+        """Geografias com qualquer linha inserida, alterada ou removida"""
+        geography_columns = [col for col in self.key_columns if col != 'date']
+        if not geography_columns:
+            return [] if self.is_empty else ['']
+        changed = self.changed_keys()
+        return sorted(join_columns(changed, geography_columns).unique())
+
+    def first_changed_day(self):
+        """Menor dia com qualquer mudança (deslocamento em dias), ou None se nada mudou"""
+        if 'date' not in self.key_columns or self.is_empty:
+            return None
+        return to_day_offset(self.changed_keys()['date'].min())
+
+    def summary(self):
+        return {
+            'inserted': len(self.inserted),
+            'updated': len(self.updated),
+            'deleted': len(self.deleted),
+            'geographies': len(self.changed_geographies())
+        }
+
+
+def diff_masks(old, new):
+    """Máscaras (nova encontrada na antiga, nova alterada, antiga removida) por busca binária nos hashes"""
+    if old.key_columns != new.key_columns:
+        raise ValueError("Versões com colunas de chave diferentes não podem ser comparadas")
+
+    old_keys = old.frame['key_hash'].to_numpy()
+    new_keys = new.frame['key_hash'].to_numpy()
+    order = np.argsort(old_keys)
+    sorted_keys = old_keys[order]
+
+    position = np.minimum(np.searchsorted(sorted_keys, new_keys), max(len(sorted_keys) - 1, 0))
+    if len(sorted_keys):
+        found = sorted_keys[position] == new_keys
+        old_rows = order[position]
+        changed = found & (old.frame['row_hash'].to_numpy()[old_rows] != new.frame['row_hash'].to_numpy())
+    else:
+        found = np.zeros(len(new_keys), dtype=bool)
+        changed = found
+
+    deleted = ~np.isin(old_keys, new_keys)
+    return found, changed, deleted
+
+
+def diff_manifests(old, new):
+    """Compara dois manifestos pelas chaves (sem junção de frames)"""
+    found, changed, deleted = diff_masks(old, new)
+    key_columns = new.key_columns
+
+    def keys_at(manifest, mask):
+        return manifest.frame.loc[mask, key_columns].astype(str).reset_index(drop=True)
+
+    return DatasetDiff(
+        inserted=keys_at(new, ~found),
+        updated=keys_at(new, changed),
+        deleted=keys_at(old, deleted),
+        key_columns=key_columns,
+        old_version=old.version,
+        new_version=new.version
+    )
+
+
+def diff_files(old_path, new_path, key_columns=None):
+    """Diferença entre dois arquivos CSV (ex.: cópia anterior e arquivo baixado)"""
+    old = RowManifest.from_csv(old_path, key_columns)
+    return diff_manifests(old, RowManifest.from_csv(new_path, old.key_columns))
+
+
+def manifest_path(full_path, manifest_dir=None):
+    """Arquivo do manifesto persistido para um CSV"""
+    name = hashlib.sha1(os.path.abspath(full_path).encode('utf-8')).hexdigest()[:16]
+    base = os.path.splitext(os.path.basename(full_path))[0]
+    return os.path.join(manifest_dir or Config.DIFF_MANIFEST_DIR, f"{base}-{name}.pkl")
+
+
+class ChangeTracker:
+    """Manifesto atual de cada arquivo e a diferença em relação à versão anterior vista
+
+    O manifesto é persistido, então a comparação também vale entre execuções
+    (ex.: antes e depois do download).
+    """
+
+    def __init__(self, manifest_dir=None):
+        self.manifest_dir = manifest_dir or Config.DIFF_MANIFEST_DIR
+        self._manifests = {}
+        self._diffs = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, full_path):
+        """Atualiza o manifesto se o arquivo mudou; retorna a diferença da última mudança (ou None)"""
+        full_path = os.path.abspath(full_path)
+        version = dataset_version(full_path)
+        if version is None:
+            return None
+
+        with self._lock:
+            current = self._manifests.get(full_path)
+            if current is not None and current.version == version:
+                return self._diffs.get(full_path)
+
+            stored_path = manifest_path(full_path, self.manifest_dir)
+            if current is None and os.path.exists(stored_path):
+                try:
+                    current = RowManifest.load(stored_path)
+                except Exception as e:
+                    print(f"[ERRO] Manifesto inválido para {full_path}: {e}")
+                    current = None
+                if current is not None and current.version == version:
+                    self._manifests[full_path] = current
+                    return self._diffs.get(full_path)
+
+            manifest = RowManifest.from_csv(full_path)
+            diff = None
+            if current is not None:
+                try:
+                    diff = diff_manifests(current, manifest)
+                    print(f"[OK] Diferenças em {os.path.basename(full_path)}: {diff.summary()}")
+                except ValueError as e:
+                    print(f"[ERRO] {e}")
+
+            manifest.save(stored_path)
+            self._manifests[full_path] = manifest
+            self._diffs[full_path] = diff
+            return diff
+
+    def manifest(self, full_path):
+        self.refresh(full_path)
+        return self._manifests.get(os.path.abspath(full_path))
+
+    def selection_version(self, full_path, geographies=None):
+        """Versão que só muda quando mudam as linhas das geografias escolhidas
+
+        Usada nas chaves de cache: uma atualização que não toca essas
+        geografias mantém válidos os gráficos e agregados delas.
+        """
+        manifest = self.manifest(full_path)
+        if manifest is None:
+            return None
+        if not geographies:
+            return manifest.version
+
+        digests = manifest.geography_digests()
+        selected = sorted(str(geography) for geography in geographies)
+        parts = [f"{geography}={digests.get(geography, '')}" for geography in selected]
+        return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+# Funções de cache para Streamlit (se disponível)
+if STREAMLIT_AVAILABLE:
+    @st.cache_resource
+    def get_change_tracker():
+        return ChangeTracker()
+else:
+    _change_tracker = None
+
+    def get_change_tracker():
+        global _change_tracker
+        if _change_tracker is None:
+            _change_tracker = ChangeTracker()
+        return _change_tracker
+
+
+# Relatório de diferenças quando chamado diretamente: python dataset_diff.py antigo.csv novo.csv
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        print("Uso: python dataset_diff.py <versão antiga.csv> <versão nova.csv>")
+        sys.exit(1)
+
+    result = diff_files(sys.argv[1], sys.argv[2])
+    print("DIFERENÇAS ENTRE VERSÕES")
+    print("=" * 50)
+    for name, count in result.summary().items():
+        print(f"  - {name}: {count}")
+    print(result.changed_keys().head(20).to_string(index=False))
@@ -0,0 +1,239 @@
+"""
+Histórico de versões dos datasets: base + deltas por atualização e consultas "como era em" (as_of)
+"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from compressed_storage import open_dataset, stored_path
+from data_catalog import dataset_version
+from dataset_diff import RowManifest, diff_masks
+
+# Importações condicionais para evitar erros quando executado diretamente
+try:
+    import streamlit as st
+    STREAMLIT_AVAILABLE = True
+except ImportError:
+    STREAMLIT_AVAILABLE = False
+
+try:
+    from config import Config
+except ImportError:
+    class FallbackConfig:
+        HISTORY_DIR = 'dataset_history'
+    Config = FallbackConfig()
+
+LOG_FILE = 'log.json'
+MANIFEST_FILE = 'manifest.pkl'
+
+
+def history_dir_for(full_path, history_dir=None):
+    """Diretório do histórico de um CSV"""
+    name = hashlib.sha1(os.path.abspath(full_path).encode('utf-8')).hexdigest()[:16]
+    base = os.path.splitext(os.path.basename(full_path))[0]
+    return os.path.join(history_dir or Config.HISTORY_DIR, f"{base}-{name}")
+
+
+def _parse_timestamp(value):
+    return pd.Timestamp(value).to_pydatetime().replace(tzinfo=None)
+
+
+class DatasetHistory:
+    """Versões registradas de cada CSV: a primeira completa, as seguintes só com o delta
+
+    Cada delta guarda as linhas inseridas ou alteradas (texto original) e os
+    hashes das chaves removidas. A reconstrução de uma versão decodifica a
+    base uma vez (fica em cache) e aplica o efeito líquido dos deltas até ela,
+    decodificando só as linhas desses deltas.
+    """
+
+    def __init__(self, history_dir=None):
+        self.history_dir = history_dir or Config.HISTORY_DIR
+        self._lock = threading.Lock()
+        self._bases = {}
+
+    def _directory(self, full_path):
+        return history_dir_for(full_path, self.history_dir)
+
+    def versions(self, full_path):
+        """Lista de versões registradas (dicts com version_id, recorded_at, contagens)"""
+        log_path = os.path.join(self._directory(full_path), LOG_FILE)
+        if not os.path.exists(log_path):
+            return []
+        with open(log_path, encoding='utf-8') as source:
+            return json.load(source)
+
+    def _write_log(self, directory, log):
+        temp_path = os.path.join(directory, LOG_FILE + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as target:
+            json.dump(log, target, ensure_ascii=False, indent=1)
+        os.replace(temp_path, os.path.join(directory, LOG_FILE))
+
+    def record(self, full_path):
+        """Registra a versão atual do arquivo se ela ainda não estiver no histórico
+
+        Retorna o registro criado ou None se a versão já era conhecida. Levanta
+        ValueError para arquivos sem chave data/geografia.
+        """
+        full_path = os.path.abspath(full_path)
+        version = dataset_version(full_path)
+        if version is None:
+            raise FileNotFoundError(full_path)
+
+        with self._lock:
+            directory = self._directory(full_path)
+            log = self.versions(full_path)
+            if log and log[-1]['source_version'] == version:
+                return None
+
+            with open_dataset(full_path) as stream:
+                frame = pd.read_csv(stream, dtype=str, keep_default_na=False)
+            manifest = RowManifest.from_frame(frame, version=version)
+            frame['key_hash'] = manifest.frame['key_hash'].to_numpy()
+
+            # Momento em que a atualização chegou ao disco
+            written_at = datetime.fromtimestamp(os.path.getmtime(stored_path(full_path)))
+            entry = {
+                'version_id': len(log),
+                'recorded_at': written_at.isoformat(timespec='seconds'),
+                'source_version': version,
+                'rows': len(frame),
+                'key_columns': manifest.key_columns,
+                'columns': [col for col in frame.columns if col != 'key_hash']
+            }
+            version_file = os.path.join(directory, f"v{entry['version_id']:04d}.pkl.gz")
+
+            os.makedirs(directory, exist_ok=True)
+            # Primeira versão ou mudança de colunas: nova base completa
+            if not log or log[-1]['columns'] != entry['columns'] or log[-1]['key_columns'] != entry['key_columns']:
+                frame.to_pickle(version_file, compression='gzip')
+                entry.update(kind='base', inserted=len(frame), updated=0, deleted=0)
+            else:
+                previous = RowManifest.load(os.path.join(directory, MANIFEST_FILE))
+                found, changed, deleted = diff_masks(previous, manifest)
+                delta = {
+                    'upserts': frame[~found | changed],
+                    'deleted': previous.frame['key_hash'].to_numpy()[deleted]
+                }
+                pd.to_pickle(delta, version_file, compression='gzip')
+                entry.update(kind='delta', inserted=int((~found).sum()), updated=int(changed.sum()),
+                             deleted=int(deleted.sum()))
+
+            manifest.save(os.path.join(directory, MANIFEST_FILE))
+            log.append(entry)
+            self._write_log(directory, log)
+            print(f"[OK] Versão {entry['version_id']} de {os.path.basename(full_path)} registrada: "
+                  f"{entry['inserted']} inseridas, {entry['updated']} alteradas, {entry['deleted']} removidas")
+            return entry
+
+    def version_at(self, full_path, as_of):
+        """Última versão registrada até o instante as_of (ou None se não houver)"""
+        as_of = _parse_timestamp(as_of)
+        selected = None
+        for entry in self.versions(full_path):
+            if _parse_timestamp(entry['recorded_at']) <= as_of:
+                selected = entry
+        return selected
+
+    def _decoded_base(self, directory, log, base_id):
+        """Base com os tipos de pd.read_csv, ordenada pela chave, decodificada uma vez por base
+
+        Fica em memória só a base mais recente pedida de cada arquivo.
+        """
+        with self._lock:
+            cached = self._bases.get(directory)
+            if cached is not None and cached[0] == base_id:
+                return cached[1]
+
+        base = pd.read_pickle(os.path.join(directory, f"v{base_id:04d}.pkl.gz"), compression='gzip')
+        base = _decode(base).sort_values(log[base_id]['key_columns'], kind='stable', ignore_index=True)
+
+        with self._lock:
+            self._bases[directory] = (base_id, base)
+        return base
+
+    def reconstruct(self, full_path, version_id):
+        """Frame da versão pedida (mesmos tipos de pd.read_csv, ordenado pela chave)
+
+        A base decodificada fica em cache; cada chamada só decodifica as linhas
+        dos deltas até a versão e as aplica sobre ela.
+        """
+        directory = self._directory(full_path)
+        log = self.versions(full_path)
+        if version_id >= len(log):
+            raise ValueError(f"Versão {version_id} não registrada para {full_path}")
+
+        # Base completa mais recente até a versão pedida e os deltas depois dela
+        base_id = max(entry['version_id'] for entry in log[:version_id + 1] if entry['kind'] == 'base')
+        base = self._decoded_base(directory, log, base_id)
+
+        if version_id > base_id:
+            # Efeito líquido dos deltas: vale a última operação de cada chave
+            upserts, removals = [], []
+            for number in range(base_id + 1, version_id + 1):
+                delta = pd.read_pickle(os.path.join(directory, f"v{number:04d}.pkl.gz"), compression='gzip')
+                upserts.append(delta['upserts'].assign(_order=number))
+                removals.append(pd.DataFrame({'key_hash': delta['deleted'], '_order': number, '_deleted': True}))
+
+            changes = pd.concat(upserts + removals, ignore_index=True)
+            changes['_deleted'] = changes['_deleted'].fillna(False).astype(bool)
+            changes = changes.sort_values('_order', kind='stable').drop_duplicates('key_hash', keep='last')
+
+            touched = changes['key_hash'].to_numpy()
+            kept = base[~np.isin(base['key_hash'].to_numpy(), touched)]
+            current = changes[~changes['_deleted']].drop(columns=['_order', '_deleted'])
+            # Colunas de texto da base continuam texto nas linhas novas (zeros à esquerda etc.)
+            text_columns = [col for col in base.columns
+                            if col != 'key_hash' and not pd.api.types.is_numeric_dtype(base[col])]
+            current = _decode(current[list(base.columns)], text_columns)
+            base = pd.concat([kept, current], ignore_index=True).sort_values(
+                log[base_id]['key_columns'], kind='stable', ignore_index=True
+            )
+
+        return base.drop(columns=['key_hash'])
+
+
+def _decode(frame, text_columns=()):
+    """Converte um frame lido como texto para os tipos que pd.read_csv daria (key_hash preservado)"""
+    text = frame.drop(columns=['key_hash']).to_csv(index=False)
+    decoded = pd.read_csv(io.StringIO(text), dtype={col: str for col in text_columns})
+    decoded['key_hash'] = frame['key_hash'].to_numpy()
+    return decoded
+
+
+# Funções de cache para Streamlit (se disponível)
+if STREAMLIT_AVAILABLE:
+    @st.cache_resource
+    def get_dataset_history():
+        return DatasetHistory()
+else:
+    _dataset_history = None
+
+    def get_dataset_history():
+        global _dataset_history
+        if _dataset_history is None:
+            _dataset_history = DatasetHistory()
+        return _dataset_history
+
+
+# Registro das versões atuais do catálogo quando chamado diretamente
+if __name__ == "__main__":
+    from data_catalog import unique_catalog_files
+
+    history = DatasetHistory()
+    print("REGISTRANDO VERSÕES DO CATÁLOGO...")
+    print("=" * 50)
+    for file_path, entry in unique_catalog_files().items():
+        try:
+            history.record(entry['full_path'])
+        except ValueError:
+            continue
+        versions = history.versions(entry['full_path'])
+        print(f"  - {file_path}: {len(versions)} versões registradas")
@@ -0,0 +1,66 @@
+"""
+Tratamento de datas dos datasets: parsing único na carga e deslocamento inteiro em dias
+"""
+
+import numpy as np
+import pandas as pd
+
+# Primeiro dia da série do NY Times
+EPOCH = pd.Timestamp('2020-01-21')
+DATE_FORMAT = '%Y-%m-%d'
+DAY_COLUMN = 'day_offset'
+
+
+def to_day_offset(value):
+    """Converte data/datetime/string ISO em dias desde 2020-01-21"""
+    return int((pd.Timestamp(value).normalize() - EPOCH).days)
+
+
+def from_day_offset(offset):
+    """Converte o deslocamento inteiro de volta para Timestamp"""
+    return EPOCH + pd.Timedelta(days=int(offset))
+
+
+def add_date_columns(frame, column='date'):
+    """Interpreta a coluna de datas no formato ISO e adiciona o deslocamento em dias
+
+    Deve ser chamado uma única vez, logo após a leitura do CSV. O deslocamento
+    usa int16 (cobre ~89 anos a partir de 2020) e cai para Int16 anulável
+    quando existem datas inválidas.
+    """
+    if column not in frame.columns:
+        return frame
+
+    if not pd.api.types.is_datetime64_any_dtype(frame[column]):
+        parsed = pd.to_datetime(frame[column], format=DATE_FORMAT, errors='coerce')
+        # Datas fora do padrão ISO (ex.: com horário) recebem o parser genérico
+        if parsed.isna().any() and frame[column].notna().any():
+            retry = parsed.isna() & frame[column].notna()
+            parsed[retry] = pd.to_datetime(frame.loc[retry, column], errors='coerce')
+        frame[column] = parsed
+
+    days = (frame[column] - EPOCH).dt.days
+    if days.isna().any():
+        frame[DAY_COLUMN] = days.astype('Int16')
+    else:
+        frame[DAY_COLUMN] = days.to_numpy(dtype=np.int16)
+    return frame
+
+
+def day_range_mask(frame, start, end):
+    """Máscara booleana para start <= data <= end usando comparação de inteiros"""
+    if DAY_COLUMN in frame.columns:
+        offsets = frame[DAY_COLUMN]
+    else:
+        offsets = (pd.to_datetime(frame['date'], errors='coerce') - EPOCH).dt.days
+    return (offsets >= to_day_offset(start)) & (offsets <= to_day_offset(end))
+
+
+def format_date_range(frame):
+    """Texto 'YYYY-MM-DD a YYYY-MM-DD' a partir do menor e maior deslocamento"""
+    if DAY_COLUMN not in frame.columns or frame[DAY_COLUMN].isna().all():
+        return "N/A"
+
+    first = from_day_offset(frame[DAY_COLUMN].min())
+    last = from_day_offset(frame[DAY_COLUMN].max())
+    return f"{first.strftime(DATE_FORMAT)} a {last.strftime(DATE_FORMAT)}"
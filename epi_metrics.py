@@ -0,0 +1,230 @@
+"""
+Número de reprodução efetivo (Rt) e tempo de duplicação para todas as geografias
+"""
+
+import math
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from date_utils import DAY_COLUMN
+from forecasting import get_forecast_engine
+from weekday import adjust_weekday_effect
+
+# Importações condicionais para evitar erros quando executado diretamente
+try:
+    import streamlit as st
+    STREAMLIT_AVAILABLE = True
+except ImportError:
+    STREAMLIT_AVAILABLE = False
+
+try:
+    from config import Config
+except ImportError:
+    class FallbackConfig:
+        ANALYTICS_DB_PATH = 'saudeja_analytics.db'
+    Config = FallbackConfig()
+
+# Intervalo serial da COVID-19 (gama, média 4.7 e desvio 2.9 dias)
+SERIAL_INTERVAL_MEAN = 4.7
+SERIAL_INTERVAL_SD = 2.9
+SERIAL_INTERVAL_DAYS = 14
+
+# Janela (dias) das somas do estimador de Rt e do crescimento para duplicação
+RT_WINDOW = 7
+# Abaixo desta pressão de infecção acumulada na janela, Rt não é informado
+MIN_INFECTION_PRESSURE = 12.0
+# Priori gama do estimador (forma a, escala b)
+RT_PRIOR_SHAPE = 1.0
+RT_PRIOR_SCALE = 5.0
+
+# Tabelas derivadas gravadas no banco SQL junto com os CSVs carregados
+DERIVED_TABLES = {
+    'state': 'derived_state_metrics',
+    'county': 'derived_county_metrics',
+}
+# Incrementar quando as colunas das tabelas derivadas mudarem (força nova gravação)
+DERIVED_REVISION = 2
+
+
+def serial_interval_kernel(mean=SERIAL_INTERVAL_MEAN, sd=SERIAL_INTERVAL_SD, max_days=SERIAL_INTERVAL_DAYS):
+    """Pesos w_1..w_max do intervalo serial discretizado (soma 1)"""
+    shape = (mean / sd) ** 2
+    scale = sd ** 2 / mean
+    days = np.arange(1, max_days + 1, dtype=float)
+    log_pdf = ((shape - 1) * np.log(days) - days / scale
+               - math.lgamma(shape) - shape * math.log(scale))
+    weights = np.exp(log_pdf)
+    return weights / weights.sum()
+
+
+def infection_pressure(incidence, kernel):
+    """Λ_t = Σ_s w_s · I_{t-s}, convolução causal aplicada a todas as linhas de uma vez"""
+    pressure = np.zeros_like(incidence)
+    for lag, weight in enumerate(kernel, start=1):
+        pressure[:, lag:] += weight * incidence[:, :-lag]
+    return pressure
+
+
+def _window_sum(values, window):
+    csum = np.cumsum(values, axis=1)
+    result = csum.copy()
+    result[:, window:] = csum[:, window:] - csum[:, :-window]
+    return result
+
+
+def estimate_rt(incidence, kernel=None, window=RT_WINDOW):
+    """Média a posteriori de Rt (método de Cori) em janelas de `window` dias
+
+    incidence: matriz geografia × dia de novos casos (já suavizada). Retorna
+    NaN onde a pressão de infecção da janela é pequena demais.
+    """
+    if kernel is None:
+        kernel = serial_interval_kernel()
+    pressure = _window_sum(infection_pressure(incidence, kernel), window)
+    cases = _window_sum(incidence, window)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rt = (RT_PRIOR_SHAPE + cases) / (1 / RT_PRIOR_SCALE + pressure)
+    rt[pressure < MIN_INFECTION_PRESSURE] = np.nan
+    return rt
+
+
+def doubling_time(avg, window=RT_WINDOW):
+    """Dias para dobrar a média móvel no ritmo dos últimos `window` dias (NaN se não cresce)"""
+    log_avg = np.log(np.maximum(avg, 1e-9))
+    growth = np.full(avg.shape, np.nan)
+    growth[:, window:] = (log_avg[:, window:] - log_avg[:, :-window]) / window
+    # Sem casos na ponta da janela a taxa não é definida
+    growth[:, window:][(avg[:, window:] <= 0) | (avg[:, :-window] <= 0)] = np.nan
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(growth > 0, math.log(2) / growth, np.nan)
+
+
+def derived_frame(geography='state', metric='cases'):
+    """Séries derivadas no formato longo: key, date, day_offset, daily, daily_adjusted,
+    weekday_factor, avg_7d, rt, doubling_time
+
+    Omite os dias anteriores ao primeiro registro de cada geografia.
+    """
+    engine = get_forecast_engine()
+    daily_matrix, _ = engine.daily_counts(geography, metric)
+    avg_matrix, version = engine.daily_average(geography, metric)
+    if avg_matrix is None:
+        return pd.DataFrame(), None
+
+    avg = avg_matrix.values
+    adjusted, factors = adjust_weekday_effect(daily_matrix.values, daily_matrix.start_offset)
+
+    frame = daily_matrix.to_frame('daily')
+    frame['daily_adjusted'] = adjusted.reshape(-1)
+    frame['weekday_factor'] = factors.reshape(-1)
+    frame['avg_7d'] = avg.reshape(-1)
+    frame['rt'] = estimate_rt(avg).reshape(-1)
+    frame['doubling_time'] = doubling_time(avg).reshape(-1)
+
+    started = np.maximum.accumulate(avg > 0, axis=1).reshape(-1)
+    frame = frame[started].reset_index(drop=True)
+
+    if geography == 'county':
+        # Chaves já são texto: fips com 5 dígitos ou 'Estado|Condado' para linhas sem fips
+        frame['key'] = frame['key'].astype(str)
+    return frame, version
+
+
+def derived_version(source_version, revision):
+    """Versão registrada para uma tabela derivada: versão da origem + revisão do formato"""
+    return f"{source_version}/r{revision}"
+
+
+def stored_derived_version(table, db_path=None):
+    """Versão da origem registrada no _ingest_log para uma tabela derivada (ou None)"""
+    try:
+        conn = sqlite3.connect(db_path or Config.ANALYTICS_DB_PATH)
+        try:
+            row = conn.execute('SELECT version FROM _ingest_log WHERE source_file = ?',
+                               (f"derived:{table}",)).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
+
+def read_derived_table(table, where='', params=(), db_path=None):
+    """Lê uma tabela derivada do banco SQL (where opcional com parâmetros)"""
+    sql = f'SELECT * FROM "{table}"'
+    if where:
+        sql += f' WHERE {where}'
+    conn = sqlite3.connect(db_path or Config.ANALYTICS_DB_PATH)
+    try:
+        return pd.read_sql_query(sql, conn, params=list(params))
+    finally:
+        conn.close()
+
+
+class DerivedSeriesStore:
+    """Leitura das séries derivadas gravadas na ingestão, com cálculo em memória de reserva"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or Config.ANALYTICS_DB_PATH
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def series(self, geography='state', keys=None, last_days=None):
+        """Séries derivadas das geografias pedidas (todas se keys=None)"""
+        avg_matrix, version = get_forecast_engine().daily_average(geography, 'cases')
+        if avg_matrix is None:
+            return pd.DataFrame()
+
+        stored = stored_derived_version(DERIVED_TABLES[geography], self.db_path)
+        if stored == derived_version(version, DERIVED_REVISION):
+            return self._read_table(geography, keys, avg_matrix, last_days)
+
+        # Ingestão ainda não rodou para esta versão: calcula uma vez e guarda em memória
+        with self._lock:
+            cached = self._frames.get(geography)
+            if cached is None or cached[0] != version:
+                frame, _ = derived_frame(geography)
+                cached = (version, frame)
+                self._frames[geography] = cached
+        frame = cached[1]
+
+        if keys is not None:
+            frame = frame[frame['key'].isin(list(keys))]
+        if last_days:
+            first_day = avg_matrix.start_offset + avg_matrix.n_days - last_days
+            frame = frame[frame[DAY_COLUMN] >= first_day]
+        return frame
+
+    def _read_table(self, geography, keys, avg_matrix, last_days):
+        conditions, params = [], []
+        if keys is not None:
+            keys = list(keys)
+            conditions.append(f"key IN ({', '.join('?' * len(keys))})")
+            params.extend(keys)
+        if last_days:
+            conditions.append(f"{DAY_COLUMN} >= ?")
+            params.append(avg_matrix.start_offset + avg_matrix.n_days - last_days)
+
+        frame = read_derived_table(DERIVED_TABLES[geography], ' AND '.join(conditions), params, self.db_path)
+        frame['date'] = pd.to_datetime(frame['date'])
+        return frame
+
+
+# Funções de cache para Streamlit (se disponível)
+if STREAMLIT_AVAILABLE:
+    @st.cache_resource
+    def get_derived_store():
+        return DerivedSeriesStore()
+else:
+    _derived_store = None
+
+    def get_derived_store():
+        global _derived_store
+        if _derived_store is None:
+            _derived_store = DerivedSeriesStore()
+        return _derived_store
@@ -0,0 +1,134 @@
+"""
+Exportações de datasets geradas sob demanda, comprimidas (gzip) em disco e em cache por versão
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from compressed_storage import open_dataset
+from data_catalog import canonical_path, dataset_version
+
+# Importações condicionais para evitar erros quando executado diretamente
+try:
+    import streamlit as st
+    STREAMLIT_AVAILABLE = True
+except ImportError:
+    STREAMLIT_AVAILABLE = False
+
+try:
+    from config import Config
+except ImportError:
+    class FallbackConfig:
+        EXPORT_CACHE_MB = 128
+        EXPORT_DIR = 'dataset_exports'
+    Config = FallbackConfig()
+
+EXPORT_CHUNK_BYTES = 1024 * 1024
+
+
+def iter_file_chunks(full_path, chunk_size=EXPORT_CHUNK_BYTES):
+    """Lê o arquivo (descomprimido, se armazenado em blocos) em pedaços de tamanho fixo"""
+    with open_dataset(full_path) as source:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def compress_file(full_path, target_path, chunk_size=EXPORT_CHUNK_BYTES):
+    """Comprime o arquivo em gzip direto no disco, um bloco por vez (memória = um bloco)
+
+    Grava num temporário e renomeia no fim, então target_path nunca fica pela metade.
+    Retorna o tamanho do arquivo gzip.
+    """
+    tmp_path = f"{target_path}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as raw, \
+                gzip.GzipFile(filename=os.path.basename(full_path), mode='wb', fileobj=raw, compresslevel=6) as gz:
+            for chunk in iter_file_chunks(full_path, chunk_size):
+                gz.write(chunk)
+        os.replace(tmp_path, target_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return os.path.getsize(target_path)
+
+
+class ExportCache:
+    """Exportações gzip por arquivo e versão guardadas em disco (LRU limitado em bytes)
+
+    O arquivo é comprimido em blocos direto para EXPORT_DIR e entregue ao
+    st.download_button como arquivo aberto, então o processo nunca monta o
+    CSV inteiro em memória. O st.download_button não transmite em streaming:
+    ele lê o arquivo recebido para o seu gerenciador de mídia, então o pico
+    por download é o tamanho do gzip, não o do CSV.
+    """
+
+    def __init__(self, export_dir=None, max_bytes=None):
+        self.export_dir = export_dir or Config.EXPORT_DIR
+        self.max_bytes = max_bytes or int(Config.EXPORT_CACHE_MB * 1024 * 1024)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        os.makedirs(self.export_dir, exist_ok=True)
+
+    def _export_path(self, source, version):
+        name = os.path.basename(source).replace('.', '_')
+        digest = hashlib.sha1(source.encode('utf-8')).hexdigest()[:8]
+        return os.path.join(self.export_dir, f"{name}-{digest}-{version}.csv.gz")
+
+    def _discard(self, key):
+        path, size = self._entries.pop(key)
+        self.current_bytes -= size
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def get_export(self, full_path):
+        """Caminho do gzip do arquivo, comprimindo apenas na primeira solicitação da versão"""
+        # Duplicatas de conteúdo reaproveitam a mesma exportação
+        source = canonical_path(full_path)
+        key = (source, dataset_version(source))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and os.path.exists(entry[0]):
+                self._entries.move_to_end(key)
+                return entry[0]
+
+        path = self._export_path(*key)
+        if not os.path.exists(path):
+            compress_file(full_path, path)
+        size = os.path.getsize(path)
+
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+            # Versões antigas do mesmo arquivo não serão pedidas de novo
+            for old_key in [k for k in self._entries if k[0] == source]:
+                self._discard(old_key)
+            self._entries[key] = (path, size)
+            self.current_bytes += size
+            # A exportação pedida agora nunca é removida, mesmo acima do limite
+            while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+                self._discard(next(iter(self._entries)))
+        return path
+
+
+# Funções de cache para Streamlit (se disponível)
+if STREAMLIT_AVAILABLE:
+    @st.cache_resource
+    def get_export_cache():
+        return ExportCache()
+else:
+    _export_cache = None
+
+    def get_export_cache():
+        global _export_cache
+        if _export_cache is None:
+            _export_cache = ExportCache()
+        return _export_cache
@@ -0,0 +1,133 @@
+"""
+Cache de figuras Plotly serializadas, compartilhado entre sessões
+"""
+
+import json
+import threading
+from collections import OrderedDict
+
+# Importações condicionais para evitar erros quando executado diretamente
+try:
+    import streamlit as st
+    STREAMLIT_AVAILABLE = True
+except ImportError:
+    STREAMLIT_AVAILABLE = False
+
+try:
+    from config import Config
+except ImportError:
+    class FallbackConfig:
+        FIGURE_CACHE_MB = 64
+    Config = FallbackConfig()
+
+
+def _normalize_date(value):
+    """Datas, timestamps e strings viram 'YYYY-MM-DD' para a chave"""
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d')
+    return str(value)[:10]
+
+
+class FigureCache:
+    """Cache LRU limitado em bytes para o JSON das figuras Plotly"""
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes or int(Config.FIGURE_CACHE_MB * 1024 * 1024)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(dataset_version, selection=None, date_range=None, chart_type=None):
+        """Chave normalizada: versão do dataset, seleção ordenada, período e tipo de gráfico"""
+        if selection is None:
+            selection_key = ()
+        elif isinstance(selection, (list, tuple, set)):
+            selection_key = tuple(sorted(str(item) for item in selection))
+        else:
+            selection_key = (str(selection),)
+
+        if date_range is None:
+            date_key = ()
+        elif isinstance(date_range, (list, tuple)):
+            date_key = tuple(_normalize_date(value) for value in date_range)
+        else:
+            date_key = (_normalize_date(date_range),)
+
+        return (str(dataset_version), selection_key, date_key, str(chart_type))
+
+    def get(self, key):
+        """Retorna o JSON da figura ou None, marcando a entrada como recente"""
+        with self._lock:
+            fig_json = self._entries.get(key)
+            if fig_json is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return fig_json
+
+    def put(self, key, fig_json):
+        """Armazena o JSON e remove as entradas menos usadas acima do limite"""
+        size = len(fig_json)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= len(previous)
+
+            self._entries[key] = fig_json
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+                self.evictions += 1
+
+    def get_or_build(self, key, builder):
+        """Retorna a figura (dict) do cache ou constrói com builder() e armazena"""
+        fig_json = self.get(key)
+        if fig_json is None:
+            fig = builder()
+            if fig is None:
+                return None
+            fig_json = fig.to_json()
+            self.put(key, fig_json)
+        return json.loads(fig_json)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def get_stats(self):
+        """Métricas do cache para dimensionamento"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+# Funções de cache para Streamlit (se disponível)
+if STREAMLIT_AVAILABLE:
+    @st.cache_resource
+    def get_figure_cache():
+        return FigureCache()
+else:
+    _figure_cache = None
+
+    def get_figure_cache():
+        global _figure_cache
+        if _figure_cache is None:
+            _figure_cache = FigureCache()
+        return _figure_cache
@@ -0,0 +1,229 @@
+"""
+Previsão de curto prazo em lote para estados e condados (operações vetorizadas em NumPy)
+"""
+
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from data_catalog import dataset_version, source_for_geography
+from dataset_cache import load_csv_cached
+from series_matrix import SeriesMatrix, build_matrix, daily_from_cumulative, rolling_mean
+
+# Importações condicionais para evitar erros quando executado diretamente
+try:
+    import streamlit as st
+    STREAMLIT_AVAILABLE = True
+except ImportError:
+    STREAMLIT_AVAILABLE = False
+
+try:
+    from config import Config
+except ImportError:
+    class FallbackConfig:
+        FORECAST_WORKERS = 1
+    Config = FallbackConfig()
+
+# z da normal para intervalo de 80% e 95%
+Z_SCORES = {0.8: 1.2816, 0.95: 1.96}
+
+
+def loglinear_forecast(avg, horizon=14, window=21, level=0.8):
+    """Ajusta log(1 + média 7 dias) ~ a + b·t nas últimas `window` observações de cada linha
+
+    Retorna (previsão, inferior, superior, taxa de crescimento diária), todos com
+    uma linha por geografia. O intervalo é o de predição da regressão linear.
+    """
+    y = np.log1p(np.maximum(avg[:, -window:], 0.0))
+    t = np.arange(window, dtype=float)
+    t_mean = t.mean()
+    t_centered = t - t_mean
+    sxx = (t_centered ** 2).sum()
+
+    y_mean = y.mean(axis=1, keepdims=True)
+    slope = ((y - y_mean) * t_centered).sum(axis=1, keepdims=True) / sxx
+    intercept = y_mean - slope * t_mean
+
+    residuals = y - (intercept + slope * t)
+    sigma = np.sqrt((residuals ** 2).sum(axis=1, keepdims=True) / max(window - 2, 1))
+
+    future_t = np.arange(window, window + horizon, dtype=float)
+    y_hat = intercept + slope * future_t
+    se = sigma * np.sqrt(1 + 1 / window + (future_t - t_mean) ** 2 / sxx)
+    z = Z_SCORES.get(level, 1.2816)
+
+    forecast = np.expm1(y_hat)
+    lower = np.maximum(np.expm1(y_hat - z * se), 0.0)
+    upper = np.expm1(y_hat + z * se)
+    return forecast, lower, upper, slope[:, 0]
+
+
+def holt_forecast(avg, horizon=14, alpha=0.5, beta=0.2, level=0.8):
+    """Suavização exponencial de Holt em log(1 + média 7 dias), vetorizada nas linhas"""
+    y = np.log1p(np.maximum(avg, 0.0))
+    lvl = y[:, 0].copy()
+    trend = np.zeros(len(y))
+    sq_errors = np.zeros(len(y))
+
+    for step in range(1, y.shape[1]):
+        predicted = lvl + trend
+        error = y[:, step] - predicted
+        sq_errors += error ** 2
+        new_level = alpha * y[:, step] + (1 - alpha) * predicted
+        trend = beta * (new_level - lvl) + (1 - beta) * trend
+        lvl = new_level
+
+    sigma = np.sqrt(sq_errors / max(y.shape[1] - 1, 1))[:, None]
+    steps = np.arange(1, horizon + 1, dtype=float)
+    y_hat = lvl[:, None] + trend[:, None] * steps
+    # Variância cresce com o horizonte (aproximação do modelo de Holt)
+    se = sigma * np.sqrt(1 + (steps - 1) * alpha ** 2 * (1 + steps * beta))
+    z = Z_SCORES.get(level, 1.2816)
+
+    forecast = np.expm1(y_hat)
+    lower = np.maximum(np.expm1(y_hat - z * se), 0.0)
+    upper = np.expm1(y_hat + z * se)
+    return forecast, lower, upper, trend
+
+
+FORECAST_METHODS = {
+    'loglinear': loglinear_forecast,
+    'holt': holt_forecast,
+}
+
+
+def _forecast_block(args):
+    """Executa um bloco de linhas (usado no pool de processos)"""
+    method, avg, horizon = args
+    return FORECAST_METHODS[method](avg, horizon=horizon)
+
+
+def forecast_matrix(avg, horizon=14, method='loglinear', workers=1):
+    """Previsão para todas as linhas da matriz, opcionalmente dividida entre processos"""
+    if workers <= 1 or len(avg) < workers * 100:
+        return FORECAST_METHODS[method](avg, horizon=horizon)
+
+    blocks = np.array_split(avg, workers)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(_forecast_block, [(method, block, horizon) for block in blocks]))
+    return tuple(np.concatenate([part[i] for part in parts]) for i in range(4))
+
+
+class ForecastEngine:
+    """Gerenciador de previsões em lote com cache por versão do dataset"""
+
+    def __init__(self, workers=None):
+        self.workers = workers or Config.FORECAST_WORKERS
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _store(self, cache_key, value):
+        """Guarda o resultado (com o lock adquirido); a versão fica sempre na posição 2 da chave"""
+        # Resultados de versões antigas do mesmo arquivo/geografia deixam de ser usados
+        for key in [k for k in self._cache if k[:2] == cache_key[:2] and k[2] != cache_key[2]]:
+            del self._cache[key]
+        self._cache[cache_key] = value
+
+    def daily_counts(self, geography, metric):
+        """Matriz dos novos registros diários (diferença do acumulado), em cache por versão"""
+        file_path, key_column = source_for_geography(geography)
+        if file_path is None:
+            return None, None
+
+        version = dataset_version(file_path)
+        matrix_key = ('daily', file_path, version, metric)
+        with self._lock:
+            if matrix_key in self._cache:
+                return self._cache[matrix_key], version
+
+        frame = load_csv_cached(file_path)
+        matrix = build_matrix(frame, key_column, metric)
+        daily_matrix = matrix.with_values(daily_from_cumulative(matrix.values))
+
+        with self._lock:
+            self._store(matrix_key, daily_matrix)
+        return daily_matrix, version
+
+    def daily_average(self, geography, metric):
+        """Matriz da média móvel de 7 dias dos novos registros diários (cache por versão)"""
+        daily_matrix, version = self.daily_counts(geography, metric)
+        if daily_matrix is None:
+            return None, None
+
+        matrix_key = ('average', geography, version, metric)
+        with self._lock:
+            if matrix_key in self._cache:
+                return self._cache[matrix_key], version
+
+        avg_matrix = daily_matrix.with_values(rolling_mean(daily_matrix.values))
+
+        with self._lock:
+            self._store(matrix_key, avg_matrix)
+        return avg_matrix, version
+
+    def forecast(self, geography='state', metric='cases', horizon=14, method='loglinear'):
+        """Previsão de novos casos/óbitos diários (média 7 dias) para todas as geografias
+
+        Retorna um DataFrame longo com key, label, date, forecast, lower, upper e
+        growth_rate (taxa diária no log), ou um DataFrame vazio se não houver dados.
+        """
+        avg_matrix, version = self.daily_average(geography, metric)
+        if avg_matrix is None:
+            return pd.DataFrame()
+
+        cache_key = ('forecast', geography, version, metric, horizon, method)
+        with self._lock:
+            if cache_key in self._cache:
+                return self._cache[cache_key]
+
+        forecast, lower, upper, growth = forecast_matrix(avg_matrix.values, horizon, method, self.workers)
+
+        keys = avg_matrix.keys
+        future_dates = pd.date_range(avg_matrix.dates[-1] + pd.Timedelta(days=1), periods=horizon, freq='D')
+        result = pd.DataFrame({
+            'key': np.repeat(keys, horizon),
+            'label': np.repeat([avg_matrix.labels.get(key, key) for key in keys], horizon),
+            'date': np.tile(future_dates.values, len(keys)),
+            'forecast': forecast.reshape(-1),
+            'lower': lower.reshape(-1),
+            'upper': upper.reshape(-1),
+            'growth_rate': np.repeat(growth, horizon)
+        })
+
+        with self._lock:
+            self._store(cache_key, result)
+        print(f"[OK] Previsão {method} para {len(keys)} geografias ({geography}, {horizon} dias)")
+        return result
+
+    def history(self, geography='state', metric='cases', keys=None, last_days=None):
+        """Média móvel de 7 dias observada, no formato longo (key, date, day_offset, avg_7d)"""
+        avg_matrix, _ = self.daily_average(geography, metric)
+        if avg_matrix is None:
+            return pd.DataFrame()
+
+        if keys is not None:
+            rows = np.isin(avg_matrix.keys, list(keys))
+            avg_matrix = SeriesMatrix(avg_matrix.keys[rows], avg_matrix.start_offset,
+                                      avg_matrix.values[rows], avg_matrix.labels)
+        if last_days:
+            start = max(avg_matrix.n_days - last_days, 0)
+            avg_matrix = SeriesMatrix(avg_matrix.keys, avg_matrix.start_offset + start,
+                                      avg_matrix.values[:, start:], avg_matrix.labels)
+        return avg_matrix.to_frame('avg_7d')
+
+
+# Funções de cache para Streamlit (se disponível)
+if STREAMLIT_AVAILABLE:
+    @st.cache_resource
+    def get_forecast_engine():
+        return ForecastEngine()
+else:
+    _forecast_engine = None
+
+    def get_forecast_engine():
+        global _forecast_engine
+        if _forecast_engine is None:
+            _forecast_engine = ForecastEngine()
+        return _forecast_engine
@@ -0,0 +1,266 @@
+"""
+Detecção de hotspots e pontos de mudança em lote (z-score móvel + CUSUM)
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_catalog import dataset_version, source_for_geography
+from dataset_cache import load_csv_cached
+from dataset_diff import get_change_tracker
+from date_utils import EPOCH
+from series_matrix import build_matrix, daily_from_cumulative, rolling_mean
+
+# Importações condicionais para evitar erros quando executado diretamente
+try:
+    import streamlit as st
+    STREAMLIT_AVAILABLE = True
+except ImportError:
+    STREAMLIT_AVAILABLE = False
+
+# Média móvel aplicada aos novos casos antes da detecção
+SMOOTHING_DAYS = 7
+# Dias mínimos na janela de referência para calcular o z-score
+MIN_REFERENCE_DAYS = 7
+
+
+class HotspotDetector:
+    """Detector incremental sobre a matriz geografia × dia
+
+    Cada chamada de update() processa apenas os dias posteriores ao último já
+    visto; o estado mantido entre chamadas é a janela de referência e o
+    acumulador CUSUM de cada geografia. Rankings e pontos de mudança ficam
+    guardados só para os últimos `history_days` dias.
+    """
+
+    def __init__(self, window=28, z_threshold=3.0, cusum_k=0.5, cusum_h=5.0, top_k=10, history_days=365):
+        self.window = window
+        self.z_threshold = z_threshold
+        self.cusum_k = cusum_k
+        self.cusum_h = cusum_h
+        self.top_k = top_k
+        self.history_days = history_days
+
+        # Reentrante: detect_hotspots segura o lock em volta de reset() + update()
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        """Descarta o estado incremental (o próximo update() reprocessa a série inteira)"""
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self.keys = np.array([])
+        self.labels = {}
+        self.last_offset = None
+        self.source_version = None
+        self._cumulative_tail = None   # últimos dias da série acumulada (para diff/média)
+        self._signal_tail = None       # últimos `window` dias do sinal (para a referência)
+        self._cusum = None
+
+        self.daily_hotspots = pd.DataFrame()
+        self.change_points = pd.DataFrame()
+
+    def _align_state(self, keys):
+        """Reordena o estado para as geografias da nova matriz (novas entram zeradas)"""
+        if self.last_offset is None or np.array_equal(keys, self.keys):
+            return
+
+        position = {key: i for i, key in enumerate(self.keys)}
+        rows = np.array([position.get(key, -1) for key in keys])
+        known = rows >= 0
+
+        def realign(tail):
+            aligned = np.zeros((len(keys), tail.shape[1]))
+            aligned[known] = tail[rows[known]]
+            return aligned
+
+        self._cumulative_tail = realign(self._cumulative_tail)
+        self._signal_tail = realign(self._signal_tail)
+        cusum = np.zeros(len(keys))
+        cusum[known] = self._cusum[rows[known]]
+        self._cusum = cusum
+
+    def update(self, matrix):
+        """Processa os dias novos da matriz acumulada e retorna os eventos desses dias"""
+        with self._lock:
+            self._align_state(matrix.keys)
+
+            first_new = 0
+            if self.last_offset is not None:
+                first_new = self.last_offset + 1 - matrix.start_offset
+            if first_new >= matrix.n_days:
+                return pd.DataFrame()
+
+            new_cumulative = matrix.values[:, first_new:]
+            if self._cumulative_tail is not None:
+                cumulative = np.hstack([self._cumulative_tail, new_cumulative])
+                warmup = self._cumulative_tail.shape[1]
+            else:
+                cumulative = new_cumulative
+                warmup = 0
+
+            # Sinal: log(1 + média 7 dias dos novos casos); descarta o período de aquecimento
+            signal = np.log1p(rolling_mean(daily_from_cumulative(cumulative), SMOOTHING_DAYS))[:, warmup:]
+            history = signal if self._signal_tail is None else np.hstack([self._signal_tail, signal])
+            offset_new = history.shape[1] - signal.shape[1]
+
+            zscores = self._rolling_zscores(history)[:, offset_new:]
+            cusum_values, change_mask = self._run_cusum(zscores)
+
+            start = matrix.start_offset + first_new
+            events = self._collect_events(matrix, start, signal, zscores, cusum_values, change_mask)
+
+            self.keys = matrix.keys
+            self.labels = matrix.labels
+            self.last_offset = matrix.start_offset + matrix.n_days - 1
+            self._cumulative_tail = cumulative[:, -(SMOOTHING_DAYS + 1):]
+            self._signal_tail = history[:, -self.window:]
+            return events
+
+    def _rolling_zscores(self, history):
+        """z do dia contra média e desvio dos `window` dias anteriores (somas acumuladas)"""
+        n_days = history.shape[1]
+        padded = np.hstack([np.zeros((len(history), 1)), history])
+        csum = np.cumsum(padded, axis=1)
+        csum_sq = np.cumsum(padded ** 2, axis=1)
+
+        days = np.arange(n_days)
+        begin = np.maximum(days - self.window, 0)
+        count = (days - begin).astype(float)
+        count[count == 0] = np.nan
+
+        total = csum[:, days] - csum[:, begin]
+        total_sq = csum_sq[:, days] - csum_sq[:, begin]
+        mean = total / count
+        variance = np.maximum(total_sq / count - mean ** 2, 0.0)
+        std = np.sqrt(variance)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = (history - mean) / np.where(std > 1e-6, std, np.nan)
+        # Janelas curtas demais ou sem variação não geram alerta
+        z[:, days < MIN_REFERENCE_DAYS] = 0.0
+        return np.nan_to_num(z, nan=0.0, posinf=0.0, neginf=0.0)
+
+    def _run_cusum(self, zscores):
+        """CUSUM unilateral (aumentos) sobre os z-scores, reiniciado a cada alarme"""
+        n_keys, n_days = zscores.shape
+        cusum = np.zeros(n_keys) if self._cusum is None else self._cusum.copy()
+        values = np.empty((n_keys, n_days))
+        alarms = np.zeros((n_keys, n_days), dtype=bool)
+
+        for day in range(n_days):
+            cusum = np.maximum(0.0, cusum + zscores[:, day] - self.cusum_k)
+            values[:, day] = cusum
+            fired = cusum > self.cusum_h
+            alarms[:, day] = fired
+            cusum[fired] = 0.0
+
+        self._cusum = cusum
+        return values, alarms
+
+    def _collect_events(self, matrix, start, signal, zscores, cusum_values, change_mask):
+        """Ranking diário (top-k por z-score) e lista de pontos de mudança dos dias novos"""
+        n_days = zscores.shape[1]
+        k = min(self.top_k, len(matrix.keys))
+        if k == 0:
+            return pd.DataFrame()
+
+        # Top-k por dia com seleção parcial (sem ordenar todas as geografias)
+        top_rows = np.argpartition(-zscores, k - 1, axis=0)[:k]
+        top_z = np.take_along_axis(zscores, top_rows, axis=0)
+        day_index = np.broadcast_to(np.arange(n_days), top_rows.shape)
+
+        hotspots = pd.DataFrame({
+            'day_offset': (start + day_index).reshape(-1),
+            'key': matrix.keys[top_rows].reshape(-1),
+            'zscore': top_z.reshape(-1),
+            'cusum': cusum_values[top_rows, day_index].reshape(-1),
+            'avg_7d': np.expm1(signal[top_rows, day_index]).reshape(-1)
+        })
+        hotspots = hotspots[hotspots['zscore'] >= self.z_threshold]
+        hotspots = hotspots.sort_values(['day_offset', 'zscore'], ascending=[True, False])
+        hotspots['rank'] = hotspots.groupby('day_offset').cumcount() + 1
+
+        rows, days = np.nonzero(change_mask)
+        changes = pd.DataFrame({
+            'day_offset': start + days,
+            'key': matrix.keys[rows],
+            'zscore': zscores[rows, days],
+            'avg_7d': np.expm1(signal[rows, days])
+        })
+
+        for frame in (hotspots, changes):
+            frame['label'] = [matrix.labels.get(key, key) for key in frame['key']]
+            frame['date'] = EPOCH + pd.to_timedelta(frame['day_offset'], unit='D')
+
+        # Histórico limitado aos últimos history_days dias processados
+        cutoff = start + n_days - self.history_days
+        self.daily_hotspots = self._prune(pd.concat([self.daily_hotspots, hotspots], ignore_index=True), cutoff)
+        self.change_points = self._prune(pd.concat([self.change_points, changes], ignore_index=True), cutoff)
+        return hotspots
+
+    @staticmethod
+    def _prune(frame, cutoff):
+        if frame.empty:
+            return frame
+        return frame[frame['day_offset'] >= cutoff].reset_index(drop=True)
+
+    def latest_hotspots(self):
+        """Ranking de hotspots do último dia processado"""
+        with self._lock:
+            daily_hotspots = self.daily_hotspots
+        if daily_hotspots.empty:
+            return daily_hotspots
+        last_day = daily_hotspots['day_offset'].max()
+        return daily_hotspots[daily_hotspots['day_offset'] == last_day]
+
+
+def detect_hotspots(geography='state', metric='cases'):
+    """Atualiza o detector da geografia com os dias novos do CSV local
+
+    Retorna (ranking do último dia, pontos de mudança acumulados). A matriz só é
+    reconstruída quando a versão do arquivo muda.
+    """
+    detector = get_hotspot_detector(geography, metric)
+    file_path, key_column = source_for_geography(geography)
+    if file_path is None:
+        return pd.DataFrame(), pd.DataFrame()
+
+    version = dataset_version(file_path)
+    # Sessões simultâneas não podem intercalar reset() e update() no detector compartilhado
+    with detector._lock:
+        if version != detector.source_version:
+            # Revisões em dias já processados invalidam o estado; dias novos seguem incrementais
+            diff = get_change_tracker().refresh(file_path)
+            if detector.last_offset is not None:
+                known_change = diff is not None and diff.old_version == detector.source_version
+                first_changed = diff.first_changed_day() if known_change else None
+                if not known_change or (first_changed is not None and first_changed <= detector.last_offset):
+                    detector.reset()
+                    print(f"[OK] Hotspots {geography}/{metric}: dados revisados, reprocessando a série")
+
+            matrix = build_matrix(load_csv_cached(file_path), key_column, metric)
+            new_events = detector.update(matrix)
+            detector.source_version = version
+            print(f"[OK] Hotspots {geography}/{metric}: {len(new_events)} eventos em dias novos")
+
+        return detector.latest_hotspots(), detector.change_points
+
+
+# Funções de cache para Streamlit (se disponível)
+if STREAMLIT_AVAILABLE:
+    @st.cache_resource
+    def get_hotspot_detector(geography='state', metric='cases'):
+        return HotspotDetector()
+else:
+    _hotspot_detectors = {}
+
+    def get_hotspot_detector(geography='state', metric='cases'):
+        key = (geography, metric)
+        if key not in _hotspot_detectors:
+            _hotspot_detectors[key] = HotspotDetector()
+        return _hotspot_detectors[key]
@@ -0,0 +1,172 @@
+"""
+Pirâmide de resoluções (diária, semanal, mensal) para gráficos com zoom
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_catalog import dataset_version, source_for_geography
+from dataset_cache import load_csv_cached
+from date_utils import EPOCH, to_day_offset
+from series_matrix import build_matrix, daily_from_cumulative
+
+# Importações condicionais para evitar erros quando executado diretamente
+try:
+    import streamlit as st
+    STREAMLIT_AVAILABLE = True
+except ImportError:
+    STREAMLIT_AVAILABLE = False
+
+try:
+    from config import Config
+except ImportError:
+    class FallbackConfig:
+        CHART_WIDTH_PX = 1200
+    Config = FallbackConfig()
+
+# Do mais fino para o mais grosso
+LEVELS = ['daily', 'weekly', 'monthly']
+LEVEL_NAMES = {'daily': 'diário', 'weekly': 'semanal', 'monthly': 'mensal'}
+# Espaço horizontal mínimo por ponto: define quantos pontos "bastam" para a largura
+PIXELS_PER_POINT = 8
+
+# Métricas: (coluna do CSV, acumulada?) — acumuladas usam o último valor do período,
+# novos registros usam a média diária do período (mesma escala em todos os níveis)
+METRICS = {
+    'cases': ('cases', True),
+    'deaths': ('deaths', True),
+    'new_cases': ('cases', False),
+    'new_deaths': ('deaths', False),
+}
+
+
+def bucket_starts(start_offset, n_days, level):
+    """Índices (colunas) onde começa cada período do nível"""
+    offsets = start_offset + np.arange(n_days)
+    if level == 'daily':
+        return np.arange(n_days)
+
+    dates = EPOCH + pd.to_timedelta(offsets, unit='D')
+    if level == 'weekly':
+        # Semanas de segunda a domingo
+        period = (offsets + EPOCH.weekday()) // 7
+    else:
+        period = dates.year.to_numpy() * 12 + dates.month.to_numpy()
+    return np.flatnonzero(np.diff(period, prepend=period[0] - 1))
+
+
+def aggregate_level(values, starts, cumulative):
+    """Valores de cada período: último dia (acumulados) ou média diária (novos)"""
+    if len(starts) == values.shape[1]:
+        return values
+    if cumulative:
+        ends = np.append(starts[1:], values.shape[1]) - 1
+        return values[:, ends]
+    lengths = np.diff(np.append(starts, values.shape[1]))
+    return np.add.reduceat(values, starts, axis=1) / lengths
+
+
+class SeriesPyramid:
+    """Todos os níveis de uma métrica para todas as geografias de um nível geográfico"""
+
+    def __init__(self, matrix, cumulative):
+        self.keys = matrix.keys
+        self.labels = matrix.labels
+        self.levels = {}
+        for level in LEVELS:
+            starts = bucket_starts(matrix.start_offset, matrix.n_days, level)
+            # Data representativa do período: último dia (acumulado) ou primeiro dia
+            anchors = np.append(starts[1:], matrix.n_days) - 1 if cumulative else starts
+            self.levels[level] = (
+                matrix.start_offset + anchors,
+                aggregate_level(matrix.values, starts, cumulative)
+            )
+
+    def points_in_range(self, level, start, end):
+        offsets, _ = self.levels[level]
+        return int(np.searchsorted(offsets, end, side='right') - np.searchsorted(offsets, start, side='left'))
+
+    def choose_level(self, start, end, width_px=None):
+        """Nível mais grosso que ainda tem pontos suficientes para a largura do gráfico"""
+        width_px = width_px or Config.CHART_WIDTH_PX
+        needed = max(width_px // PIXELS_PER_POINT, 1)
+        for level in reversed(LEVELS):
+            if self.points_in_range(level, start, end) >= needed:
+                return level
+        return LEVELS[0]
+
+    def window(self, level, start, end, keys=None):
+        """Recorte do nível para o intervalo (busca binária nos deslocamentos, sem refiltrar linhas)"""
+        offsets, values = self.levels[level]
+        lo = np.searchsorted(offsets, start, side='left')
+        hi = np.searchsorted(offsets, end, side='right')
+
+        rows = np.arange(len(self.keys)) if keys is None else np.flatnonzero(np.isin(self.keys, list(keys)))
+        block = values[rows, lo:hi]
+        n_points = hi - lo
+        frame = pd.DataFrame({
+            'key': np.repeat(self.keys[rows], n_points),
+            'date': np.tile((EPOCH + pd.to_timedelta(offsets[lo:hi], unit='D')).values, len(rows)),
+            'value': block.reshape(-1)
+        })
+        # Antes do primeiro registro a série não existia
+        started = np.maximum.accumulate(block > 0, axis=1).reshape(-1)
+        return frame[started]
+
+
+class PyramidStore:
+    """Pirâmides em cache por geografia, métrica e versão do dataset"""
+
+    def __init__(self):
+        self._pyramids = {}
+        self._lock = threading.Lock()
+
+    def pyramid(self, geography='state', metric='cases'):
+        file_path, key_column = source_for_geography(geography)
+        if file_path is None:
+            return None
+
+        cache_key = (geography, metric, dataset_version(file_path))
+        with self._lock:
+            if cache_key in self._pyramids:
+                return self._pyramids[cache_key]
+
+        column, cumulative = METRICS[metric]
+        matrix = build_matrix(load_csv_cached(file_path), key_column, column)
+        if not cumulative:
+            matrix = matrix.with_values(daily_from_cumulative(matrix.values))
+        pyramid = SeriesPyramid(matrix, cumulative)
+
+        with self._lock:
+            # Versões antigas da mesma série deixam de ser usadas
+            for key in [k for k in self._pyramids if k[:2] == cache_key[:2]]:
+                del self._pyramids[key]
+            self._pyramids[cache_key] = pyramid
+        return pyramid
+
+    def series(self, keys, start, end, geography='state', metric='cases', width_px=None):
+        """Série no nível adequado ao intervalo e à largura: (DataFrame, nível)"""
+        pyramid = self.pyramid(geography, metric)
+        if pyramid is None:
+            return pd.DataFrame(), None
+
+        start, end = to_day_offset(start), to_day_offset(end)
+        level = pyramid.choose_level(start, end, width_px)
+        return pyramid.window(level, start, end, keys), level
+
+
+# Funções de cache para Streamlit (se disponível)
+if STREAMLIT_AVAILABLE:
+    @st.cache_resource
+    def get_pyramid_store():
+        return PyramidStore()
+else:
+    _pyramid_store = None
+
+    def get_pyramid_store():
+        global _pyramid_store
+        if _pyramid_store is None:
+            _pyramid_store = PyramidStore()
+        return _pyramid_store
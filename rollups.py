@@ -0,0 +1,162 @@
+"""
+Agregação condado → estado → nacional calculada uma vez por versão dos dados
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from compressed_storage import dataset_exists
+from data_catalog import dataset_version, source_for_geography
+from dataset_cache import load_csv_cached
+from date_utils import DAY_COLUMN, EPOCH
+from snapshot import SNAPSHOT_FALLBACKS
+
+# Importações condicionais para evitar erros quando executado diretamente
+try:
+    import streamlit as st
+    STREAMLIT_AVAILABLE = True
+except ImportError:
+    STREAMLIT_AVAILABLE = False
+
+# Arquivos oficiais usados na conferência (primeiro com datas em comum)
+REFERENCE_SOURCES = {
+    'state': ['us-states.csv', 'data/us-states.csv', 'live/us-states.csv'],
+    'national': ['us.csv', 'data/us.csv', 'live/us.csv'],
+}
+
+# Diferença relativa aceita entre a soma dos condados e o valor publicado
+CONSISTENCY_TOLERANCE = 0.005
+
+METRIC_COLUMNS = ['cases', 'deaths']
+
+
+def rollup_states(counties):
+    """Soma os condados por estado e dia (uma linha por estado/dia)"""
+    frame = counties[counties[DAY_COLUMN].notna()]
+    state_codes, states = pd.factorize(frame['state'], sort=True)
+    offsets = frame[DAY_COLUMN].to_numpy(dtype=np.int64)
+    start = int(offsets.min())
+    n_days = int(offsets.max()) - start + 1
+
+    # Acumula direto em uma grade estado × dia; só as células com registro saem
+    flat = state_codes * n_days + (offsets - start)
+    present = np.bincount(flat, minlength=len(states) * n_days) > 0
+    cells = np.flatnonzero(present)
+
+    result = {
+        'state': np.asarray(states)[cells // n_days],
+        DAY_COLUMN: (cells % n_days + start).astype(np.int16),
+    }
+    for column in METRIC_COLUMNS:
+        values = np.bincount(flat, weights=frame[column].fillna(0).to_numpy(dtype=float),
+                             minlength=len(states) * n_days)
+        result[column] = values[cells]
+
+    rollup = pd.DataFrame(result)
+    rollup.insert(0, 'date', EPOCH + pd.to_timedelta(rollup[DAY_COLUMN], unit='D'))
+    return rollup
+
+
+def rollup_national(states):
+    """Soma os estados por dia"""
+    national = states.groupby(DAY_COLUMN, sort=True)[METRIC_COLUMNS].sum().reset_index()
+    national.insert(0, 'date', EPOCH + pd.to_timedelta(national[DAY_COLUMN], unit='D'))
+    return national
+
+
+def check_consistency(rollup, level):
+    """Compara a agregação com o arquivo publicado para o mesmo nível
+
+    Usa o primeiro arquivo de referência com datas em comum. Retorna um dict
+    com o arquivo, dias comparados, linhas fora da tolerância e a maior
+    diferença relativa por métrica.
+    """
+    keys = [DAY_COLUMN] if level == 'national' else ['state', DAY_COLUMN]
+
+    for file_path in REFERENCE_SOURCES[level]:
+        if not dataset_exists(file_path):
+            continue
+
+        reference = load_csv_cached(file_path)
+        merged = rollup.merge(reference[keys + METRIC_COLUMNS], on=keys, suffixes=('', '_ref'))
+        if merged.empty:
+            continue
+
+        report = {'reference': file_path, 'rows_compared': len(merged), 'days_compared': merged[DAY_COLUMN].nunique()}
+        mismatched = np.zeros(len(merged), dtype=bool)
+        for column in METRIC_COLUMNS:
+            expected = merged[f'{column}_ref'].to_numpy(dtype=float)
+            diff = np.abs(merged[column].to_numpy(dtype=float) - expected)
+            relative = diff / np.maximum(expected, 1.0)
+            mismatched |= relative > CONSISTENCY_TOLERANCE
+            report[f'max_relative_diff_{column}'] = float(relative.max())
+
+        report['rows_mismatched'] = int(mismatched.sum())
+        if level == 'state':
+            report['states_mismatched'] = sorted(merged.loc[mismatched, 'state'].unique())
+        report['consistent'] = report['rows_mismatched'] == 0
+        return report
+
+    return {'reference': None, 'rows_compared': 0, 'consistent': None}
+
+
+class RollupStore:
+    """Agregações por estado e nacional, refeitas só quando o arquivo de condados muda"""
+
+    def __init__(self):
+        self.states = pd.DataFrame(columns=['date', 'state', DAY_COLUMN] + METRIC_COLUMNS)
+        self.national = pd.DataFrame(columns=['date', DAY_COLUMN] + METRIC_COLUMNS)
+        self.checks = {}
+        self.source_version = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Recalcula as agregações e as conferências se a versão dos condados mudou"""
+        file_path, _ = source_for_geography('county', SNAPSHOT_FALLBACKS['county'])
+        if file_path is None:
+            return self
+
+        version = (file_path, dataset_version(file_path))
+        with self._lock:
+            if version == self.source_version:
+                return self
+
+            counties = load_csv_cached(file_path)
+            self.states = rollup_states(counties)
+            self.national = rollup_national(self.states)
+            self.checks = {
+                'state': check_consistency(self.states, 'state'),
+                'national': check_consistency(self.national, 'national'),
+            }
+            self.source_version = version
+
+            for level, report in self.checks.items():
+                if report['consistent'] is False:
+                    print(f"[AVISO] Agregação {level} difere de {report['reference']} "
+                          f"em {report['rows_mismatched']} linhas")
+            print(f"[OK] Agregações: {len(self.states)} linhas estado/dia, {len(self.national)} dias ({file_path})")
+            return self
+
+    def state_series(self, states=None):
+        """Série diária por estado derivada dos condados (opcionalmente filtrada)"""
+        rollup = self.refresh().states
+        if states is not None:
+            rollup = rollup[rollup['state'].isin(states)]
+        return rollup
+
+
+# Funções de cache para Streamlit (se disponível)
+if STREAMLIT_AVAILABLE:
+    @st.cache_resource
+    def get_rollup_store():
+        return RollupStore()
+else:
+    _rollup_store = None
+
+    def get_rollup_store():
+        global _rollup_store
+        if _rollup_store is None:
+            _rollup_store = RollupStore()
+        return _rollup_store
@@ -0,0 +1,43 @@
+"""
+Migrações versionadas de esquema SQLite (versão gravada em PRAGMA user_version)
+"""
+
+import sqlite3
+
+
+def schema_version(conn):
+    """Versão do esquema gravada no cabeçalho do banco (0 = nunca migrado)"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def apply_migrations(conn, migrations, name='banco'):
+    """Aplica, em ordem, as migrações com versão acima da atual
+
+    migrations: lista de (versão, descrição, [comandos SQL]). Cada migração
+    roda em uma transação própria junto com a atualização do user_version,
+    então um banco nunca fica com a migração pela metade. O BEGIN IMMEDIATE
+    serializa processos que abrem o mesmo banco ao mesmo tempo: a versão é
+    relida depois de obter o lock. Retorna as versões aplicadas.
+    """
+    applied = []
+    for number, description, statements in sorted(migrations, key=lambda migration: migration[0]):
+        if number <= schema_version(conn):
+            continue
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Outro processo pode ter aplicado enquanto esperávamos o lock
+            if number <= schema_version(conn):
+                conn.rollback()
+                continue
+            for sql in statements:
+                conn.execute(sql)
+            conn.execute(f'PRAGMA user_version={int(number)}')
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+        applied.append(number)
+        print(f"[OK] Migração {number} aplicada em {name}: {description}")
+    return applied
@@ -0,0 +1,136 @@
+"""
+Matriz densa geografia × dia construída a partir dos CSVs em formato longo
+"""
+
+import numpy as np
+import pandas as pd
+
+from date_utils import DAY_COLUMN, add_date_columns, from_day_offset
+
+
+class SeriesMatrix:
+    """Série temporal de várias geografias em uma matriz (linhas = geografias, colunas = dias)"""
+
+    def __init__(self, keys, start_offset, values, labels=None):
+        self.keys = np.asarray(keys)
+        self.start_offset = int(start_offset)
+        self.values = values
+        self.labels = labels if labels is not None else {}
+
+    @property
+    def n_days(self):
+        return self.values.shape[1]
+
+    @property
+    def day_offsets(self):
+        return np.arange(self.start_offset, self.start_offset + self.n_days)
+
+    @property
+    def dates(self):
+        return pd.date_range(from_day_offset(self.start_offset), periods=self.n_days, freq='D')
+
+    def row_index(self, key):
+        """Posição da geografia na matriz (ou None)"""
+        matches = np.flatnonzero(self.keys == key)
+        return int(matches[0]) if len(matches) else None
+
+    def with_values(self, values):
+        """Nova matriz com as mesmas geografias e dias e outros valores"""
+        return SeriesMatrix(self.keys, self.start_offset, values, self.labels)
+
+    def to_frame(self, value_name, key_name='key'):
+        """Converte de volta para o formato longo (key, date, day_offset, valor)"""
+        n_keys, n_days = self.values.shape
+        return pd.DataFrame({
+            key_name: np.repeat(self.keys, n_days),
+            'date': np.tile(self.dates.values, n_keys),
+            DAY_COLUMN: np.tile(self.day_offsets, n_keys).astype(np.int16),
+            value_name: self.values.reshape(-1)
+        })
+
+
+def geography_keys(frame, key_column):
+    """Chave de cada linha do frame longo
+
+    Para condados a chave é o fips com 5 dígitos ('06037'); linhas sem fips
+    (New York City, Kansas City, Joplin, 'Unknown') usam 'Estado|Condado'
+    para não sumirem das séries e rankings.
+    """
+    if key_column != 'fips' or 'county' not in frame.columns or 'state' not in frame.columns:
+        return frame[key_column]
+
+    fips = pd.to_numeric(frame[key_column], errors='coerce').to_numpy()
+    has_fips = ~np.isnan(fips)
+    keys = np.full(len(frame), None, dtype=object)
+
+    # Texto montado uma vez por fips distinto, não por linha
+    codes, unique_fips = pd.factorize(fips[has_fips])
+    keys[has_fips] = np.char.zfill(unique_fips.astype(np.int64).astype(str), 5).astype(object)[codes]
+
+    named = ~has_fips & frame['county'].notna().to_numpy()
+    keys[named] = (frame['state'][named].astype(str) + '|' + frame['county'][named].astype(str)).to_numpy()
+    return pd.Series(keys, index=frame.index)
+
+
+def build_matrix(frame, key_column, value_column='cases', cumulative=True):
+    """Monta a matriz densa a partir de um frame longo (uma linha por geografia e dia)
+
+    Séries acumuladas recebem 0 antes do primeiro registro e repetem o último
+    valor conhecido em dias sem publicação.
+    """
+    if DAY_COLUMN not in frame.columns:
+        frame = add_date_columns(frame.copy())
+
+    row_keys = geography_keys(frame, key_column)
+    valid = row_keys.notna() & frame[DAY_COLUMN].notna()
+    frame, row_keys = frame[valid], row_keys[valid]
+    codes, keys = pd.factorize(row_keys, sort=True)
+    offsets = frame[DAY_COLUMN].to_numpy(dtype=np.int32)
+    start = int(offsets.min())
+    n_days = int(offsets.max()) - start + 1
+
+    values = np.full((len(keys), n_days), np.nan)
+    values[codes, offsets - start] = frame[value_column].to_numpy(dtype=float)
+
+    if cumulative:
+        values = forward_fill(values)
+        values[np.isnan(values)] = 0.0
+
+    labels = {}
+    if key_column != 'state' and 'state' in frame.columns:
+        # Nome legível para condados: "Condado, Estado"
+        first = ~row_keys.duplicated()
+        if 'county' in frame.columns:
+            names = frame['county'][first].astype(str) + ', ' + frame['state'][first].astype(str)
+        else:
+            names = frame['state'][first].astype(str)
+        labels = dict(zip(row_keys[first], names))
+
+    return SeriesMatrix(np.asarray(keys), start, values, labels)
+
+
+def forward_fill(values):
+    """Propaga o último valor válido ao longo dos dias (por linha)"""
+    mask = np.isnan(values)
+    index = np.where(~mask, np.arange(values.shape[1]), 0)
+    np.maximum.accumulate(index, axis=1, out=index)
+    filled = values[np.arange(values.shape[0])[:, None], index]
+    return filled
+
+
+def daily_from_cumulative(values, clip_negative=True):
+    """Novos casos diários a partir da série acumulada"""
+    daily = np.diff(values, axis=1, prepend=0.0)
+    if clip_negative:
+        # Revisões retroativas geram diferenças negativas
+        np.maximum(daily, 0.0, out=daily)
+    return daily
+
+
+def rolling_mean(values, window=7):
+    """Média móvel dos últimos `window` dias (janelas parciais no início)"""
+    csum = np.cumsum(values, axis=1)
+    result = csum.copy()
+    result[:, window:] = csum[:, window:] - csum[:, :-window]
+    counts = np.minimum(np.arange(1, values.shape[1] + 1), window)
+    return result / counts
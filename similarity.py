@@ -0,0 +1,144 @@
+"""
+Busca de curvas semelhantes (média móvel de 7 dias normalizada) entre estados e condados
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import PCA
+
+from forecasting import get_forecast_engine
+
+# Importações condicionais para evitar erros quando executado diretamente
+try:
+    import streamlit as st
+    STREAMLIT_AVAILABLE = True
+except ImportError:
+    STREAMLIT_AVAILABLE = False
+
+# Acima deste número de geografias a busca usa os embeddings reduzidos
+EXACT_SEARCH_LIMIT = 500
+EMBEDDING_DIMENSIONS = 32
+# Candidatos do embedding reavaliados com a correlação exata
+RERANK_FACTOR = 5
+
+
+def z_normalize(values):
+    """Cada linha com média 0 e norma 1 (o produto escalar vira a correlação de Pearson)"""
+    centered = values - values.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(centered, axis=1, keepdims=True)
+    return np.divide(centered, norms, out=np.zeros_like(centered), where=norms > 0)
+
+
+def top_k_rows(scores, k, exclude=None):
+    """Índices das k maiores pontuações, ordenados (seleção parcial)"""
+    scores = scores.astype(float, copy=True)
+    if exclude is not None:
+        scores[exclude] = -np.inf
+    k = min(k, int(np.isfinite(scores).sum()))
+    if k <= 0:
+        return np.array([], dtype=int)
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part], kind='stable')]
+
+
+class CurveIndex:
+    """Índice de similaridade para um nível geográfico e uma versão do dataset
+
+    Com poucas geografias (estados) a matriz de correlação completa é calculada
+    de uma vez; com muitas (condados) as consultas usam embeddings PCA e
+    reavaliam os melhores candidatos com a correlação exata.
+    """
+
+    def __init__(self, avg_matrix, window=None):
+        values = avg_matrix.values if window is None else avg_matrix.values[:, -window:]
+        self.keys = avg_matrix.keys
+        self.labels = avg_matrix.labels
+        self.curves = z_normalize(np.log1p(np.maximum(values, 0.0)))
+        self.correlation = None
+        self.embeddings = None
+
+        if len(self.keys) <= EXACT_SEARCH_LIMIT:
+            self.correlation = self.curves @ self.curves.T
+        else:
+            n_components = min(EMBEDDING_DIMENSIONS, *self.curves.shape)
+            pca = PCA(n_components=n_components, svd_solver='randomized', random_state=42)
+            self.embeddings = pca.fit_transform(self.curves)
+
+    def neighbors(self, key, k=5):
+        """As k geografias com curva mais parecida (correlação e distância z-normalizada)"""
+        matches = np.flatnonzero(self.keys == key)
+        if len(matches) == 0:
+            return pd.DataFrame(columns=['key', 'label', 'correlation', 'distance'])
+        row = int(matches[0])
+
+        if self.correlation is not None:
+            scores = self.correlation[row]
+            rows = top_k_rows(scores, k, exclude=row)
+        else:
+            # Pré-seleção aproximada no espaço reduzido, depois correlação exata
+            distances = np.linalg.norm(self.embeddings - self.embeddings[row], axis=1)
+            candidates = top_k_rows(-distances, k * RERANK_FACTOR + 1, exclude=row)
+            exact = self.curves[candidates] @ self.curves[row]
+            rows = candidates[top_k_rows(exact, k)]
+            scores = np.zeros(len(self.keys))
+            scores[candidates] = exact
+
+        correlation = scores[rows]
+        return pd.DataFrame({
+            'key': self.keys[rows],
+            'label': [self.labels.get(k_, k_) for k_ in self.keys[rows]],
+            'correlation': correlation,
+            # Distância euclidiana entre curvas z-normalizadas (norma 1): sqrt(2 - 2r)
+            'distance': np.sqrt(np.maximum(2 - 2 * correlation, 0.0))
+        })
+
+
+class SimilarityEngine:
+    """Índices de similaridade em cache por geografia, métrica, janela e versão"""
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def index(self, geography='state', metric='cases', window=None):
+        avg_matrix, version = get_forecast_engine().daily_average(geography, metric)
+        if avg_matrix is None:
+            return None
+
+        cache_key = (geography, metric, window, version)
+        with self._lock:
+            if cache_key in self._indexes:
+                return self._indexes[cache_key]
+
+        index = CurveIndex(avg_matrix, window)
+        with self._lock:
+            # Índices de versões antigas da mesma série deixam de ser usados
+            for key in [k for k in self._indexes if k[:2] == cache_key[:2] and k[3] != version]:
+                del self._indexes[key]
+            self._indexes[cache_key] = index
+        print(f"[OK] Índice de similaridade {geography}/{metric}: {len(index.keys)} curvas")
+        return index
+
+    def similar(self, key, geography='state', metric='cases', k=5, window=None):
+        """Vizinhos mais próximos de uma geografia (DataFrame vazio se não houver dados)"""
+        index = self.index(geography, metric, window)
+        if index is None:
+            return pd.DataFrame()
+        return index.neighbors(key, k)
+
+
+# Funções de cache para Streamlit (se disponível)
+if STREAMLIT_AVAILABLE:
+    @st.cache_resource
+    def get_similarity_engine():
+        return SimilarityEngine()
+else:
+    _similarity_engine = None
+
+    def get_similarity_engine():
+        global _similarity_engine
+        if _similarity_engine is None:
+            _similarity_engine = SimilarityEngine()
+        return _similarity_engine
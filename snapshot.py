@@ -0,0 +1,187 @@
+"""
+Tabela com o último valor de cada geografia (acumulado, novos em 7 dias, por 100 mil hab.)
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from compressed_storage import dataset_exists
+from data_catalog import dataset_version, source_for_geography
+from dataset_cache import load_csv_cached
+from date_utils import from_day_offset
+from series_matrix import build_matrix, geography_keys
+
+# Importações condicionais para evitar erros quando executado diretamente
+try:
+    import streamlit as st
+    STREAMLIT_AVAILABLE = True
+except ImportError:
+    STREAMLIT_AVAILABLE = False
+
+# Retrato atual dos condados publicado pelo NY Times (um único dia)
+SNAPSHOT_FALLBACKS = {
+    'state': ['live/us-states.csv'],
+    'county': ['live/us-counties.csv'],
+}
+
+# Médias móveis com valores por 100 mil hab., usadas para estimar a população
+POPULATION_SOURCES = {
+    'state': ['rolling-averages/us-states.csv'],
+    'county': ['rolling-averages/us-counties.csv', 'rolling-averages/us-counties-recent.csv'],
+}
+
+METRICS = ['cases', 'deaths', 'new_cases_7d', 'new_deaths_7d', 'cases_per_100k', 'new_cases_7d_per_100k']
+
+
+def estimate_population(geography):
+    """População por geografia derivada de cases_avg / cases_avg_per_100k
+
+    Usa a linha de maior média de cada geografia (menor erro de arredondamento).
+    Retorna uma Series indexada pela chave da geografia ou None se não houver fonte.
+    """
+    for file_path in POPULATION_SOURCES[geography]:
+        if not dataset_exists(file_path):
+            continue
+
+        frame = load_csv_cached(file_path)
+        frame = frame[frame['cases_avg_per_100k'] > 0]
+        best = frame.loc[frame.groupby('geoid')['cases_avg'].idxmax()]
+        population = (best['cases_avg'] / best['cases_avg_per_100k'] * 100_000).round()
+
+        if geography == 'state':
+            keys = best['state']
+        else:
+            # geoid 'USA-06037' -> '06037' (mesma chave de geography_keys)
+            keys = best['geoid'].str[4:]
+        return pd.Series(population.to_numpy(), index=keys.to_numpy())
+
+    return None
+
+
+class LatestSnapshot:
+    """Último valor de cada geografia, recalculado apenas quando o dataset muda
+
+    As consultas de ranking usam seleção parcial (np.argpartition) sobre os
+    ~3.000 condados, sem reordenar nem reagrupar o histórico.
+    """
+
+    def __init__(self, geography='county'):
+        self.geography = geography
+        self.table = pd.DataFrame(columns=['key', 'label', 'date'] + METRICS)
+        self.source_version = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Recalcula a tabela se a versão do arquivo de origem mudou (a cada ingestão)"""
+        file_path, key_column = source_for_geography(self.geography, SNAPSHOT_FALLBACKS[self.geography])
+        if file_path is None:
+            return self.table
+
+        version = (file_path, dataset_version(file_path))
+        with self._lock:
+            if version == self.source_version:
+                return self.table
+
+            frame = load_csv_cached(file_path)
+            cases = build_matrix(frame, key_column, 'cases')
+            deaths = build_matrix(frame, key_column, 'deaths')
+            self.table = self._build_table(cases, deaths, estimate_population(self.geography))
+            self.source_version = version
+            print(f"[OK] Snapshot {self.geography}: {len(self.table)} geografias ({file_path})")
+            return self.table
+
+    def _build_table(self, cases, deaths, population):
+        latest_cases = cases.values[:, -1]
+        latest_deaths = deaths.values[:, -1]
+
+        # Novos em 7 dias: diferença contra o acumulado de 7 dias atrás
+        if cases.n_days > 7:
+            new_cases = np.maximum(latest_cases - cases.values[:, -8], 0.0)
+            new_deaths = np.maximum(latest_deaths - deaths.values[:, -8], 0.0)
+        else:
+            new_cases = np.full(len(cases.keys), np.nan)
+            new_deaths = np.full(len(cases.keys), np.nan)
+
+        if population is not None:
+            pop = population.groupby(level=0).first().reindex(cases.keys).to_numpy(dtype=float)
+        else:
+            pop = np.full(len(cases.keys), np.nan)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            per_100k = np.where(pop > 0, 100_000 / pop, np.nan)
+
+        return pd.DataFrame({
+            'key': cases.keys,
+            'label': [cases.labels.get(key, key) for key in cases.keys],
+            'date': from_day_offset(cases.start_offset + cases.n_days - 1),
+            'cases': latest_cases,
+            'deaths': latest_deaths,
+            'new_cases_7d': new_cases,
+            'new_deaths_7d': new_deaths,
+            'cases_per_100k': latest_cases * per_100k,
+            'new_cases_7d_per_100k': new_cases * per_100k
+        })
+
+    def top_k(self, metric='cases', k=10, ascending=False):
+        """As k geografias com maior (ou menor) valor da métrica, já ordenadas"""
+        table = self.refresh()
+        values = table[metric].to_numpy(dtype=float)
+        valid = np.flatnonzero(~np.isnan(values))
+        k = min(k, len(valid))
+        if k == 0:
+            return table.iloc[:0]
+
+        scores = values[valid] if ascending else -values[valid]
+        part = np.argpartition(scores, k - 1)[:k]
+        rows = valid[part[np.argsort(scores[part], kind='stable')]]
+        return table.iloc[rows].reset_index(drop=True)
+
+    def totals(self):
+        """Somas do último dia (sem contar o histórico várias vezes)"""
+        table = self.refresh()
+        return {
+            'geographies': len(table),
+            'cases': float(table['cases'].sum()),
+            'deaths': float(table['deaths'].sum())
+        }
+
+
+# Funções de cache para Streamlit (se disponível)
+if STREAMLIT_AVAILABLE:
+    @st.cache_resource
+    def get_latest_snapshot(geography='county'):
+        return LatestSnapshot(geography)
+else:
+    _snapshots = {}
+
+    def get_latest_snapshot(geography='county'):
+        if geography not in _snapshots:
+            _snapshots[geography] = LatestSnapshot(geography)
+        return _snapshots[geography]
+
+
+# Conferência do ranking e dos totais quando chamado diretamente
+if __name__ == "__main__":
+    snapshot = LatestSnapshot('county')
+    top = snapshot.top_k('cases', 10)
+    print("TOP 10 CONDADOS (casos)")
+    print("=" * 50)
+    for position, row in enumerate(top.itertuples(), start=1):
+        print(f"  {position:2d}. {row.label}: {row.cases:,.0f}")
+
+    # O retrato precisa cobrir todas as linhas do arquivo, inclusive condados sem fips
+    file_path, key_column = source_for_geography('county', SNAPSHOT_FALLBACKS['county'])
+    if file_path is not None:
+        frame = load_csv_cached(file_path)
+        latest = frame.assign(key=geography_keys(frame, key_column)).sort_values('date').groupby('key').last()
+        totals = snapshot.totals()
+        print(f"\n[{'OK' if totals['geographies'] == len(latest) else 'ERRO'}] "
+              f"{totals['geographies']} condados no retrato, {len(latest)} no arquivo")
+        print(f"[{'OK' if totals['cases'] == latest['cases'].sum() else 'ERRO'}] "
+              f"Total de casos {totals['cases']:,.0f} (arquivo: {latest['cases'].sum():,.0f})")
+        missing_fips = frame[frame[key_column].isna()]['county'].unique()
+        print(f"[OK] Condados sem fips incluídos: {', '.join(map(str, missing_fips))}")
+        print(f"[{'OK' if 'New York City, New York' in set(top['label']) else 'ERRO'}] "
+              f"New York City no top 10")
@@ -0,0 +1,373 @@
+"""
+Modo SQL embarcado: carrega os CSVs do catálogo em um SQLite local indexado
+e expõe consultas somente leitura com timeout e limite de linhas
+"""
+
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from clustering import get_cluster_store
+from compressed_storage import open_dataset
+from data_catalog import CSV_CATALOG, dataset_version, source_for_geography, unique_catalog_files
+from dataset_history import get_dataset_history
+from date_utils import DAY_COLUMN
+from epi_metrics import DERIVED_REVISION, DERIVED_TABLES, derived_frame, derived_version
+from waves import WAVE_REVISION, WAVE_TABLES, wave_table
+
+# Importações condicionais para evitar erros quando executado diretamente
+try:
+    import streamlit as st
+    STREAMLIT_AVAILABLE = True
+except ImportError:
+    STREAMLIT_AVAILABLE = False
+
+try:
+    from config import Config
+except ImportError:
+    class FallbackConfig:
+        ANALYTICS_DB_PATH = 'saudeja_analytics.db'
+        SQL_QUERY_TIMEOUT = 2.0
+        SQL_MAX_ROWS = 5000
+    Config = FallbackConfig()
+
+# Índices criados sempre que as colunas existem na tabela
+INDEX_CANDIDATES = [
+    ('state', 'date'),
+    ('fips', 'date'),
+    ('geoid',),
+    ('geoid', 'date'),
+    ('country', 'start_date'),
+    ('facility_state',),
+    ('facility_county_fips',),
+]
+
+# Colunas com zeros à esquerda que não podem virar números
+TEXT_COLUMNS = {'fips', 'facility_county_fips', 'COUNTYFP', 'geoid'}
+
+INGEST_CHUNK_ROWS = 100_000
+
+# Tabelas derivadas recalculadas na ingestão: (tabela, geografia, função, colunas do índice, revisão)
+DERIVED_OUTPUTS = [
+    (DERIVED_TABLES['state'], 'state', derived_frame, ('key', DAY_COLUMN), DERIVED_REVISION),
+    (DERIVED_TABLES['county'], 'county', derived_frame, ('key', DAY_COLUMN), DERIVED_REVISION),
+    (WAVE_TABLES['state'], 'state', wave_table, ('key', 'wave'), WAVE_REVISION),
+    (WAVE_TABLES['county'], 'county', wave_table, ('key', 'wave'), WAVE_REVISION),
+]
+
+# Geografias com modelo de agrupamento de curvas ajustado na ingestão
+CLUSTER_GEOGRAPHIES = ['state', 'county']
+
+# Operações permitidas pelo autorizador no modo somente leitura
+READONLY_ACTIONS = {
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    sqlite3.SQLITE_RECURSIVE,
+}
+
+
+def table_name_for(file_path):
+    """Converte o caminho do CSV em um nome de tabela SQL ('data/us.csv' -> 'data_us')"""
+    name = re.sub(r'\.csv$', '', file_path.lower())
+    return re.sub(r'[^a-z0-9]+', '_', name).strip('_')
+
+
+class CsvSqlEngine:
+    """Gerenciador do banco SQL local construído a partir do catálogo de CSVs"""
+
+    def __init__(self, db_path=None, base_path=None):
+        self.db_path = os.path.abspath(db_path or Config.ANALYTICS_DB_PATH)
+        self.base_path = base_path or os.getcwd()
+        self._setup_ingest_log()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _setup_ingest_log(self):
+        """Tabela de controle com a versão de cada arquivo já carregado"""
+        conn = self._connect()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS _ingest_log (
+                    source_file TEXT PRIMARY KEY,
+                    table_name TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    row_count INTEGER,
+                    ingested_at DATETIME
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _ingested_versions(self, conn):
+        rows = conn.execute('SELECT source_file, version FROM _ingest_log').fetchall()
+        return dict(rows)
+
+    def ingest_catalog(self, force=False):
+        """Carrega no SQLite todos os CSVs do catálogo que mudaram desde a última carga"""
+        results = {}
+        conn = self._connect()
+        try:
+            known_versions = self._ingested_versions(conn)
+            for file_path, entry in unique_catalog_files(self.base_path).items():
+                full_path = entry['full_path']
+                version = dataset_version(full_path)
+                if force or known_versions.get(file_path) != version:
+                    try:
+                        row_count = self._ingest_file(conn, file_path, full_path, version)
+                        results[file_path] = row_count
+                        print(f"[OK] {file_path} carregado em {table_name_for(file_path)}: {row_count} registros")
+                        self._record_version(file_path, full_path)
+                    except Exception as e:
+                        conn.rollback()
+                        results[file_path] = f"erro: {e}"
+                        print(f"[ERRO] Erro ao carregar {file_path} no SQL: {e}")
+                        continue
+                else:
+                    results[file_path] = 'atual'
+
+                # Arquivos de conteúdo idêntico viram views da tabela já carregada
+                for alias in entry['aliases']:
+                    alias_version = f"{dataset_version(os.path.join(self.base_path, alias))}={version}"
+                    if not force and known_versions.get(alias) == alias_version:
+                        results[alias] = 'atual'
+                        continue
+                    try:
+                        self._create_alias_view(conn, alias, file_path, alias_version)
+                        results[alias] = f"alias de {table_name_for(file_path)}"
+                        print(f"[OK] {alias} idêntico a {file_path}: view {table_name_for(alias)}")
+                    except Exception as e:
+                        conn.rollback()
+                        results[alias] = f"erro: {e}"
+                        print(f"[ERRO] Erro ao criar a view de {alias} no SQL: {e}")
+
+            results.update(self._ingest_derived(conn, known_versions, force))
+            results.update(self._fit_clusters())
+        finally:
+            conn.close()
+
+        return results
+
+    def _record_version(self, file_path, full_path):
+        """Guarda a versão carregada no histórico (delta em relação à anterior) para consultas as_of"""
+        try:
+            get_dataset_history().record(full_path)
+        except ValueError:
+            # Arquivo sem chave data/geografia: não é versionado
+            pass
+        except Exception as e:
+            print(f"[ERRO] Erro ao registrar a versão de {file_path}: {e}")
+
+    def _ingest_derived(self, conn, known_versions, force=False):
+        """Grava as tabelas derivadas (Rt, ondas...) cuja série de origem mudou"""
+        results = {}
+        # Remove registros de tabelas derivadas que não fazem mais parte da lista
+        current_keys = [f"derived:{output[0]}" for output in DERIVED_OUTPUTS]
+        conn.execute(
+            f"DELETE FROM _ingest_log WHERE source_file LIKE 'derived:%' "
+            f"AND source_file NOT IN ({', '.join('?' * len(current_keys))})",
+            current_keys
+        )
+        conn.commit()
+
+        for table, geography, builder, index_columns, revision in DERIVED_OUTPUTS:
+            source_key = f"derived:{table}"
+            file_path, _ = source_for_geography(geography)
+            if file_path is None:
+                continue
+
+            version = derived_version(dataset_version(file_path), revision)
+            if not force and known_versions.get(source_key) == version:
+                results[source_key] = 'atual'
+                continue
+
+            try:
+                frame, _ = builder(geography)
+                # Datas gravadas no mesmo formato ISO dos CSVs
+                frame = frame.assign(**{
+                    col: frame[col].dt.strftime('%Y-%m-%d')
+                    for col in frame.columns if pd.api.types.is_datetime64_any_dtype(frame[col])
+                })
+                conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+                frame.to_sql(table, conn, index=False, chunksize=INGEST_CHUNK_ROWS)
+                index_name = f"idx_{table}_{'_'.join(index_columns)}"
+                column_list = ', '.join(f'"{col}"' for col in index_columns)
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table}" ({column_list})')
+                conn.execute('''
+                    INSERT OR REPLACE INTO _ingest_log (source_file, table_name, version, row_count, ingested_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (source_key, table, version, len(frame), datetime.now().isoformat()))
+                conn.commit()
+                results[source_key] = len(frame)
+                print(f"[OK] Tabela derivada {table} gravada: {len(frame)} registros")
+            except Exception as e:
+                conn.rollback()
+                results[source_key] = f"erro: {e}"
+                print(f"[ERRO] Erro ao gravar a tabela derivada {table}: {e}")
+
+        return results
+
+    def _fit_clusters(self):
+        """Ajusta os modelos de agrupamento das curvas para a versão carregada (as páginas só os leem)"""
+        results = {}
+        store = get_cluster_store()
+        for geography in CLUSTER_GEOGRAPHIES:
+            source_key = f"clusters:{geography}"
+            try:
+                if store.get(geography) is not None:
+                    results[source_key] = 'atual'
+                    continue
+                model = store.fit(geography)
+                if model is not None:
+                    results[source_key] = len(model.keys)
+            except Exception as e:
+                results[source_key] = f"erro: {e}"
+                print(f"[ERRO] Erro ao ajustar clusters {geography}: {e}")
+        return results
+
+    def _drop_relation(self, conn, name):
+        """Remove a tabela ou view com o nome dado (um alias pode virar tabela e vice-versa)"""
+        row = conn.execute('SELECT type FROM sqlite_master WHERE name = ?', (name,)).fetchone()
+        if row is not None:
+            conn.execute(f'DROP {row[0].upper()} "{name}"')
+
+    def _create_alias_view(self, conn, alias, file_path, version):
+        """View com o nome da tabela do alias apontando para a tabela do arquivo canônico"""
+        table = table_name_for(alias)
+        self._drop_relation(conn, table)
+        conn.execute(f'CREATE VIEW "{table}" AS SELECT * FROM "{table_name_for(file_path)}"')
+        row_count = conn.execute(
+            'SELECT row_count FROM _ingest_log WHERE source_file = ?', (file_path,)
+        ).fetchone()
+        conn.execute('''
+            INSERT OR REPLACE INTO _ingest_log (source_file, table_name, version, row_count, ingested_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (alias, table, version, row_count[0] if row_count else None, datetime.now().isoformat()))
+        conn.commit()
+
+    def _ingest_file(self, conn, file_path, full_path, version):
+        """Recria a tabela de um CSV em blocos e aplica os índices"""
+        table = table_name_for(file_path)
+        with open_dataset(full_path) as stream:
+            header = pd.read_csv(stream, nrows=0)
+        dtypes = {col: 'string' for col in header.columns if col in TEXT_COLUMNS}
+
+        row_count = 0
+        self._drop_relation(conn, table)
+        with open_dataset(full_path) as stream:
+            for chunk in pd.read_csv(stream, dtype=dtypes, chunksize=INGEST_CHUNK_ROWS):
+                chunk.to_sql(table, conn, if_exists='append', index=False)
+                row_count += len(chunk)
+
+        for columns in INDEX_CANDIDATES:
+            if all(col in header.columns for col in columns):
+                index_name = f"idx_{table}_{'_'.join(columns)}".lower()
+                column_list = ', '.join(f'"{col}"' for col in columns)
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table}" ({column_list})')
+
+        conn.execute('''
+            INSERT OR REPLACE INTO _ingest_log (source_file, table_name, version, row_count, ingested_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (file_path, table, version, row_count, datetime.now().isoformat()))
+        conn.commit()
+        conn.execute('ANALYZE')
+        return row_count
+
+    def list_tables(self):
+        """Lista tabelas carregadas com origem, linhas e colunas"""
+        conn = self._connect()
+        try:
+            rows = conn.execute('''
+                SELECT source_file, table_name, row_count, ingested_at
+                FROM _ingest_log ORDER BY table_name
+            ''').fetchall()
+            tables = []
+            for source_file, table, row_count, ingested_at in rows:
+                columns = [info[1] for info in conn.execute(f'PRAGMA table_info("{table}")')]
+                tables.append({
+                    'table': table,
+                    'source_file': source_file,
+                    'name': CSV_CATALOG.get(source_file, {}).get('name', source_file),
+                    'rows': row_count,
+                    'columns': columns,
+                    'ingested_at': ingested_at
+                })
+            return tables
+        finally:
+            conn.close()
+
+    def _readonly_connection(self, deadline):
+        """Conexão somente leitura com autorizador e interrupção por tempo"""
+        conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True, check_same_thread=False)
+        conn.execute('PRAGMA query_only = ON')
+
+        def authorizer(action, arg1, arg2, db_name, trigger):
+            if action in READONLY_ACTIONS:
+                return sqlite3.SQLITE_OK
+            return sqlite3.SQLITE_DENY
+
+        conn.set_authorizer(authorizer)
+        # Retornar valor não nulo aborta a consulta em andamento
+        conn.set_progress_handler(lambda: 1 if time.perf_counter() > deadline else 0, 10_000)
+        return conn
+
+    def run_readonly_query(self, sql, params=None, max_rows=None, timeout=None):
+        """Executa uma consulta SELECT isolada, limitada em tempo e em número de linhas"""
+        max_rows = max_rows or Config.SQL_MAX_ROWS
+        timeout = timeout or Config.SQL_QUERY_TIMEOUT
+        result = {'data': pd.DataFrame(), 'truncated': False, 'elapsed_ms': 0.0, 'error': None}
+
+        started = time.perf_counter()
+        conn = None
+        try:
+            conn = self._readonly_connection(started + timeout)
+            cursor = conn.execute(sql, params or ())
+            if cursor.description is None:
+                result['error'] = "Apenas consultas SELECT são permitidas"
+                return result
+
+            rows = cursor.fetchmany(max_rows + 1)
+            columns = [col[0] for col in cursor.description]
+            result['truncated'] = len(rows) > max_rows
+            result['data'] = pd.DataFrame(rows[:max_rows], columns=columns)
+        except sqlite3.OperationalError as e:
+            if 'interrupted' in str(e):
+                result['error'] = f"Consulta interrompida após {timeout:.1f}s"
+            else:
+                result['error'] = str(e)
+        except (sqlite3.DatabaseError, sqlite3.Warning, ValueError) as e:
+            result['error'] = str(e)
+        finally:
+            if conn is not None:
+                conn.close()
+            result['elapsed_ms'] = (time.perf_counter() - started) * 1000
+
+        return result
+
+
+# Funções de cache para Streamlit (se disponível)
+if STREAMLIT_AVAILABLE:
+    @st.cache_resource
+    def get_sql_engine():
+        return CsvSqlEngine()
+else:
+    def get_sql_engine():
+        return CsvSqlEngine()
+
+
+# Carga completa quando chamado diretamente
+if __name__ == "__main__":
+    engine = CsvSqlEngine()
+    print("CARREGANDO CATÁLOGO NO SQL...")
+    print("=" * 50)
+    engine.ingest_catalog()
+    for table in engine.list_tables():
+        print(f"  - {table['table']}: {table['rows']} registros")
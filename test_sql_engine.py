@@ -0,0 +1,51 @@
+"""
+Teste de regressão: ingestão de condados com linhas sem fips (New York City, 'Unknown')
+"""
+
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from epi_metrics import DERIVED_TABLES
+from sql_engine import CsvSqlEngine
+from waves import WAVE_TABLES
+
+COUNTIES = [
+    ('Los Angeles', 'California', '06037'),
+    ('Cook', 'Illinois', '17031'),
+    ('New York City', 'New York', ''),
+    ('Unknown', 'Indiana', ''),
+    ('Bristol Bay plus Lake and Peninsula', 'Alaska', ''),
+]
+
+
+def _county_frame(days=60):
+    """Série acumulada com uma onda por condado"""
+    dates = pd.date_range('2020-03-01', periods=days)
+    daily = np.round(100 * np.exp(-((np.arange(days) - days / 2) ** 2) / 100)) + 1
+    rows = []
+    for scale, (county, state, fips) in enumerate(COUNTIES, start=1):
+        cases = np.cumsum(daily * scale).astype(int)
+        for date, total in zip(dates, cases):
+            rows.append((date.strftime('%Y-%m-%d'), county, state, fips, total, total // 50))
+    return pd.DataFrame(rows, columns=['date', 'county', 'state', 'fips', 'cases', 'deaths'])
+
+
+def test_county_derived_tables_keep_rows_without_fips(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _county_frame().to_csv(tmp_path / 'us-counties.csv', index=False)
+
+    engine = CsvSqlEngine(db_path=str(tmp_path / 'analytics.db'), base_path=str(tmp_path))
+    results = engine.ingest_catalog()
+
+    for table in (DERIVED_TABLES['county'], WAVE_TABLES['county']):
+        assert isinstance(results[f"derived:{table}"], int), results[f"derived:{table}"]
+
+    conn = sqlite3.connect(tmp_path / 'analytics.db')
+    try:
+        for table in (DERIVED_TABLES['county'], WAVE_TABLES['county']):
+            keys = {row[0] for row in conn.execute(f'SELECT DISTINCT key FROM "{table}"')}
+            assert {'06037', '17031', 'New York|New York City', 'Indiana|Unknown'} <= keys
+    finally:
+        conn.close()
@@ -0,0 +1,178 @@
+"""
+Segmentação das curvas de média móvel em ondas (início, pico, fim, altura e área)
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from date_utils import EPOCH
+from epi_metrics import derived_version, read_derived_table, stored_derived_version
+from forecasting import get_forecast_engine
+from series_matrix import rolling_mean
+
+# Importações condicionais para evitar erros quando executado diretamente
+try:
+    import streamlit as st
+    STREAMLIT_AVAILABLE = True
+except ImportError:
+    STREAMLIT_AVAILABLE = False
+
+# Suavização extra sobre a média de 7 dias antes de procurar picos
+WAVE_SMOOTHING_DAYS = 14
+# Um pico é o máximo da vizinhança de ±PEAK_HALF_WINDOW dias
+PEAK_HALF_WINDOW = 35
+# Picos abaixo desta fração do máximo da geografia são ignorados
+MIN_PEAK_RATIO = 0.1
+
+WAVE_TABLES = {
+    'state': 'waves_state',
+    'county': 'waves_county',
+}
+WAVE_REVISION = 1
+
+
+def find_peaks_matrix(signal, half_window=PEAK_HALF_WINDOW, min_ratio=MIN_PEAK_RATIO):
+    """Máscara dos picos de todas as linhas (máximo local na janela e altura mínima)"""
+    padded = np.pad(signal, ((0, 0), (half_window, half_window)), constant_values=-np.inf)
+    window_max = sliding_window_view(padded, 2 * half_window + 1, axis=1).max(axis=-1)
+
+    previous = np.hstack([np.full((len(signal), 1), -np.inf), signal[:, :-1]])
+    row_max = signal.max(axis=1, keepdims=True)
+    # Em platôs só o primeiro dia conta como pico; o primeiro dia da série nunca é pico
+    peaks = (signal >= window_max) & (signal > previous) & (signal > 0) & (signal >= min_ratio * row_max)
+    peaks[:, 0] = False
+    return peaks
+
+
+def segment_waves(avg_matrix):
+    """Tabela de ondas: uma linha por geografia e onda, calculada sem laço por geografia
+
+    Os limites entre ondas são os vales (mínimos) entre picos consecutivos; a
+    primeira onda começa no último mínimo antes do primeiro pico e a última
+    termina no primeiro mínimo depois do último pico.
+    """
+    avg = np.maximum(avg_matrix.values, 0.0)
+    n_keys, n_days = avg.shape
+    signal = rolling_mean(avg, WAVE_SMOOTHING_DAYS)
+
+    peak_rows, peak_days = np.nonzero(find_peaks_matrix(signal))
+    if len(peak_rows) == 0:
+        return pd.DataFrame()
+
+    # Segmentos [início da linha, pico1), [pico1, pico2), ..., [último pico, fim da linha)
+    flat = signal.reshape(-1)
+    peak_flat = peak_rows * n_days + peak_days
+    starts = np.sort(np.concatenate([np.unique(peak_rows) * n_days, peak_flat]))
+    next_start = np.append(starts[1:], -1)
+    row_end = (starts // n_days + 1) * n_days
+    is_tail = next_start // n_days != starts // n_days
+    ends = np.where(is_tail, row_end, next_start)
+
+    # Posição do mínimo de cada segmento (primeira e última ocorrência) via reduceat
+    lengths = ends - starts
+    positions = _ranges(starts, lengths)
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    seg_min = np.minimum.reduceat(flat[positions], offsets)
+    is_min = flat[positions] == np.repeat(seg_min, lengths)
+    first_min = np.minimum.reduceat(np.where(is_min, positions, len(flat)), offsets)
+    last_min = np.maximum.reduceat(np.where(is_min, positions, -1), offsets)
+    trough = np.where(is_tail, first_min, last_min)
+
+    # Para cada pico: início = vale do segmento anterior, fim = vale do próprio segmento
+    peak_segments = np.flatnonzero(np.isin(starts, peak_flat))
+    wave_start = trough[peak_segments - 1]
+    wave_end = trough[peak_segments]
+    wave_peak = starts[peak_segments]
+
+    rows = wave_peak // n_days
+    csum = np.concatenate([[0.0], np.cumsum(avg.reshape(-1))])
+    area = csum[wave_end + 1] - csum[wave_start]
+    wave_number = np.arange(len(rows)) - np.searchsorted(rows, rows) + 1
+
+    start_day = wave_start - rows * n_days
+    peak_day = wave_peak - rows * n_days
+    end_day = wave_end - rows * n_days
+    keys = avg_matrix.keys[rows]
+
+    return pd.DataFrame({
+        'key': keys,
+        'label': [avg_matrix.labels.get(key, key) for key in keys],
+        'wave': wave_number,
+        'start_date': EPOCH + pd.to_timedelta(avg_matrix.start_offset + start_day, unit='D'),
+        'peak_date': EPOCH + pd.to_timedelta(avg_matrix.start_offset + peak_day, unit='D'),
+        'end_date': EPOCH + pd.to_timedelta(avg_matrix.start_offset + end_day, unit='D'),
+        'duration_days': end_day - start_day + 1,
+        'peak_height': avg[rows, peak_day],
+        'area': area
+    })
+
+
+def _ranges(starts, lengths):
+    """Concatena arange(start, start + length) para todos os segmentos (sem laço)"""
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return np.arange(lengths.sum()) + offsets
+
+
+def wave_table(geography='state', metric='cases'):
+    """Ondas de todas as geografias do nível e a versão do dataset de origem"""
+    avg_matrix, version = get_forecast_engine().daily_average(geography, metric)
+    if avg_matrix is None:
+        return pd.DataFrame(), None
+
+    table = segment_waves(avg_matrix)
+    if geography == 'county' and not table.empty:
+        table['key'] = table['key'].astype(str)
+    return table, version
+
+
+class WaveStore:
+    """Tabela de ondas gravada na ingestão, com cálculo em memória de reserva"""
+
+    def __init__(self):
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def table(self, geography='state'):
+        _, version = get_forecast_engine().daily_average(geography, 'cases')
+        if version is None:
+            return pd.DataFrame()
+
+        with self._lock:
+            cached = self._tables.get(geography)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+
+            name = WAVE_TABLES[geography]
+            if stored_derived_version(name) == derived_version(version, WAVE_REVISION):
+                table = read_derived_table(name)
+                for column in ['start_date', 'peak_date', 'end_date']:
+                    table[column] = pd.to_datetime(table[column])
+            else:
+                table, _ = wave_table(geography)
+            self._tables[geography] = (version, table)
+            return table
+
+    def compare_wave(self, wave, keys, geography='state'):
+        """A onda N de cada geografia pedida (geografias sem essa onda ficam de fora)"""
+        table = self.table(geography)
+        if table.empty:
+            return table
+        return table[(table['wave'] == wave) & table['key'].isin(list(keys))]
+
+
+# Funções de cache para Streamlit (se disponível)
+if STREAMLIT_AVAILABLE:
+    @st.cache_resource
+    def get_wave_store():
+        return WaveStore()
+else:
+    _wave_store = None
+
+    def get_wave_store():
+        global _wave_store
+        if _wave_store is None:
+            _wave_store = WaveStore()
+        return _wave_store
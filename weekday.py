@@ -0,0 +1,64 @@
+"""
+Remoção do efeito do dia da semana nas contagens diárias (regressão em lote sobre a matriz)
+"""
+
+import numpy as np
+
+from date_utils import EPOCH
+
+# Semanas usadas para estimar o padrão de notificação de cada dia da semana
+WEEKDAY_WINDOW_WEEKS = 8
+# Limites do fator multiplicativo (evita divisões extremas em dias sem notificação)
+MIN_WEEKDAY_FACTOR = 0.05
+MAX_WEEKDAY_FACTOR = 7.0
+
+
+def weekdays_for(start_offset, n_days):
+    """Dia da semana (0 = segunda) de cada coluna da matriz"""
+    return (EPOCH.weekday() + start_offset + np.arange(n_days)) % 7
+
+
+def centered_trend(daily):
+    """Média móvel centrada de 7 dias (tendência sem o ciclo semanal)"""
+    n_days = daily.shape[1]
+    padded = np.pad(daily, ((0, 0), (3, 3)), mode='edge')
+    csum = np.cumsum(np.pad(padded, ((0, 0), (1, 0))), axis=1)
+    return (csum[:, 7:7 + n_days] - csum[:, :n_days]) / 7
+
+
+def weekday_factors(daily, start_offset, window_weeks=WEEKDAY_WINDOW_WEEKS):
+    """Fator multiplicativo de cada dia/geografia estimado nas últimas `window_weeks` semanas
+
+    Equivale a regredir log(1 + y) - log(1 + tendência) em variáveis indicadoras
+    do dia da semana, em janela móvel: o coeficiente de cada dia é a média dos
+    resíduos daquele dia na janela. Os sete coeficientes são centrados (média
+    zero), então o fator preserva o nível da série.
+    """
+    n_keys, n_days = daily.shape
+    residual = np.log1p(np.maximum(daily, 0.0)) - np.log1p(np.maximum(centered_trend(daily), 0.0))
+    weekdays = weekdays_for(start_offset, n_days)
+    window = window_weeks * 7
+
+    # Um passo por dia da semana, cada um vetorizado sobre a matriz inteira
+    total = np.zeros_like(residual)
+    own = np.zeros_like(residual)
+    for weekday in range(7):
+        is_day = weekdays == weekday
+        sums = np.cumsum(np.where(is_day, residual, 0.0), axis=1)
+        counts = np.cumsum(is_day).astype(float)
+        sums[:, window:] -= sums[:, :-window].copy()
+        counts[window:] -= counts[:-window].copy()
+
+        coefficient = sums / np.maximum(counts, 1)
+        total += coefficient
+        own[:, is_day] = coefficient[:, is_day]
+
+    effect = own - total / 7
+    return np.clip(np.exp(effect), MIN_WEEKDAY_FACTOR, MAX_WEEKDAY_FACTOR)
+
+
+def adjust_weekday_effect(daily, start_offset, window_weeks=WEEKDAY_WINDOW_WEEKS):
+    """Contagens diárias sem o efeito do dia da semana, e os fatores usados"""
+    factors = weekday_factors(daily, start_offset, window_weeks)
+    adjusted = np.maximum((1 + np.maximum(daily, 0.0)) / factors - 1, 0.0)
+    return adjusted, factors
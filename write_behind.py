@@ -0,0 +1,172 @@
+"""
+Fila de escrita em segundo plano (write-behind) para o SQLite: commits agrupados por lote
+"""
+
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+
+from connection_pool import open_connection
+
+# Importações condicionais para evitar erros quando executado diretamente
+try:
+    import streamlit as st
+    STREAMLIT_AVAILABLE = True
+except ImportError:
+    STREAMLIT_AVAILABLE = False
+
+try:
+    from config import Config
+except ImportError:
+    class FallbackConfig:
+        WRITE_BEHIND_BATCH = 200
+        WRITE_BEHIND_DELAY_MS = 5
+    Config = FallbackConfig()
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """Uma thread escritora por banco: agrupa os INSERTs enfileirados em uma transação
+
+    O lote fecha ao atingir batch_size comandos ou max_delay_ms depois do
+    primeiro comando do lote, o que vier antes. Os parâmetros devem ser
+    montados na thread que chama enqueue() (ex.: session_id do Streamlit).
+    """
+
+    def __init__(self, db_path, batch_size=None, max_delay_ms=None):
+        self.db_path = db_path
+        self.batch_size = batch_size or Config.WRITE_BEHIND_BATCH
+        self.max_delay = (max_delay_ms if max_delay_ms is not None else Config.WRITE_BEHIND_DELAY_MS) / 1000
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.enqueued = 0
+        self.written = 0
+        # Comandos gravados em commits de lote (sem o fallback um a um), base de avg_batch
+        self.batched = 0
+        self.batches = 0
+        self.errors = 0
+        self.largest_batch = 0
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name=f"write-behind:{db_path}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, sql, params=()):
+        """Agenda o comando e retorna imediatamente (sem esperar o commit)"""
+        if self._closed:
+            raise RuntimeError("Fila de escrita já encerrada")
+        with self._stats_lock:
+            self.enqueued += 1
+        self._queue.put((sql, tuple(params)))
+
+    def pending(self):
+        with self._stats_lock:
+            return self.enqueued - self.written - self.errors
+
+    def flush(self, timeout=5.0):
+        """Espera os comandos já enfileirados serem gravados (leituras que precisam deles)"""
+        deadline = time.monotonic() + timeout
+        while self.pending() > 0 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        return self.pending() == 0
+
+    def close(self, timeout=5.0):
+        """Grava o que falta e encerra a thread (registrado no atexit)"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def get_stats(self):
+        with self._stats_lock:
+            return {
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'batches': self.batches,
+                'errors': self.errors,
+                'largest_batch': self.largest_batch,
+                'avg_batch': self.batched / self.batches if self.batches else 0.0
+            }
+
+    def _next_batch(self):
+        """Bloqueia até o primeiro comando e junta os seguintes até o tamanho ou o prazo"""
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        # Mesmos pragmas do pool de leitura (WAL, synchronous=NORMAL, mmap, cache)
+        conn = open_connection(self.db_path, timeout=30)
+        try:
+            stop = False
+            while not stop:
+                batch, stop = self._next_batch()
+                # Na parada, o que ainda estiver na fila também é gravado
+                if stop:
+                    while True:
+                        try:
+                            item = self._queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if item is not _STOP:
+                            batch.append(item)
+                if batch:
+                    self._write(conn, batch)
+        finally:
+            conn.close()
+
+    def _write(self, conn, batch):
+        try:
+            with conn:
+                for sql, params in batch:
+                    conn.execute(sql, params)
+            with self._stats_lock:
+                self.written += len(batch)
+                self.batched += len(batch)
+                self.batches += 1
+                self.largest_batch = max(self.largest_batch, len(batch))
+        except sqlite3.Error as e:
+            # Um comando inválido não pode derrubar o lote inteiro: tenta um a um
+            print(f"[ERRO] Lote de escrita falhou ({e}); gravando comandos individualmente")
+            for sql, params in batch:
+                try:
+                    with conn:
+                        conn.execute(sql, params)
+                    with self._stats_lock:
+                        self.written += 1
+                except sqlite3.Error as item_error:
+                    with self._stats_lock:
+                        self.errors += 1
+                    print(f"[ERRO] Comando descartado pela fila de escrita: {item_error}")
+
+
+# Funções de cache para Streamlit (se disponível)
+if STREAMLIT_AVAILABLE:
+    @st.cache_resource
+    def get_write_queue(db_path):
+        return WriteBehindQueue(db_path)
+else:
+    _write_queues = {}
+
+    def get_write_queue(db_path):
+        if db_path not in _write_queues:
+            _write_queues[db_path] = WriteBehindQueue(db_path)
+        return _write_queues[db_path]